@@ -1,228 +1,501 @@
 import streamlit as st
 from datetime import datetime, date
-import vertexai
-from vertexai.generative_models import GenerativeModel
-from google.oauth2 import service_account
-from google.api_core.exceptions import NotFound, Forbidden, ServiceUnavailable, InvalidArgument
+from llm import ModelRouter, VertexBackend, StubBackend, AllModelsUnavailable
+from doc_cache import BytesCache
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from io import BytesIO
-from db import load_complex_data, load_full_config
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+import numpy as np
+import hashlib
+from db import load_full_config, load_cost_summary, _setting, memo_fingerprint, get_cached_memo, store_memo
 
 # ==============================================================================
 # 1. HARD MATH ENGINE
 # ==============================================================================
+# CostAnalysis reads the case once and computes every metric for both parties
+# in a single pass over each list. The calculate_* / get_total_costs /
+# check_sealed_offers functions are thin views over it; pass `analysis` to
+# reuse one instead of building a new one per call.
 
-def calculate_doc_prod_score(role):
+DOC_PROD_PHASE = "Phase 3: Document Production"
+
+def _amount(entry):
+    try:
+        return float(entry.get('amount', 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+class CumulativeCostIndex:
+    """One party's costs sorted by date with running totals.
+
+    Dates are parsed once; "costs after date X" is then a bisect plus a
+    subtraction instead of a scan over the ledger.
+    """
+    def __init__(self, log):
+        points = []
+        for entry in log:
+            try:
+                points.append((datetime.strptime(entry['date'], "%Y-%m-%d").date().toordinal(), float(entry['amount'])))
+            except: continue
+        points.sort()
+        self.days = array('l', (d for d, _ in points))
+        self.cumulative = array('d', accumulate((a for _, a in points), initial=0.0))
+
+    def total(self):
+        return self.cumulative[-1]
+
+    def total_after(self, cutoff_date):
+        return self.cumulative[-1] - self.cumulative[bisect_right(self.days, cutoff_date.toordinal())]
+
+class CostAnalysis:
+    def __init__(self, config, aggregates=None):
+        data = config.get('complex_data', {})
+        settings = config.get('meta', {}).get('cost_settings', {})
+        self.doc_prod_threshold = settings.get('doc_prod_threshold', 75.0)
+        self.delay_penalty_rate = settings.get('delay_penalty_rate', 0.5)
+
+        costs = data.get('costs', {})
+        self.cost_logs = {k[:-len("_log")]: v for k, v in costs.items() if k.endswith("_log")}
+        self.sealed_offers = costs.get('sealed_offers', [])
+        self._cost_indexes = {}
+
+        if aggregates is not None:
+            # Running totals maintained on write (db section 8): no ledger scan
+            labels = aggregates.get('labels', {})
+            ledgers = {k[:-len("_log")]: v for k, v in aggregates.get('costs', {}).items() if k.endswith("_log")}
+            self.totals = {role: v.get('total', 0.0) for role, v in ledgers.items()}
+            self.phase_totals = {role: {labels.get(k, k): amt for k, amt in v.get('by_phase', {}).items()} for role, v in ledgers.items()}
+            doc_prod_counts = {role: (c.get('total', 0), c.get('denied', 0)) for role, c in aggregates.get('doc_prod', {}).items()}
+        else:
+            self.totals = {role: sum(_amount(c) for c in log) for role, log in self.cost_logs.items()}
+            self.phase_totals = {}
+            for role, log in self.cost_logs.items():
+                by_phase = self.phase_totals.setdefault(role, {})
+                for c in log:
+                    by_phase[c.get('phase')] = by_phase.get(c.get('phase'), 0.0) + _amount(c)
+            doc_prod_counts = {role: (len(reqs), sum(1 for r in reqs if r.get('status') == 'Denied'))
+                               for role, reqs in data.get('doc_prod', {}).items()}
+
+        # Doc production: rejection ratio per requesting party
+        self.doc_prod = {}
+        for role, (total, denied) in doc_prod_counts.items():
+            if not total: continue
+            ratio = (denied / total) * 100
+            self.doc_prod[role] = (ratio, ratio > self.doc_prod_threshold)
+
+        # Delays: only non-consensual (or denied) ones are penalised
+        self.delays = {}
+        for d in data.get('delays', []):
+            if d.get('status') == 'Denied' or not d.get('is_consensual', False):
+                days = d.get('days', 0)
+                if days > 0:
+                    entry = self.delays.setdefault(d.get('requestor'), [0.0, []])
+                    entry[0] += days * self.delay_penalty_rate
+                    entry[1].append(f"{d.get('event', 'Event')} ({days} days late - Non-Consensual)")
+
+        # Interim applications lost by each filing party, and the opponent's
+        # costs of resisting them as recorded on the application (`costs`).
+        # Applications without a recorded figure are listed as unquantified
+        # and move no money.
+        self.failed_apps = {}
+        self.failed_app_costs = {}
+        self.unquantified_apps = {}
+        for app in data.get('applications', []):
+            if app.get('outcome') == 'Denied':
+                filer = app.get('filing_party')
+                self.failed_apps.setdefault(filer, []).append(f"{app.get('type')} (Denied on {app.get('date')})")
+                if app.get('costs') is None:
+                    self.unquantified_apps.setdefault(filer, []).append(app.get('type') or 'Application')
+                else:
+                    self.failed_app_costs[filer] = self.failed_app_costs.get(filer, 0.0) + _amount({'amount': app['costs']})
+
+    @classmethod
+    def from_case(cls):
+        return cls(load_full_config(), load_cost_summary())
+
+    def doc_prod_score(self, role):
+        """Rejection Rate. Metric: >75% Rejection = 100% Phase Penalty."""
+        return self.doc_prod.get(role, (0.0, False))
+
+    def delay_penalties(self, role):
+        """Penalties ONLY for Non-Consensual delays. Metric: 0.5% deduction per day."""
+        pct, log = self.delays.get(role, (0.0, []))
+        return pct, list(log)
+
+    def failed_applications(self, role):
+        """Failed applications by this party (Cost Shifting Risk)."""
+        return list(self.failed_apps.get(role, []))
+
+    def total_costs(self, role):
+        return self.totals.get(role, 0.0)
+
+    def cost_index(self, role):
+        if role not in self._cost_indexes:
+            self._cost_indexes[role] = CumulativeCostIndex(self.cost_logs.get(role, []))
+        return self._cost_indexes[role]
+
+    def reversal_amount(self, offerer_role, offer_date_str):
+        """Sums costs incurred by the REJECTOR after the offer date."""
+        # If Claimant made offer, Respondent rejected it (and vice versa)
+        rejecting_party = 'respondent' if offerer_role == 'claimant' else 'claimant'
+        cutoff_date = datetime.strptime(offer_date_str, "%Y-%m-%d").date()
+        return self.cost_index(rejecting_party).total_after(cutoff_date), rejecting_party
+
+    def sealed_offer_reversals(self, final_award_val):
+        reversal_triggers = []
+        for offer in self.sealed_offers:
+            try:
+                offer_val = float(offer.get('amount', 0.0))
+                # Rule: If Award < Offer, the Offerer is the "effective winner"
+                if final_award_val < offer_val:
+                    reversal_amt, payer = self.reversal_amount(offer['offerer'], offer['date'])
+                    reversal_triggers.append({
+                        "offerer": offer['offerer'],
+                        "payer": payer,
+                        "offer_date": offer['date'],
+                        "offer_amount": offer_val,
+                        "reversal_sum": reversal_amt
+                    })
+            except: pass
+        return reversal_triggers
+
+    def recoverable_costs(self, role):
+        """Own costs a winning party can recover: less delay deductions, less Phase 3 if doc production was flagged."""
+        total = self.total_costs(role)
+        if self.doc_prod_score(role)[1]:
+            total -= self.phase_totals.get(role, {}).get(DOC_PROD_PHASE, 0.0)
+        total *= 1 - self.delay_penalties(role)[0] / 100
+        return max(total, 0.0)
+
+    def failed_application_costs(self, role):
+        """Opponent's costs of the applications `role` filed and lost."""
+        return self.failed_app_costs.get(role, 0.0)
+
+    def net_cost_order(self, final_award_val):
+        """The net cost order for an award, computed step by step.
+
+        Costs follow the event (award > 0: claimant succeeded). The successful
+        party recovers its costs less the Phase 3 disallowance and the delay
+        deduction, less the opponent's costs of applications it filed and lost;
+        every sealed offer the award falls below then shifts its reversal sum.
+        `net_order` is signed from the claimant's side like award_sweep.
+        """
+        winner = 'claimant' if final_award_val > 0 else 'respondent'
+        loser = 'respondent' if winner == 'claimant' else 'claimant'
+        sign = 1.0 if winner == 'claimant' else -1.0
+        claimed = self.total_costs(winner)
+        flagged = self.doc_prod_score(winner)[1]
+        disallowed = self.phase_totals.get(winner, {}).get(DOC_PROD_PHASE, 0.0) if flagged else 0.0
+        delay_pct = self.delay_penalties(winner)[0]
+        recoverable = self.recoverable_costs(winner)
+        app_costs = self.failed_application_costs(winner)
+        reversals = self.sealed_offer_reversals(final_award_val)
+
+        steps = [(f"Costs claimed by {winner.title()}", claimed)]
+        if disallowed: steps.append(("Disallowed: document production phase (excessive rejection rate)", -disallowed))
+        if delay_pct: steps.append((f"Delay deduction ({delay_pct:g}%)", recoverable - (claimed - disallowed)))
+        if app_costs: steps.append((f"{loser.title()}'s costs of {winner.title()}'s failed applications", -app_costs))
+        for app_type in self.unquantified_apps.get(winner, []):
+            steps.append((f"{loser.title()}'s costs of {winner.title()}'s failed {app_type} (unquantified, no adjustment)", 0.0))
+        net = sign * (recoverable - app_costs)
+        for r in reversals:
+            shift = r['reversal_sum'] if r['offerer'] == 'claimant' else -r['reversal_sum']
+            steps.append((f"Sealed offer reversal: {r['payer'].title()}'s costs after {r['offer_date']}", sign * shift))
+            net += shift
+        net = round(net, 2)
+        return {
+            "award": final_award_val, "winner": winner, "loser": loser, "claimed": claimed,
+            "doc_prod_disallowed": disallowed, "delay_pct": delay_pct, "recoverable": recoverable,
+            "failed_application_costs": app_costs, "reversals": reversals, "steps": steps, "net_order": net,
+            "payer": 'respondent' if net > 0 else 'claimant', "payee": 'claimant' if net > 0 else 'respondent',
+            "amount": abs(net)
+        }
+
+    def award_sweep(self, awards):
+        """Evaluates the cost outcome for many candidate award values at once.
+
+        Net cost order is signed from the claimant's side (positive: respondent
+        pays claimant): costs follow the event (award > 0 means claimant
+        succeeded), less failed-application costs (see net_cost_order), then
+        every sealed offer the award falls below shifts its reversal sum from
+        the rejecting party to the offerer.
+        """
+        awards = np.asarray(awards, dtype=float)
+        offers = []
+        for o in self.sealed_offers:
+            try:
+                offers.append((float(o.get('amount', 0.0)), o['offerer'], datetime.strptime(o['date'], "%Y-%m-%d").date().toordinal()))
+            except: continue
+        base = np.where(awards > 0, self.recoverable_costs('claimant') - self.failed_application_costs('claimant'),
+                        self.failed_application_costs('respondent') - self.recoverable_costs('respondent'))
+        if not offers:
+            return {"award": awards, "base_order": base, "reversal_net": np.zeros_like(awards),
+                    "net_order": base, "triggered": np.zeros((len(awards), 0), dtype=bool), "offers": []}
+
+        offer_vals = np.array([v for v, _, _ in offers])
+        direction = np.array([1.0 if who == 'claimant' else -1.0 for _, who, _ in offers])
+        reversal = np.empty(len(offers))
+        for payer in ('claimant', 'respondent'):
+            # The rejecting party is the one who did not make the offer
+            mask = np.array([(who == 'claimant') == (payer == 'respondent') for _, who, _ in offers])
+            if mask.any():
+                idx = self.cost_index(payer)
+                days, cumulative = np.asarray(idx.days), np.asarray(idx.cumulative)
+                cutoffs = np.array([d for (_, _, d), m in zip(offers, mask) if m])
+                reversal[mask] = cumulative[-1] - cumulative[np.searchsorted(days, cutoffs, side='right')]
+
+        triggered = awards[:, None] < offer_vals[None, :]
+        reversal_net = triggered @ (reversal * direction)
+        return {"award": awards, "base_order": base, "reversal_net": reversal_net, "net_order": base + reversal_net,
+                "triggered": triggered, "offers": [{"offerer": who, "amount": v, "reversal_sum": float(r)} for (v, who, _), r in zip(offers, reversal)]}
+
+def calculate_doc_prod_score(role, analysis=None):
     """Calculates Rejection Rate. Metric: >75% Rejection = 100% Phase Penalty."""
-    data = load_complex_data()
-    meta = load_full_config().get('meta', {})
-    threshold = meta.get('cost_settings', {}).get('doc_prod_threshold', 75.0)
-    
-    requests = data.get('doc_prod', {}).get(role, [])
-    if not requests: return 0.0, False
-    
-    total = len(requests)
-    rejected = sum(1 for r in requests if r.get('status') == 'Denied')
-    
-    ratio = (rejected / total) * 100 if total > 0 else 0.0
-    penalty_triggered = ratio > threshold
-    
-    return ratio, penalty_triggered
+    return (analysis or CostAnalysis.from_case()).doc_prod_score(role)
 
-def calculate_delay_penalties(role):
+def calculate_delay_penalties(role, analysis=None):
     """
     Calculates penalties ONLY for Non-Consensual delays.
     Metric: 0.5% deduction per day.
     """
-    data = load_complex_data()
-    meta = load_full_config().get('meta', {})
-    rate = meta.get('cost_settings', {}).get('delay_penalty_rate', 0.5)
-    
-    delays_log = data.get('delays', [])
-    total_deduction_percent = 0.0
-    detailed_log = []
-
-    for d in delays_log:
-        if d.get('requestor') == role:
-            # Check if it was consensual (no penalty) or denied/late (penalty)
-            is_consensual = d.get('is_consensual', False)
-            status = d.get('status')
-            
-            # Logic: If denied OR specifically marked non-consensual
-            if status == 'Denied' or not is_consensual:
-                days = d.get('days', 0)
-                if days > 0:
-                    penalty = days * rate
-                    total_deduction_percent += penalty
-                    detailed_log.append(f"{d.get('event', 'Event')} ({days} days late - Non-Consensual)")
-
-    return total_deduction_percent, detailed_log
+    return (analysis or CostAnalysis.from_case()).delay_penalties(role)
 
-def analyze_interim_applications(role):
+def analyze_interim_applications(role, analysis=None):
     """Identifies failed applications by this party (Cost Shifting Risk)."""
-    data = load_complex_data()
-    apps = data.get('applications', [])
-    failed_apps = []
-    
-    for app in apps:
-        if app.get('filing_party') == role and app.get('outcome') == 'Denied':
-            failed_apps.append(f"{app.get('type')} (Denied on {app.get('date')})")
-            
-    return failed_apps
+    return (analysis or CostAnalysis.from_case()).failed_applications(role)
 
-def calculate_reversal_amount(offerer_role, offer_date_str):
+def calculate_reversal_amount(offerer_role, offer_date_str, analysis=None):
     """Sums costs incurred by the REJECTOR after the offer date."""
-    data = load_complex_data()
-    costs = data.get('costs', {})
-    
-    # If Claimant made offer, Respondent rejected it (and vice versa)
-    rejecting_party = 'respondent' if offerer_role == 'claimant' else 'claimant'
-    target_log = costs.get(f"{rejecting_party}_log", [])
-    
-    cutoff_date = datetime.strptime(offer_date_str, "%Y-%m-%d").date()
-    reversal_sum = 0.0
-    
-    for entry in target_log:
-        try:
-            entry_date = datetime.strptime(entry['date'], "%Y-%m-%d").date()
-            if entry_date > cutoff_date:
-                reversal_sum += float(entry['amount'])
-        except: continue
-            
-    return reversal_sum, rejecting_party
-
-def get_total_costs(role):
-    data = load_complex_data()
-    costs = data.get('costs', {}).get(f"{role}_log", [])
-    return sum(float(c['amount']) for c in costs)
-
-def check_sealed_offers(final_award_val):
-    data = load_complex_data()
-    offers = data.get('costs', {}).get('sealed_offers', [])
-    reversal_triggers = []
-    
-    for offer in offers:
-        try:
-            offer_val = float(offer.get('amount', 0.0))
-            # Rule: If Award < Offer, the Offerer is the "effective winner"
-            if final_award_val < offer_val:
-                reversal_amt, payer = calculate_reversal_amount(offer['offerer'], offer['date'])
-                reversal_triggers.append({
-                    "offerer": offer['offerer'],
-                    "payer": payer,
-                    "offer_date": offer['date'],
-                    "offer_amount": offer_val,
-                    "reversal_sum": reversal_amt
-                })
-        except: pass
-            
-    return reversal_triggers
+    return (analysis or CostAnalysis.from_case()).reversal_amount(offerer_role, offer_date_str)
+
+def get_total_costs(role, analysis=None):
+    return (analysis or CostAnalysis.from_case()).total_costs(role)
+
+def check_sealed_offers(final_award_val, analysis=None):
+    return (analysis or CostAnalysis.from_case()).sealed_offer_reversals(final_award_val)
 
 # ==============================================================================
 # 2. AI DRAFTING
 # ==============================================================================
 
+@st.cache_resource
+def _service_account_credentials():
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_info(st.secrets["gcp_service_account"])
+
+# Client and model handles are built once per process; failing models are
+# skipped for a cool-down by the router's circuit breaker (see llm.py).
+@st.cache_resource
+def get_model_router(project_id, _credentials, models=None):
+    return ModelRouter(VertexBackend(project_id, _credentials), models=models)
+
+# LLM_BACKEND=stub swaps Vertex AI for llm.StubBackend (LLM_STUB_LATENCY
+# seconds, LLM_STUB_ERROR_RATE 0..1) so drafting works offline.
+@st.cache_resource
+def get_stub_router(latency, error_rate, models=None):
+    return ModelRouter(StubBackend(latency=latency, error_rate=error_rate), models=models)
+
+def _model_chain():
+    """LLM_MODELS (comma-separated) overrides the fallback chain; the figures are computed
+    in section 1, so a small, fast model is enough to narrate them."""
+    models = _setting("LLM_MODELS")
+    return tuple(m.strip() for m in models.split(",") if m.strip()) if models else None
+
+def _generate(router, prompt):
+    """Sequential fallback, or a hedged race when LLM_HEDGE_DELAY_SECONDS is set."""
+    hedge_delay = _setting("LLM_HEDGE_DELAY_SECONDS")
+    max_tokens = _setting("LLM_MAX_OUTPUT_TOKENS")
+    if hedge_delay is None:
+        return router.generate(prompt, max_output_tokens=int(max_tokens) if max_tokens else None)
+    max_tokens = int(max_tokens or 2048)
+    return router.generate_hedged(
+        prompt, hedge_delay=float(hedge_delay), max_output_tokens=max_tokens,
+        token_budget=int(_setting("LLM_TOKEN_BUDGET", 2 * max_tokens))
+    )
+
 def try_generate_with_fallback(prompt, project_id, credentials):
-    models = ["gemini-2.5-pro", "gemini-2.5-flash", "gemini-2.0-flash-001", "gemini-1.5-pro-001"]
-    
     try:
-        vertexai.init(project=project_id, location="us-central1", credentials=credentials)
+        router = get_model_router(project_id, credentials)
     except Exception as e:
         return f"**[Connection Error]** {e}"
 
-    for m in models:
-        try:
-            model = GenerativeModel(m)
-            response = model.generate_content(prompt)
-            return response.text
-        except: continue
-            
-    return "**[System Error]** AI models unavailable."
-
-def generate_cost_award_draft(case_id, final_award_val):
     try:
-        # A. GATHER ALL DATA POINTS
-        # 1. Totals
-        c_total = get_total_costs('claimant')
-        r_total = get_total_costs('respondent')
-        
-        # 2. Conduct (Doc Prod)
-        c_score, c_dp_pen = calculate_doc_prod_score('claimant')
-        r_score, r_dp_pen = calculate_doc_prod_score('respondent')
-        
-        # 3. Delays
-        c_delay_pct, c_delay_log = calculate_delay_penalties('claimant')
-        r_delay_pct, r_delay_log = calculate_delay_penalties('respondent')
-        
-        # 4. Failed Applications
-        c_failed_apps = analyze_interim_applications('claimant')
-        r_failed_apps = analyze_interim_applications('respondent')
-        
-        # 5. Sealed Offers
-        reversals = check_sealed_offers(final_award_val) if final_award_val else []
-        
-        # B. DETAILED NARRATIVE PROMPT
-        prompt = f"""
-        Act as a TRIBUNAL SECRETARY preparing a "Final Memorandum on Costs" for Case {case_id}.
-        
-        Your goal is to summarize the procedural history and recommend a cost allocation based STRICTLY on the data below.
-        
-        --- CASE DATA ---
-        
-        [A] FINANCIAL BASELINE
-        - Claimant Total Request: €{c_total:,.2f}
-        - Respondent Total Request: €{r_total:,.2f}
-        - Final Principal Award: €{final_award_val:,.2f}
-        
-        [B] PROCEDURAL HISTORY & CONDUCT
-        1. Document Production Phase:
-           - Claimant: Rejected {c_score:.1f}% of requests. (Flagged: {c_dp_pen})
-           - Respondent: Rejected {r_score:.1f}% of requests. (Flagged: {r_dp_pen})
-           *Rule: Rejection >75% constitutes a 'Fishing Expedition' and costs for this phase should be disallowed.*
-           
-        2. Timeliness & Delays:
-           - Claimant Penalties: -{c_delay_pct}% deduction. Events: {c_delay_log}
-           - Respondent Penalties: -{r_delay_pct}% deduction. Events: {r_delay_log}
-           *Rule: Consensual delays are excused. Non-consensual delays trigger 0.5% deduction/day.*
-           
-        3. Interim Applications (Pay-as-you-go):
-           - Claimant Failed Apps: {c_failed_apps}
-           - Respondent Failed Apps: {r_failed_apps}
-           *Rule: Loser pays costs of failed interim applications immediately or via offset.*
-           
-        [C] SETTLEMENT BEHAVIOR (The 'Sealed Offer')
-        {f"- CRITICAL: A Sealed Offer was opened. {reversals[0]['offerer']} offered €{reversals[0]['offer_amount']:,.2f} on {reversals[0]['offer_date']}. The Award (€{final_award_val:,.2f}) is LESS favorable. The Rejecting Party ({reversals[0]['payer']}) must pay all costs incurred after the offer date (€{reversals[0]['reversal_sum']:,.2f})." if reversals else "- No cost reversal triggered (Award exceeded all offers or no offers made)."}
-        
-        --- DRAFTING INSTRUCTIONS ---
-        Write a formal legal memorandum (approx 400 words) with the following sections:
-        
-        I. PROCEDURAL SUMMARY
-        Briefly narrate the cost drivers, mentioning the total spend and the disparity between parties.
-        
-        II. ANALYSIS OF CONDUCT
-        Analyze the specific conduct issues above. Explicitly mention if the Claimant's document production ratio was excessive. Discuss the impact of the delays and failed applications.
-        
-        III. IMPACT OF SEALED OFFERS
-        State clearly if the 'Reverse Cost Shifting' rule applies. If so, calculate the impact.
-        
-        IV. FINAL RECOMMENDATION
-        Propose a specific Net Cost Order (e.g., "Respondent shall pay X% of Claimant's costs" or "Claimant shall pay Respondent..."). Deduct penalties and apply reversals mathematically.
-        """
-        
-        if "gcp_service_account" in st.secrets:
-            creds = service_account.Credentials.from_service_account_info(st.secrets["gcp_service_account"])
-            return try_generate_with_fallback(prompt, st.secrets["gcp_service_account"]["project_id"], creds)
-        else:
-            return f"**[Demo Mode]** AI Disconnected.\n\nPROMPT:\n{prompt}"
+        text, _ = _generate(router, prompt)
+        return text
+    except AllModelsUnavailable:
+        return "**[System Error]** AI models unavailable."
+
+# Bump when the prompt wording changes, so cached memos are not reused for it.
+MEMO_PROMPT_VERSION = 2
+
+def _draft_router():
+    """(router, backend label) for the configured LLM backend; (None, None) in demo mode."""
+    if _setting("LLM_BACKEND") == "stub":
+        return get_stub_router(float(_setting("LLM_STUB_LATENCY", 0.5)), float(_setting("LLM_STUB_ERROR_RATE", 0.0)), _model_chain()), "stub"
+    if "gcp_service_account" in st.secrets:
+        project_id = st.secrets["gcp_service_account"]["project_id"]
+        return get_model_router(project_id, _service_account_credentials(), _model_chain()), f"vertex:{project_id}"
+    return None, None
+
+def cost_memo_inputs(case_id, final_award_val, analysis=None):
+    """Every computed figure the memo prompt is built from."""
+    analysis = analysis or CostAnalysis.from_case()
+    order = analysis.net_cost_order(final_award_val)
+    return {
+        "case_id": case_id,
+        "award": final_award_val,
+        "totals": {r: analysis.total_costs(r) for r in ("claimant", "respondent")},
+        "doc_prod": {r: analysis.doc_prod_score(r) for r in ("claimant", "respondent")},
+        "delays": {r: analysis.delay_penalties(r) for r in ("claimant", "respondent")},
+        "failed_apps": {r: analysis.failed_applications(r) for r in ("claimant", "respondent")},
+        "reversals": order["reversals"],
+        "delay_rate": analysis.delay_penalty_rate,
+        "order": order,
+    }
+
+def format_cost_order(order):
+    """The computed net cost order as markdown lines, for the prompt and for AI-free output."""
+    lines = [f"- {label}: {'-' if amount < 0 else ''}€{abs(amount):,.2f}" for label, amount in order["steps"]]
+    if order["amount"]:
+        lines.append(f"- NET COST ORDER: {order['payer'].title()} shall pay {order['payee'].title()} €{order['amount']:,.2f}.")
+    else:
+        lines.append("- NET COST ORDER: Each party shall bear its own costs.")
+    return "\n".join(lines)
+
+def build_cost_memo_prompt(inputs):
+    case_id, final_award_val, reversals = inputs["case_id"], inputs["award"], inputs["reversals"]
+    c_total, r_total = inputs["totals"]["claimant"], inputs["totals"]["respondent"]
+    (c_score, c_dp_pen), (r_score, r_dp_pen) = inputs["doc_prod"]["claimant"], inputs["doc_prod"]["respondent"]
+    (c_delay_pct, c_delay_log), (r_delay_pct, r_delay_log) = inputs["delays"]["claimant"], inputs["delays"]["respondent"]
+    c_failed_apps, r_failed_apps = inputs["failed_apps"]["claimant"], inputs["failed_apps"]["respondent"]
+    order_lines = format_cost_order(inputs["order"]).replace("\n", "\n    ")
+    return f"""
+    Act as a TRIBUNAL SECRETARY preparing a "Final Memorandum on Costs" for Case {case_id}.
+    
+    Your goal is to summarize the procedural history and recommend a cost allocation based STRICTLY on the data below.
+    
+    --- CASE DATA ---
+    
+    [A] FINANCIAL BASELINE
+    - Claimant Total Request: €{c_total:,.2f}
+    - Respondent Total Request: €{r_total:,.2f}
+    - Final Principal Award: €{final_award_val:,.2f}
+    
+    [B] PROCEDURAL HISTORY & CONDUCT
+    1. Document Production Phase:
+       - Claimant: Rejected {c_score:.1f}% of requests. (Flagged: {c_dp_pen})
+       - Respondent: Rejected {r_score:.1f}% of requests. (Flagged: {r_dp_pen})
+       *Rule: Rejection >75% constitutes a 'Fishing Expedition' and costs for this phase should be disallowed.*
+       
+    2. Timeliness & Delays:
+       - Claimant Penalties: -{c_delay_pct}% deduction. Events: {c_delay_log}
+       - Respondent Penalties: -{r_delay_pct}% deduction. Events: {r_delay_log}
+       *Rule: Consensual delays are excused. Non-consensual delays trigger {inputs['delay_rate']:g}% deduction/day.*
+       
+    3. Interim Applications (Pay-as-you-go):
+       - Claimant Failed Apps: {c_failed_apps}
+       - Respondent Failed Apps: {r_failed_apps}
+       *Rule: Loser pays costs of failed interim applications immediately or via offset.*
+       
+    [C] SETTLEMENT BEHAVIOR (The 'Sealed Offer')
+    {f"- CRITICAL: A Sealed Offer was opened. {reversals[0]['offerer']} offered €{reversals[0]['offer_amount']:,.2f} on {reversals[0]['offer_date']}. The Award (€{final_award_val:,.2f}) is LESS favorable. The Rejecting Party ({reversals[0]['payer']}) must pay all costs incurred after the offer date (€{reversals[0]['reversal_sum']:,.2f})." if reversals else "- No cost reversal triggered (Award exceeded all offers or no offers made)."}
+    
+    [D] COMPUTED NET COST ORDER (binding figures, already calculated; do not recalculate)
+    Successful party: {inputs["order"]["winner"].title()}
+    {order_lines}
+    
+    --- DRAFTING INSTRUCTIONS ---
+    Write a formal legal memorandum (approx 400 words) with the following sections:
+    
+    I. PROCEDURAL SUMMARY
+    Briefly narrate the cost drivers, mentioning the total spend and the disparity between parties.
+    
+    II. ANALYSIS OF CONDUCT
+    Analyze the specific conduct issues above. Explicitly mention if the Claimant's document production ratio was excessive. Discuss the impact of the delays and failed applications.
+    
+    III. IMPACT OF SEALED OFFERS
+    State clearly if the 'Reverse Cost Shifting' rule applies, using the reversal figures in [D].
+    
+    IV. FINAL RECOMMENDATION
+    Explain each step of the computed order in [D] and state the Net Cost Order exactly as given there. Do not perform or alter any calculation.
+    """
+
+def _memo_request(case_id, final_award_val, refresh):
+    """(prompt, router, fingerprint, ready text). ready is set when no model call is needed:
+    a cached draft, LLM_BACKEND=none, demo mode or a connection error."""
+    inputs = cost_memo_inputs(case_id, final_award_val)
+    prompt = build_cost_memo_prompt(inputs)
+    if _setting("LLM_BACKEND") == "none":
+        return prompt, None, None, f"**Computed Cost Order** (AI narration disabled)\n\n{format_cost_order(inputs['order'])}"
+    try:
+        router, backend = _draft_router()
+    except Exception as e:
+        return prompt, None, None, f"**[Connection Error]** {e}"
+    if router is None:
+        return prompt, None, None, f"**[Demo Mode]** AI Disconnected. Computed cost order:\n\n{format_cost_order(inputs['order'])}"
+    fingerprint = memo_fingerprint({"inputs": inputs, "backend": backend, "models": _model_chain(), "prompt_version": MEMO_PROMPT_VERSION})
+    cached = None if refresh else get_cached_memo(case_id, fingerprint)
+    return prompt, router, fingerprint, cached["text"] if cached else None
+
+def generate_cost_award_draft(case_id, final_award_val, refresh=False):
+    """Memo text for the current case data; unchanged inputs are served from the memo cache."""
+    try:
+        prompt, router, fingerprint, ready = _memo_request(case_id, final_award_val, refresh)
+        if ready is not None:
+            return ready
+        try:
+            text, model = _generate(router, prompt)
+        except AllModelsUnavailable:
+            return "**[System Error]** AI models unavailable."
+        store_memo(case_id, fingerprint, text, model, final_award_val)
+        return text
 
     except Exception as e:
         return f"Error: {e}"
 
+def stream_cost_award_draft(case_id, final_award_val, refresh=False):
+    """generate_cost_award_draft as a generator of text chunks, for st.write_stream.
+
+    Chunks are yielded as the model produces them (sequential fallback, no
+    hedging); cached drafts and error messages arrive as a single chunk.
+    Time to first chunk and total time per model land in llm.MODEL_METRICS.
+    """
+    try:
+        prompt, router, fingerprint, ready = _memo_request(case_id, final_award_val, refresh)
+        if ready is not None:
+            yield ready
+            return
+        max_tokens = _setting("LLM_MAX_OUTPUT_TOKENS")
+        models, parts = [], []
+        for chunk in router.generate_stream(prompt, max_output_tokens=int(max_tokens) if max_tokens else None, on_model=models.append):
+            parts.append(chunk)
+            yield chunk
+        if parts:
+            store_memo(case_id, fingerprint, "".join(parts), models[0], final_award_val)
+    except AllModelsUnavailable:
+        yield "**[System Error]** AI models unavailable."
+    except Exception as e:
+        yield f"\n\nError: {e}"
+
 # ==============================================================================
-# 3. DOC GENERATOR (UNCHANGED)
+# 3. DOC GENERATOR
 # ==============================================================================
+# Built documents are kept per process (see doc_cache.py), keyed by case,
+# draft hash and award, so reruns and repeat downloads reuse the bytes.
+@st.cache_resource
+def get_docx_cache():
+    return BytesCache(max_entries=int(_setting("DOCX_CACHE_MAX_ENTRIES", 32)),
+                      max_bytes=int(_setting("DOCX_CACHE_MAX_MB", 64)) * 2 ** 20)
+
+def memo_docx_bytes(case_id, draft_text, award_val):
+    """The memorandum .docx as bytes, built on first request only."""
+    key = (case_id, hashlib.sha256(draft_text.encode("utf-8")).hexdigest(), award_val)
+    return get_docx_cache().get_or_build(key, lambda: generate_word_document(case_id, draft_text, award_val).getvalue())
+
 def generate_word_document(case_id, draft_text, award_val):
     doc = Document()
     style = doc.styles['Normal']
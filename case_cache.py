@@ -0,0 +1,108 @@
+"""Process-wide cache of case records shared by every Streamlit session.
+
+During a hearing week the arbitrator, both counsel teams and the registrar
+all poll the same case. Each session still gets its own per-rerun snapshot
+(db.py), but those snapshots are filled from here, so N viewers cost one
+backend read per change instead of N reads per rerun.
+
+Entries are kept fresh by backend watches (Firestore snapshot listeners,
+in-process notifications for SQLite) plus explicit invalidation on local
+writes, and are evicted least-recently-used beyond `max_entries` or after
+`idle_seconds` without a reader, which also drops their listeners. A case
+whose watch cannot be set up is still served, but never cached (see get).
+"""
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self):
+        self.load_lock = threading.Lock()
+        self.record = None
+        self.generation = 0
+        self.last_access = time.monotonic()
+        self.unsubscribers = []
+        self.watched = False
+
+
+class SharedCaseCache:
+    def __init__(self, backend, loader, watch_paths, max_entries=128, idle_seconds=900):
+        """loader(case_id) -> record; watch_paths(case_id) -> paths whose changes invalidate it."""
+        self.backend = backend
+        self.loader = loader
+        self.watch_paths = watch_paths
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "loads": 0, "invalidations": 0, "evictions": 0, "watch_errors": 0}
+
+    def get(self, case_id):
+        """Returns a private deep copy of the case record, loading it at most once per change."""
+        entry = self._entry(case_id)
+        with entry.load_lock:  # single flight: concurrent misses share one load
+            with self._lock:
+                record, generation = entry.record, entry.generation
+            if record is not None:
+                self._bump("hits")
+                return copy.deepcopy(record)
+            record = self.loader(case_id)
+            self._bump("loads")
+            with self._lock:
+                # A change that landed while we were reading makes this copy stale,
+                # and without a working watch nothing would ever tell us.
+                if entry.generation == generation and entry.watched:
+                    entry.record = record
+            return copy.deepcopy(record)
+
+    def invalidate(self, case_id):
+        with self._lock:
+            entry = self._entries.get(case_id)
+            if entry is None: return
+            entry.generation += 1
+            entry.record = None
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries)}
+
+    def _bump(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _entry(self, case_id):
+        evicted = []
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(case_id)
+            if entry is None:
+                entry = self._entries[case_id] = _Entry()
+                subscribe = True
+            else:
+                self._entries.move_to_end(case_id)
+                subscribe = False
+            entry.last_access = now
+            for cid in list(self._entries):
+                idle = now - self._entries[cid].last_access > self.idle_seconds
+                if cid != case_id and (idle or len(self._entries) > self.max_entries):
+                    evicted.append(self._entries.pop(cid))
+            self._stats["evictions"] += len(evicted)
+        for old in evicted:
+            for unsubscribe in old.unsubscribers:
+                unsubscribe()
+        if subscribe:
+            # Subscribe before the first load so no change can slip in between.
+            try:
+                for p in self.watch_paths(case_id):
+                    entry.unsubscribers.append(self.backend.watch(p, lambda cid=case_id: self.invalidate(cid)))
+                entry.watched = True
+            except Exception:
+                logger.exception("Could not watch case %s; it will be read without caching", case_id)
+                self._bump("watch_errors")
+        return entry
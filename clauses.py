@@ -0,0 +1,275 @@
+"""PO1 clause library and the index from questionnaire answers to clauses.
+
+CLAUSE_LIBRARY holds the standard wording for each Drafting Engine decision,
+keyed by library key and then by variation label. Questionnaire answers are
+stored with a stable option id next to the answer text (`<question>_option`,
+see option_id), and CLAUSE_INDEX maps (question id, option id) straight to
+the position of the matching variation, so the Drafting Engine pre-selects a
+clause with one dict lookup instead of matching answer text against labels.
+Both are built once, when the module is first imported.
+"""
+import re
+
+CLAUSE_LIBRARY = {
+    "bifurcation": {
+        "Option A (Single)": "The Tribunal shall hear all issues (Jurisdiction, Liability, and Quantum) together in a single phase.",
+        "Option B (Bifurcated)": "Pursuant to LCIA Article 22.1(vii), the proceedings are bifurcated. Phase 1 shall address Liability only."
+    },
+    "consolidation": {
+        "Option A (None)": "This arbitration stands alone; no consolidation or concurrent conduct is anticipated.",
+        "Option B (Consolidated)": "The proceedings shall be consolidated with related proceedings.",
+        "Option C (Concurrent)": "The proceedings shall be conducted concurrently with related proceedings, without consolidation."
+    },
+    "secretary": {
+        "Option A (Appointed)": "The Tribunal appoints a Tribunal Secretary with the consent of the Parties.",
+        "Option B (None)": "No Tribunal Secretary shall be appointed."
+    },
+    "sec_fees": {
+        "Option A (Hourly)": "The Tribunal Secretary's fees shall be charged at a rate between £75 and £175 per hour, in accordance with the standard LCIA Schedule of Costs.",
+        "Option B (No Fee)": "The Tribunal Secretary shall not bill separately for their time.",
+        "Option C (Template Rate)": "The Tribunal Secretary's fees shall be charged at a rate between £100 and £250 per hour."
+    },
+    "mediation": {
+        "Option A (Window)": "The procedural timetable includes a specific window for mediation stay, should the Parties agree to utilise it.",
+        "Option B (No Window)": "No specific stay for mediation is included, though the Parties may agree to mediate at any time."
+    },
+    "style": {
+        "Option A (Memorial)": "The Parties shall submit written submissions in the Memorial Style, involving the simultaneous exchange of evidence with pleadings.",
+        "Option B (Pleading)": "The Parties shall submit written submissions in the Pleading Style, where evidence is exchanged only after the disclosure phase."
+    },
+    "platform": {
+        "Option A (PROCEED)": 'The Parties and the Arbitral Tribunal shall use the PROCEED platform ("Platform") for all filings and the procedural calendar.',
+        "Option B (Email)": "The Parties shall conduct case management via email and file documents in PDF format."
+    },
+    "page_limits": {
+        "Option A (None)": "There are no specific page limits for submissions. The Parties are to exercise reasonable discretion.",
+        "Option B (Strict)": "Strict page limits shall apply to all written submissions as directed by the Tribunal.",
+        "Option C (Legal Only)": "Page limits shall apply to the legal argument sections only."
+    },
+    "last_submission": {
+        "Option A (Merits)": "The 'Last Submission' triggering the reporting period is defined as the final Post-Hearing Brief on the merits.",
+        "Option B (Final Filing)": "The 'Last Submission' is defined as the very last filing in the arbitration, including Submissions on Costs."
+    },
+    "doc_prod": {
+        "Option A (IBA Bound)": "The Tribunal shall be bound by the IBA Rules on the Taking of Evidence (2020).",
+        "Option B (IBA Guided)": "The Tribunal shall be guided by the IBA Rules on the Taking of Evidence (2020).",
+        "Option C (LCIA General)": "The Tribunal shall apply the general evidentiary powers under the LCIA Rules without specific reference to the IBA Rules."
+    },
+    "limits": {
+        "Option A (Relevance)": "Document requests shall be subject to the standard of relevance and materiality set out in the IBA Rules.",
+        "Option B (Capped)": "Document requests shall be capped at a maximum number to strictly control costs.",
+        "Option C (None)": "No document production shall take place in these proceedings."
+    },
+    "privilege_std": {
+        "Option A (Seat Law)": "The Tribunal shall determine issues of legal privilege in accordance with the rules of privilege applicable at the Seat of Arbitration.",
+        "Option B (Most Favored)": "The Tribunal shall determine issues of legal privilege in accordance with the rules most favorable to maintaining the privilege."
+    },
+    "privilege_logs": {
+        "Option A (Required)": "Parties withholding documents on grounds of privilege must produce a detailed privilege log describing the document and the basis for privilege.",
+        "Option B (On Dispute)": "Privilege logs are not required unless specifically ordered by the Tribunal following a dispute."
+    },
+    "witness_exam": {
+        "Option A (Limited)": "Witness statements shall stand as evidence-in-chief, and direct examination at the hearing shall be limited.",
+        "Option B (Full)": "Witnesses may be subject to full direct examination at the hearing."
+    },
+    "expert_meeting": {
+        "Option A (Joint Report)": "Expert counterparts shall meet and produce a Joint Report identifying areas of agreement and disagreement prior to the hearing.",
+        "Option B (None)": "No formal pre-hearing meeting of experts is required."
+    },
+    "expert_hot_tub": {
+        "Option A (Sequential)": "Experts shall be examined sequentially, one after the other.",
+        "Option B (Concurrent)": "Experts shall be examined concurrently ('hot-tubbing') on an issue-by-issue basis."
+    },
+    "venue": {
+        "At Seat": "The Oral Hearing shall be held physically at the Seat of Arbitration.",
+        "Neutral Venue": "The Oral Hearing shall be held physically at a neutral venue (IDRC London).",
+        "Virtual": "The Oral Hearing shall be held virtually via video conference."
+    },
+    "chess_clock": {
+        "Option A (Strict)": "Time allocation at the hearing shall be managed using the 'Chess Clock' method, with a fixed split of total hearing time allocated to each Party.",
+        "Option B (Flexible)": "The Tribunal shall manage time allocation flexibly without a strict Chess Clock."
+    },
+    "transcription": {
+        "Option A (Real-time)": "Live, real-time transcription is required for the hearing.",
+        "Option B (Daily)": "Daily transcripts shall be provided at the end of each hearing day."
+    },
+    "demonstratives": {
+        "Option A (24h Notice)": "Demonstrative exhibits must be exchanged in hard copy or email at least 24 hours before use.",
+        "Option B (No Notice)": "Demonstrative exhibits may be used without prior exchange provided they contain no new evidence."
+    },
+    "interpretation": {
+        "Option A (English Only)": "The proceedings will be conducted entirely in English; no interpretation is anticipated.",
+        "Option B (Required)": "Interpretation services shall be arranged for witnesses testifying in other languages."
+    },
+    "cost_alloc": {
+        "Option A (Loser Pays)": "Costs shall be allocated on the principle that 'costs follow the event' (the loser pays).",
+        "Option B (Apportioned)": "Costs shall be apportioned reflecting the relative success of the Parties on individual issues.",
+        "Option C (Own Costs)": "Each Party shall bear its own legal costs, and the administrative costs of the arbitration shall be split 50/50."
+    },
+    "counsel_fees": {
+        "Option A (Reasonable)": "Recoverable counsel fees shall be subject to the principle of reasonableness and assessed by reference to applicable market rates.",
+        "Option B (Capped)": "Counsel fees shall be capped at a fixed amount determined by the Tribunal."
+    },
+    "internal_costs": {
+        "Option A (Recoverable)": "Reasonable internal management costs incurred by the Parties are recoverable.",
+        "Option B (Not Recoverable)": "Internal management costs are not recoverable."
+    },
+    "deposits": {
+        "Option A (50/50)": "Administrative deposits shall be split 50/50 between Claimant and Respondent from the outset.",
+        "Option B (Claimant First)": "The Claimant shall pay the initial deposit, subject to later adjustment."
+    },
+    "currency": {
+        "Option A (Contract)": "The Award shall be expressed in the currency of the contract.",
+        "Option B (Incurred)": "The Award shall be expressed in the currency in which costs were incurred."
+    },
+    "interest": {
+        "Option A (Substantive Law)": "The Tribunal shall apply interest rates and methods prescribed by the applicable substantive law.",
+        "Option B (Commercial)": "The Tribunal shall apply a commercial interest rate (e.g., LIBOR/SOFR + 2%)."
+    },
+    "sign_award": {
+        "Option A (Electronic)": "The Parties agree that the Tribunal may sign the Award electronically.",
+        "Option B (Wet Ink)": "The Parties require the Award to be signed in 'wet ink' (hard copy)."
+    },
+    "publication": {
+        "Option A (Confidential)": "The award shall remain confidential and shall not be published.",
+        "Option B (Redacted)": "The award may be published in redacted form."
+    },
+    "funding": {
+        "Option A (None)": "The Parties confirm that no third-party funding is currently in place.",
+        "Option B (Disclose)": "The existence and identity of any third-party funder must be disclosed immediately."
+    },
+    "ai_guidelines": {
+        "Option A (CIArb)": "The Tribunal shall adopt the CIArb Guidelines on the Use of Artificial Intelligence as a guiding text for the Parties' use of technology.",
+        "Option B (None)": "No specific guidelines on AI are adopted."
+    },
+    "green_protocols": {
+        "Option A (Adopted)": "The Tribunal and Parties shall conduct the arbitration in accordance with the Green Protocols of the Campaign for Greener Arbitrations.",
+        "Option B (None)": "No specific sustainability protocols are adopted.",
+        "Option C (Tribunal Discretion)": "The Tribunal shall take the environmental impact of the proceedings into account when making procedural decisions."
+    },
+    "disability": {
+        "Option A (Included)": "At any point, either Party may advise the Tribunal of a person who requires reasonable accommodation to facilitate their full participation.",
+        "Option B (None)": "No specific clause on accommodations is required."
+    },
+    "gdpr": {
+        "Option A (Standard)": "The Parties agree that standard security measures, including the use of encrypted email and the designated Platform, are sufficient for data protection purposes.",
+        "Option B (Protocol)": "A specific Data Protection Protocol shall be established."
+    }
+}
+
+# Questionnaire question id -> library key of the decision it feeds
+QUESTION_CLAUSES = {
+    "bifurcation": "bifurcation",
+    "consolidation": "consolidation",
+    "secretary": "secretary",
+    "sec_fees": "sec_fees",
+    "mediation": "mediation",
+    "platform": "platform",
+    "style": "style",
+    "limits_submission": "page_limits",
+    "last_submission": "last_submission",
+    "doc_prod": "doc_prod",
+    "limits": "limits",
+    "privilege_std": "privilege_std",
+    "privilege_logs": "privilege_logs",
+    "witness_exam": "witness_exam",
+    "expert_meeting": "expert_meeting",
+    "expert_hot_tub": "expert_hot_tub",
+    "physical_venue_preference": "venue",
+    "chess_clock": "chess_clock",
+    "transcription": "transcription",
+    "demonstratives": "demonstratives",
+    "interpretation": "interpretation",
+    "cost_allocation": "cost_alloc",
+    "counsel_fees": "counsel_fees",
+    "internal_costs": "internal_costs",
+    "deposits": "deposits",
+    "currency": "currency",
+    "interest": "interest",
+    "sign_award": "sign_award",
+    "publication": "publication",
+    "funding": "funding",
+    "ai_guidelines": "ai_guidelines",
+    "sustainability": "green_protocols",
+    "disability": "disability",
+    "gdpr": "gdpr",
+}
+
+# Answers whose option letter does not name the same variation in the library
+ANSWER_OVERRIDES = {
+    ("sec_fees", "B"): "Option C (Template Rate)",
+    ("mediation", "A"): "Option B (No Window)",
+    ("mediation", "B"): "Option A (Window)",
+    ("mediation", "C"): "Option B (No Window)",
+    ("privilege_std", "B"): "Option A (Seat Law)",
+    ("privilege_std", "C"): "Option B (Most Favored)",
+    ("physical_venue_preference", "A"): "At Seat",
+    ("physical_venue_preference", "B"): "Neutral Venue",
+    ("transcription", "C"): "Option B (Daily)",
+    ("demonstratives", "B"): "Option A (24h Notice)",
+    ("demonstratives", "C"): "Option B (No Notice)",
+    ("interest", "B"): "Option A (Substantive Law)",
+    ("sustainability", "B"): "Option C (Tribunal Discretion)",
+    ("sustainability", "C"): "Option B (None)",
+    ("disability", "B"): "Option A (Included)",
+    ("disability", "C"): "Option B (None)",
+}
+
+# Answers with no matching variation; the Drafting Engine starts from the
+# first variation and the tribunal picks the wording by hand
+UNMATCHED_OPTIONS = {
+    ("doc_prod", "D"),
+    ("witness_exam", "C"),
+    ("currency", "C"),
+    ("interest", "C"),
+    ("transcription", "D"),
+    ("publication", "C"),
+}
+
+_OPTION_LETTER = re.compile(r"^\W*Option\s+([A-Z])\b")
+_BOLD_LABEL = re.compile(r"^\*\*(.+?)\*\*")
+
+
+def option_id(option):
+    """Stable id of a questionnaire option or library variation.
+
+    "**Option B: Capped.** ..." and "Option B (Capped)" are both "B"; options
+    without a letter use their bold label or text, slugified ("**Short:** ..."
+    is "short", "Video Conference" is "video-conference").
+    """
+    if not option:
+        return None
+    text = str(option)
+    m = _OPTION_LETTER.match(text)
+    if m:
+        return m.group(1)
+    m = _BOLD_LABEL.match(text)
+    if m:
+        text = m.group(1)
+    return re.sub(r"[^a-z0-9]+", "-", text.lower().rstrip(":. ")).strip("-") or None
+
+
+def answer_option(answers, question_id):
+    """Option id of one party's answer; answers saved before option ids fall back to the text."""
+    return answers.get(f"{question_id}_option") or option_id(answers.get(question_id))
+
+
+def _compile_index():
+    index = {}
+    for question_id, lib_key in QUESTION_CLAUSES.items():
+        for i, label in enumerate(CLAUSE_LIBRARY[lib_key]):
+            index[(question_id, option_id(label))] = i
+    labels = {lib_key: list(variations) for lib_key, variations in CLAUSE_LIBRARY.items()}
+    for (question_id, oid), label in ANSWER_OVERRIDES.items():
+        index[(question_id, oid)] = labels[QUESTION_CLAUSES[question_id]].index(label)
+    for key in UNMATCHED_OPTIONS:
+        index.pop(key, None)
+    return index
+
+
+CLAUSE_INDEX = _compile_index()
+
+
+def default_variation(question_id, answers):
+    """Position of the library variation matching a party's answer (0 if none does, see UNMATCHED_OPTIONS)."""
+    return CLAUSE_INDEX.get((question_id, answer_option(answers, question_id)), 0)
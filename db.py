@@ -1,32 +1,48 @@
 import streamlit as st
-from google.cloud import firestore
-from google.cloud import storage
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import storage
+from case_cache import SharedCaseCache
+from storage import ArrayUnion, DELETE, Increment, VersionConflict
+from mailer import PooledMailer, SMTPSettings, PERMANENT_ERRORS
+from outbox import EmailOutbox
+from passwords import KDFParams, DEFAULT_PARAMS, hash_secret, verify_secret, needs_rehash
 from datetime import datetime
 import secrets
 import string
+import threading
+import time
+import copy
+import os
+import re
+import json
+import hashlib
+import difflib
+
+# --- 1. CONNECT TO STORAGE ---
+# STORAGE_BACKEND (secrets or environment) picks "firestore", "sqlite" or
+# "memory". Unset, Firestore is used when a service account is configured and
+# a local SQLite file (PROCEED_SQLITE_PATH) otherwise, so the app runs offline.
+def _setting(name, default=None):
+    try:
+        return st.secrets.get(name, os.environ.get(name, default))
+    except Exception:  # no secrets.toml at all
+        return os.environ.get(name, default)
 
-# --- 1. CONNECT TO GOOGLE CLOUD ---
 @st.cache_resource
 def get_db():
+    service_account = _setting("gcp_service_account")
+    kind = _setting("STORAGE_BACKEND") or ("firestore" if service_account else "sqlite")
     try:
-        return firestore.Client.from_service_account_info(
-            st.secrets["gcp_service_account"], 
-            database="proceed"
-        )
-    except Exception:
-        try:
-            return firestore.Client.from_service_account_info(st.secrets["gcp_service_account"])
-        except Exception as e2:
-            st.error(f"DB Connection Error: {e2}")
-            return None
+        return storage.backend_from_settings(kind, service_account, database="proceed")
+    except Exception as e:
+        st.error(f"DB Connection Error: {e}")
+        return None
 
 @st.cache_resource
 def get_storage_bucket():
     try:
-        storage_client = storage.Client.from_service_account_info(st.secrets["gcp_service_account"])
+        from google.cloud import storage as gcs
+        storage_client = gcs.Client.from_service_account_info(st.secrets["gcp_service_account"])
         bucket_name = f"{st.secrets['gcp_service_account']['project_id']}-files"
         try:
             return storage_client.get_bucket(bucket_name)
@@ -39,36 +55,73 @@ db = get_db()
 bucket = get_storage_bucket()
 
 # --- 2. EMAIL HELPER ---
-def send_email_via_smtp(to_email, subject, body):
-    smtp_user = st.secrets.get("ST_MAIL_USER")
-    smtp_pass = st.secrets.get("ST_MAIL_PASSWORD")
+# SMTP settings are resolved once per process and authenticated sessions are
+# pooled (see mailer.py), so a batch of invitations shares one login.
+# Callers never wait on SMTP: messages go through the durable outbox in
+# outbox.py, whose worker thread sends, retries and dead-letters them.
+# ST_MAIL_STARTTLS=false allows a plain local stand-in such as aiosmtpd.
+@st.cache_resource
+def get_mailer():
+    smtp_user = _setting("ST_MAIL_USER")
+    smtp_pass = _setting("ST_MAIL_PASSWORD")
     
     if not smtp_user:
-        gcp_sec = st.secrets.get("gcp_service_account", {})
+        gcp_sec = _setting("gcp_service_account", {})
         smtp_user = gcp_sec.get("ST_MAIL_USER")
         smtp_pass = gcp_sec.get("ST_MAIL_PASSWORD")
 
     if not smtp_user or not smtp_pass:
-        return False
+        return None
 
-    smtp_server = st.secrets.get("ST_MAIL_SERVER", "smtp.gmail.com")
-    smtp_port = st.secrets.get("ST_MAIL_PORT", 587)
+    settings = SMTPSettings(
+        host=_setting("ST_MAIL_SERVER", "smtp.gmail.com"),
+        port=int(_setting("ST_MAIL_PORT", 587)),
+        user=smtp_user,
+        password=smtp_pass,
+        starttls=str(_setting("ST_MAIL_STARTTLS", "true")).lower() not in ("false", "0", "no")
+    )
+    return PooledMailer(settings, pool_size=int(_setting("ST_MAIL_POOL_SIZE", 2)))
 
-    try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            
-            msg = MIMEMultipart()
-            msg['From'] = smtp_user
-            msg['To'] = to_email
-            msg['Subject'] = f"[PROCEED] {subject}"
-            msg.attach(MIMEText(body, 'plain'))
-            server.send_message(msg)
-        return True
-    except Exception as e:
-        print(f"Email error: {e}")
-        return False
+@st.cache_resource
+def get_outbox():
+    """The process-wide outbox, with its delivery worker started. None without SMTP or storage."""
+    mailer = get_mailer()
+    if not mailer or not db:
+        return None
+    return EmailOutbox(
+        db, mailer.deliver,
+        batch_size=int(_setting("OUTBOX_BATCH_SIZE", 20)),
+        max_attempts=int(_setting("OUTBOX_MAX_ATTEMPTS", 6)),
+        base_delay=float(_setting("OUTBOX_BASE_DELAY_SECONDS", 30)),
+        permanent_errors=PERMANENT_ERRORS,
+        dead_retention_seconds=float(_setting("OUTBOX_DEAD_RETENTION_SECONDS", 86400))
+    ).start()
+
+def send_emails(messages, case_id=None):
+    """Queues [(to_email, subject, body)] for background delivery. Returns the outbox ids."""
+    outbox = get_outbox()
+    messages = [m for m in messages if m[0]]
+    if not outbox or not messages:
+        return []
+    return outbox.enqueue(messages, case_id=case_id)
+
+def send_email_via_smtp(to_email, subject, body):
+    return len(send_emails([(to_email, subject, body)])) == 1
+
+def get_outbox_messages(case_id=None):
+    outbox = get_outbox()
+    cid = case_id or get_active_case_id()
+    return outbox.messages(cid) if outbox and cid else []
+
+def retry_outbox_message(msg_id):
+    """False when the message can no longer be resent (its body was purged)."""
+    outbox = get_outbox()
+    return bool(outbox) and outbox.retry(msg_id)
+
+def get_mail_stats():
+    mailer = get_mailer()
+    outbox = get_outbox()
+    return {**mailer.stats, **{f"outbox_{k}": v for k, v in outbox.stats().items()}} if mailer and outbox else {}
 
 def generate_pin():
     return ''.join(secrets.choice(string.digits) for i in range(6))
@@ -91,128 +144,381 @@ def create_new_case(case_name, claimant_email, respondent_email, arbitrator_emai
             "status": "Phase 1: Initiation",
             "merits_decided": False,
             "final_award_amount": 0.0,
+            "credentials_migrated": True,
             "cost_settings": {
                 "doc_prod_threshold": 75.0, 
                 "delay_penalty_rate": 0.5,
                 "hourly_caps": {}
             },
-            "setup_pins": pins,
-            "parties": {
-                "claimant": claimant_email.strip().lower(), 
-                "respondent": respondent_email.strip().lower(),
-                "arbitrator": arbitrator_email.strip().lower() if arbitrator_email else ""
-            },
-            "credentials": {
-                "claimant": None,
-                "respondent": None,
-                "arbitrator": None
-            }
         },
         "phase1": [], 
         "phase2": [],
         "phase1_released": False,
         "phase2_released": False,
         "responses": {},
+        # Timeline (with amendment_history), delays, notifications, doc_prod and
+        # the cost ledgers live in item subcollections; see ITEM_COLLECTIONS.
+        "storage_layout": SPLIT_LAYOUT,
         "complex_data": {
-            "timeline": [], # Now supports amendment_history
-            "delays": [], 
-            "notifications": [],
-            "doc_prod": {"claimant": [], "respondent": []}, 
-            "costs": {
-                "claimant_log": [], 
-                "respondent_log": [], 
-                "tribunal_log": [],
-                "common_log": [],
-                "payment_requests": [],
-                "sealed_offers": []
-            }, 
             "app_tagging": []
         }
     }
     
+    # Party emails, PIN and password hashes live in the credentials collection.
+    parties = {
+        "claimant": claimant_email.strip().lower(), 
+        "respondent": respondent_email.strip().lower(),
+        "arbitrator": arbitrator_email.strip().lower() if arbitrator_email else ""
+    }
+    
     email_count = 0
     if db:
-        db.collection("arbitrations").document(case_id).set(new_case_data)
+        db.write_batch([
+            ("set", _case_path(case_id), new_case_data),
+            ("set", f"case_index/{case_id}", _index_entry(new_case_data["meta"])),
+            ("set", _aggregates_path(case_id), _compute_aggregates({}))
+        ] + [
+            ("set", _credential_path(case_id, role), _credential_entry(case_id, role, email, pins[role]))
+            for role, email in parties.items() if email
+        ])
         
-        # EMAILS
+        # EMAILS (queued; delivered in one SMTP session by the outbox worker)
+        invites = []
         c_body = f"Strictly Confidential - Claimant Access\nCase: {case_name}\nPIN: {pins['claimant']}\nLink: https://proceedai.streamlit.app/"
-        if send_email_via_smtp(claimant_email, f"Activation: {case_name}", c_body): email_count += 1
+        invites.append((claimant_email, f"Activation: {case_name}", c_body))
 
         r_body = f"Strictly Confidential - Respondent Access\nCase: {case_name}\nPIN: {pins['respondent']}\nLink: https://proceedai.streamlit.app/"
-        if send_email_via_smtp(respondent_email, f"Activation: {case_name}", r_body): email_count += 1
+        invites.append((respondent_email, f"Activation: {case_name}", r_body))
             
         if arbitrator_email:
             a_body = f"Strictly Confidential - Tribunal Access\nCase: {case_name}\nPIN: {pins['arbitrator']}\nLink: https://proceedai.streamlit.app/"
-            if send_email_via_smtp(arbitrator_email, f"Appointment: {case_name}", a_body): email_count += 1
+            invites.append((arbitrator_email, f"Appointment: {case_name}", a_body))
+        email_count = len(send_emails(invites, case_id=case_id))
         
     return case_id, email_count
 
-def get_all_cases_metadata():
+# --- CASE INDEX ---
+# case_index/{case_id} holds just the fields the Registrar table shows, so
+# listing cases never streams full arbitration documents. Kept in sync by
+# create_new_case and set_case_status. Pages are ordered by (created_at, case id)
+# so cases created in the same second are neither skipped nor repeated at a page
+# boundary; filtering by status needs a composite index
+# (status ASC, created_at DESC, __name__ DESC). Cases created before the index
+# existed are backfilled once per database; migrations/case_index records that
+# the backfill ran, whatever the index already holds.
+CASE_STATUSES = [
+    "Phase 1: Initiation", "Phase 2: Written Submissions", "Phase 3: Document Production",
+    "Phase 4: Hearing", "Phase 5: Cost Management", "Phase 6: Post-Hearing"
+]
+INDEX_FIELDS = ["case_id", "case_name", "status", "created_at"]
+_INDEX_MIGRATION_PATH = "migrations/case_index"
+_index_backfilled = False  # this process has seen the migration marker
+
+def _index_entry(meta):
+    return {k: meta.get(k) for k in INDEX_FIELDS}
+
+def get_all_cases_metadata(status=None, page_size=None, after=None):
+    """Newest-first case list from case_index.
+
+    `after` is the last entry of the previous page (cursor pagination).
+    """
     if not db: return []
     try:
-        docs = db.collection("arbitrations").stream()
-        cases_list = []
-        for doc in docs:
-            d = doc.to_dict()
-            if 'meta' in d:
-                cases_list.append(d['meta'])
-        return cases_list
+        _ensure_case_index()
+        docs = db.list(
+            "case_index",
+            where=[("status", "==", status)] if status else [],
+            order_by=["created_at", "__name__"], descending=True,
+            limit=page_size,
+            start_after={"created_at": after["created_at"], "__name__": after["case_id"]} if after else None
+        )
+        return [doc.data for doc in docs]
     except Exception:
         return []
 
+def _ensure_case_index():
+    """Runs the one-time case_index backfill unless the migration marker says it already ran."""
+    global _index_backfilled
+    if _index_backfilled: return
+    if not db.get(_INDEX_MIGRATION_PATH).exists:
+        written = rebuild_case_index()
+        db.set(_INDEX_MIGRATION_PATH, {"completed_at": datetime.now(), "entries": written})
+    _index_backfilled = True
+
+def rebuild_case_index():
+    """Backfills case_index from the case documents, reading only meta fields. Returns entries written."""
+    if not db: return 0
+    docs = db.list("arbitrations", fields=[f"meta.{k}" for k in INDEX_FIELDS])
+    ops = []
+    for doc in docs:
+        meta = doc.data.get("meta")
+        if meta and meta.get("case_id"):
+            ops.append((f"case_index/{meta['case_id']}", _index_entry(meta)))
+    _commit(ops)
+    return len(ops)
+
+def set_case_status(case_id, status):
+    if not db: return
+    _update_case(case_id, {"meta.status": status}, [("merge", f"case_index/{case_id}", {"status": status})])
+
 # --- 4. SECURE AUTHENTICATION FLOW ---
 def get_active_case_id():
     return st.session_state.get('active_case_id')
 
+# --- CREDENTIALS ---
+# credentials/{case_id}__{role} holds a party's email and the scrypt hashes of
+# its setup PIN and password (see passwords.py), so activation and login are a
+# single point read of a tiny document instead of a read of the whole case.
+# Older cases keep these in plain text under meta; they are moved over the
+# first time anyone activates or logs in on the case, and meta.credentials_migrated
+# records that so a later miss (a role with no party) does not migrate again.
+# KDF_LOG2_N / KDF_R / KDF_P tune the hash cost; hashes made with other
+# parameters are upgraded on the next successful login.
+CREDENTIAL_ROLES = ["claimant", "respondent", "arbitrator"]
+_MIGRATED_CASES = set()  # case ids known to be migrated, so misses skip the case read
+
+def _kdf_params():
+    return KDFParams(
+        int(_setting("KDF_LOG2_N", DEFAULT_PARAMS.log2_n)),
+        int(_setting("KDF_R", DEFAULT_PARAMS.r)),
+        int(_setting("KDF_P", DEFAULT_PARAMS.p))
+    )
+
+def _credential_path(case_id, role):
+    return f"credentials/{case_id}__{role}"
+
+def _credential_entry(case_id, role, email, pin=None, password=None):
+    params = _kdf_params()
+    return {
+        "case_id": case_id,
+        "role": role,
+        "email": email,
+        "pin_hash": hash_secret(str(pin), params) if pin else None,
+        "password_hash": hash_secret(password, params) if password else None
+    }
+
+def migrate_case_credentials(case_id):
+    """Moves plain-text meta.parties / setup_pins / credentials into hashed credential docs.
+
+    Returns the number of credential docs written, or None if the case does not exist.
+    Credential docs are created only where none exists and the case is updated on
+    the version that was read, so a concurrent migration or activation is never
+    overwritten; the loser re-reads and finds the case already migrated.
+    """
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        doc = _read_case_doc(case_id)
+        if not doc.exists: return None
+        meta = doc.data.get('meta', {})
+        if meta.get('credentials_migrated'):
+            _MIGRATED_CASES.add(case_id)
+            return 0
+        parties = meta.get('parties') or {}
+        ops = [
+            ("create", _credential_path(case_id, role), _credential_entry(
+                case_id, role, parties[role].strip().lower(),
+                meta.get('setup_pins', {}).get(role), meta.get('credentials', {}).get(role)
+            ))
+            for role in CREDENTIAL_ROLES if parties.get(role)
+        ]
+        ops.append(("update", _case_path(case_id), {
+            "meta.parties": DELETE, "meta.setup_pins": DELETE, "meta.credentials": DELETE,
+            "meta.credentials_migrated": True
+        }, doc.version))
+        try:
+            db.write_batch(ops)
+        except VersionConflict:
+            continue
+        _case_changed(case_id)
+        _MIGRATED_CASES.add(case_id)
+        return len(ops) - 1
+    raise WriteConflictError(f"credentials of {case_id} kept changing during migration")
+
+def _read_credentials(case_id, role):
+    """Returns (credential doc, case exists)."""
+    if not case_id or "/" in case_id: return None, False
+    doc = db.get(_credential_path(case_id, role))
+    if doc.exists: return doc, True
+    if case_id in _MIGRATED_CASES: return None, True
+    migrated = migrate_case_credentials(case_id)
+    if migrated is None: return None, False
+    doc = db.get(_credential_path(case_id, role)) if migrated else doc
+    return (doc if doc.exists else None), True
+
 def activate_user_account(case_id, email, input_setup_pin, new_password, target_role):
     if not db: return False, "DB Error"
-    doc_ref = db.collection("arbitrations").document(case_id)
-    doc = doc_ref.get()
-    if not doc.exists: return False, "Case ID not found."
-    
-    data = doc.to_dict()
-    meta = data.get('meta', {})
-    
     target_role = target_role.lower()
     input_email = email.strip().lower()
     input_pin = input_setup_pin.strip()
+
+    cred, case_exists = _read_credentials(case_id.strip(), target_role)
+    if not case_exists: return False, "Case ID not found."
+    if cred is None or not input_email: return False, f"Email mismatch for {target_role}."
     
-    registered_email = meta.get('parties', {}).get(target_role, '').lower()
+    registered_email = cred.data.get('email', '')
     if registered_email != input_email: return False, f"Email mismatch for {target_role}."
 
-    correct_pin = meta.get('setup_pins', {}).get(target_role)
-    if str(input_pin) != str(correct_pin): return False, "Invalid Setup PIN."
+    if not verify_secret(str(input_pin), cred.data.get('pin_hash')): return False, "Invalid Setup PIN."
         
-    if meta.get('credentials', {}).get(target_role): return False, "Account already activated."
+    if cred.data.get('password_hash'): return False, "Account already activated."
         
-    db.collection("arbitrations").document(case_id).update({f"meta.credentials.{target_role}": new_password})
+    try:
+        # Conditioned on the version we checked, so two concurrent activations cannot both win.
+        db.update(_credential_path(case_id.strip(), target_role), {
+            "password_hash": hash_secret(new_password, _kdf_params()),
+            "activated_at": datetime.now()
+        }, expected_version=cred.version)
+    except VersionConflict:
+        return False, "Account already activated."
     return True, f"Account activated! Welcome, {target_role.title()}."
 
 def login_user(case_id, email, password, role_attempt):
+    """Returns (success, message, role, account) where account is {case_id, role, email}."""
     if not db: return False, "DB Error", None, None
-    doc = db.collection("arbitrations").document(case_id).get()
-    if not doc.exists: return False, "Case ID not found.", None, None
-    
-    data = doc.to_dict()
-    meta = data.get('meta', {})
     role_attempt = role_attempt.lower()
     input_email = email.strip().lower()
+    case_id = case_id.strip()
 
-    registered_email = meta.get('parties', {}).get(role_attempt, '').lower()
+    cred, case_exists = _read_credentials(case_id, role_attempt)
+    if not case_exists: return False, "Case ID not found.", None, None
+    if cred is None or not input_email: return False, "Email mismatch.", None, None
+
+    registered_email = cred.data.get('email', '')
     if registered_email != input_email: return False, "Email mismatch.", None, None
         
-    stored_password = meta.get('credentials', {}).get(role_attempt)
-    if not stored_password: return False, "Account not activated.", None, None
-    if stored_password != password: return False, "Incorrect Password.", None, None
+    stored_hash = cred.data.get('password_hash')
+    if not stored_hash: return False, "Account not activated.", None, None
+    if not verify_secret(password, stored_hash): return False, "Incorrect Password.", None, None
+
+    params = _kdf_params()
+    if needs_rehash(stored_hash, params):
+        try:
+            db.update(_credential_path(case_id, role_attempt), {"password_hash": hash_secret(password, params)}, expected_version=cred.version)
+        except VersionConflict:
+            pass
         
-    return True, "Success", role_attempt, meta
+    return True, "Success", role_attempt, {"case_id": case_id, "role": role_attempt, "email": registered_email}
 
 # --- 5. STANDARD LOADERS ---
+# Every loader below funnels through load_full_config(). The case document is
+# fetched at most once per Streamlit script run and kept as a snapshot in
+# session state; writes made through this module patch the snapshot so the
+# rest of the run sees them without another read.
+READ_STATS = {"document_reads": 0, "item_queries": 0, "snapshot_hits": 0}
+_stats_lock = threading.Lock()
+
+def _count(stat, n=1):
+    with _stats_lock:
+        READ_STATS[stat] += n
+
+def get_read_stats():
+    with _stats_lock:
+        return dict(READ_STATS)
+
+def _run_marker():
+    # Streamlit swaps in a fresh cursors dict at the start of every run (and
+    # every fragment run), so holding a reference to it identifies the run.
+    # Should a Streamlit release drop the attribute, snapshots simply stop
+    # being reused within a run and every load goes to the shared case cache.
+    ctx = get_script_run_ctx()
+    return getattr(ctx, "cursors", None) if ctx else None
+
+def _case_path(case_id):
+    return f"arbitrations/{case_id}"
+
+def _read_case_doc(case_id):
+    _count("document_reads")
+    return db.get(_case_path(case_id))
+
+@st.cache_resource
+def get_case_cache():
+    """Cross-session cache the per-rerun snapshots are filled from (see case_cache.py)."""
+    if not db: return None
+    return SharedCaseCache(
+        db, _load_case, lambda cid: [_case_path(cid), _aggregates_path(cid)] + [f"{_case_path(cid)}/{sub}" for sub, _ in ITEM_COLLECTIONS.values()],
+        max_entries=int(_setting("CASE_CACHE_MAX_ENTRIES", 128)),
+        idle_seconds=float(_setting("CASE_CACHE_IDLE_SECONDS", 900))
+    )
+
+def _case_changed(cid):
+    # Watches catch every change eventually; this makes our own writes visible
+    # to the next rerun without waiting for the listener round-trip.
+    cache = get_case_cache()
+    if cache: cache.invalidate(cid)
+
+def _read_case(cid):
+    cache = get_case_cache()
+    return cache.get(cid) if cache else _load_case(cid)
+
+def _load_case(cid):
+    """Reads the case document plus, for split cases, every item subcollection."""
+    doc = _read_case_doc(cid)
+    data = doc.data if doc.exists else {}
+    ids, item_times = {}, {}
+    if data.get("storage_layout") == SPLIT_LAYOUT:
+        data["complex_data"], ids, item_times = _load_items(cid, data.get("complex_data", {}))
+    aggregates = db.get(_aggregates_path(cid)).data if doc.exists else None
+    # version is what the snapshot is consistent with; versioned writes use it
+    # as their precondition (see section 7).
+    return {"case_id": cid, "data": data, "ids": ids, "item_times": item_times, "version": doc.version, "aggregates": aggregates}
+
+def _get_snapshot(cid):
+    marker = _run_marker()
+    snap = st.session_state.get("_case_snapshot") if marker is not None else None
+    if snap and snap["case_id"] == cid and snap["run"] is marker:
+        _count("snapshot_hits")
+        return snap
+    snap = _read_case(cid)
+    snap["run"] = marker
+    if marker is not None:
+        st.session_state["_case_snapshot"] = snap
+    return snap
+
+def _current_snapshot(cid):
+    snap = st.session_state.get("_case_snapshot") if _run_marker() is not None else None
+    return snap if snap and snap["case_id"] == cid else None
+
+def _patch_snapshot(cid, updates):
+    """Applies a Firestore-style {dotted.path: value} update to the cached snapshot."""
+    snap = _current_snapshot(cid)
+    if not snap: return
+    for path, value in updates.items():
+        node = snap["data"]
+        *parents, leaf = path.split(".")
+        for p in parents:
+            node = node.setdefault(p, {})
+        node[leaf] = copy.deepcopy(value)
+
+def invalidate_snapshot():
+    st.session_state.pop("_case_snapshot", None)
+
+def _update_case(cid, updates, extra_ops=()):
+    """Writes case fields (plus any extra batch ops) and patches this run's snapshot.
+
+    With a snapshot the write is first tried on its version; when that holds,
+    the snapshot moves to the new version, so a later versioned save in the
+    same run does not trip over our own write. If someone else wrote in
+    between, the plain write goes through and the snapshot keeps its old
+    version, leaving their change to be merged by the next versioned save.
+    """
+    snap = _current_snapshot(cid)
+    write = ("update", _case_path(cid), updates)
+    versions = None
+    if snap and snap.get("version"):
+        try:
+            versions = db.write_batch([write + (snap["version"],)] + list(extra_ops))
+        except VersionConflict:
+            pass
+    if versions is None:
+        db.write_batch([write] + list(extra_ops))
+    _case_changed(cid)
+    _patch_snapshot(cid, updates)
+    if versions: snap["version"] = versions[0]
+
 def load_full_config():
     cid = get_active_case_id()
     if not cid or not db: return {}
-    doc = db.collection("arbitrations").document(cid).get()
-    return doc.to_dict() if doc.exists else {}
+    # Callers mutate what they get back before saving, so never hand out the cached dict itself.
+    return copy.deepcopy(_get_snapshot(cid)["data"])
 
 def load_structure(phase="phase2"):
     data = load_full_config()
@@ -220,7 +526,7 @@ def load_structure(phase="phase2"):
 
 def save_structure(new_questions, phase="phase2"):
     cid = get_active_case_id()
-    if cid and db: db.collection("arbitrations").document(cid).update({phase: new_questions})
+    if cid and db: _update_case(cid, {phase: new_questions})
 
 def get_release_status():
     data = load_full_config()
@@ -228,23 +534,54 @@ def get_release_status():
 
 def set_release_status(phase, status=True):
     cid = get_active_case_id()
-    if cid and db: db.collection("arbitrations").document(cid).update({f"{phase}_released": status})
+    if cid and db: _update_case(cid, {f"{phase}_released": status})
 
 def load_responses(phase="phase2"):
     data = load_full_config()
     return data.get("responses", {})
 
-def save_responses(all_resp, phase="phase2"):
+def save_responses(all_resp, phase="phase2", merge=None):
+    """Versioned write; if another user saved responses since this rerun loaded them,
+    `merge(base, mine, theirs)` (default three_way_merge) reconciles before retrying."""
     cid = get_active_case_id()
-    if cid and db: db.collection("arbitrations").document(cid).update({"responses": all_resp})
+    if cid and db: _versioned_update(_get_snapshot(cid), "responses", "responses", all_resp, merge or three_way_merge)
 
 def load_complex_data():
     data = load_full_config()
     return data.get("complex_data", {})
 
-def save_complex_data(key, sub_data):
+def save_complex_data(key, sub_data, merge=None):
+    """Versioned write of one complex_data section, reconciled with `merge` on conflict.
+
+    On split-layout cases the same callback is applied per edited item.
+    Returns the section as committed.
+    """
+    cid = get_active_case_id()
+    if not cid or not db: return None
+    snap = _get_snapshot(cid)
+    if key in ITEM_COLLECTIONS and snap["data"].get("storage_layout") == SPLIT_LAYOUT:
+        return _save_items(snap, key, sub_data, merge or three_way_merge)
+    return _versioned_update(snap, key, f"complex_data.{key}", sub_data, merge or three_way_merge)
+
+def append_cost_entry(ledger, entry):
+    """Appends one entry to a costs list (a party log, sealed_offers, payment_requests or final_submissions).
+
+    One small write however long the ledger is, and concurrent appends from
+    different parties cannot overwrite each other. The running totals in the
+    aggregates document are incremented in the same batch.
+    """
     cid = get_active_case_id()
-    if cid and db: db.collection("arbitrations").document(cid).update({f"complex_data.{key}": sub_data})
+    if not cid or not db: return
+    # Stamped so two identical entries stay distinct under ArrayUnion.
+    entry = {**entry, "logged_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    snap = _get_snapshot(cid)
+    if snap["data"].get("storage_layout") == SPLIT_LAYOUT:
+        _append_item(snap, "costs", ledger, entry)
+    else:
+        _write_with_aggregates(snap, [("update", _case_path(cid), {f"complex_data.costs.{ledger}": ArrayUnion([entry])})],
+                               "costs", {}, {ledger: [entry]})
+        _case_changed(cid)
+        invalidate_snapshot()
 
 def upload_file_to_cloud(uploaded_file):
     if not bucket or not uploaded_file: return None
@@ -260,9 +597,632 @@ def send_email_notification(to_emails, subject, body):
     cid = get_active_case_id()
     if cid and db:
         try:
-            new_note = {"date": datetime.now().strftime("%Y-%m-%d %H:%M"), "to_roles": ["Recipients"], "subject": subject, "body": body}
-            db.collection("arbitrations").document(cid).update({"complex_data.notifications": firestore.ArrayUnion([new_note])})
-            for email in to_emails: send_email_via_smtp(email, subject, body)
-        except: pass
+            outbox_ids = send_emails([(email, subject, body) for email in to_emails], case_id=cid)
+            new_note = {"date": datetime.now().strftime("%Y-%m-%d %H:%M"), "to_roles": ["Recipients"], "subject": subject, "body": body, "outbox_ids": outbox_ids}
+            snap = _get_snapshot(cid)
+            if snap["data"].get("storage_layout") == SPLIT_LAYOUT:
+                _append_item(snap, "notifications", None, new_note)
+            else:
+                db.update(_case_path(cid), {"complex_data.notifications": ArrayUnion([new_note])})
+                _case_changed(cid)
+                invalidate_snapshot()
+        except Exception as e:
+            st.error(f"Notification error: {e}")
+
+def update_case_meta(updates):
+    """Updates fields under `meta` of the active case, e.g. {"merits_decided": True}."""
+    cid = get_active_case_id()
+    if cid and db: _update_case(cid, {f"meta.{k}": v for k, v in updates.items()})
+
+def get_case_cache_stats():
+    cache = get_case_cache()
+    return cache.stats() if cache else {}
+
+def get_storage_stats():
+    """Per-operation call counts and cumulative seconds spent inside the storage backend."""
+    return {"backend": db.name, "ops": db.stats()} if db else {"backend": None, "ops": {}}
 
 def reset_database(): pass
+
+# --- 6. ITEM SUBCOLLECTIONS ---
+# Long-lived lists (cost ledgers, Redfern requests, timeline, delays,
+# notifications) live one-document-per-item under arbitrations/{case_id}/...
+# once a case is on SPLIT_LAYOUT, so adding or editing an entry is a single
+# small write and the case document stops growing with case age.
+# complex_data key -> (subcollection, field naming the list an item belongs to)
+SPLIT_LAYOUT = 2
+ITEM_COLLECTIONS = {
+    "costs": ("cost_entries", "ledger"),
+    "doc_prod": ("redfern_requests", "party"),
+    "timeline": ("timeline_events", None),
+    "delays": ("delays", None),
+    "notifications": ("notifications", None),
+}
+DEFAULT_GROUPS = {
+    "costs": ["claimant_log", "respondent_log", "tribunal_log", "common_log", "payment_requests", "sealed_offers", "final_submissions"],
+    "doc_prod": ["claimant", "respondent"],
+}
+_BATCH_LIMIT = 400
+_id_lock = threading.Lock()
+_last_id_ns = 0
+
+def _new_item_id():
+    """Time-ordered document id, so streaming a subcollection returns items in insertion order."""
+    global _last_id_ns
+    with _id_lock:
+        _last_id_ns = max(time.time_ns(), _last_id_ns + 1)
+        return f"{_last_id_ns:020d}-{secrets.token_hex(3)}"
+
+def _item_doc(item, group_field, group):
+    doc = dict(item)
+    if group_field: doc["_" + group_field] = group
+    return doc
+
+def _load_items(cid, embedded):
+    complex_data = copy.deepcopy(embedded)
+    ids, item_times = {}, {}
+    for key, (sub, group_field) in ITEM_COLLECTIONS.items():
+        _count("item_queries")
+        key_ids = {g: [] for g in DEFAULT_GROUPS.get(key, [None])}
+        if group_field:
+            target = complex_data.setdefault(key, {})
+            for g in key_ids: target.setdefault(g, [])
+        else:
+            target = complex_data.setdefault(key, [])
+        for doc in db.list(f"{_case_path(cid)}/{sub}"):
+            item = dict(doc.data)
+            group = item.pop("_" + group_field, None) if group_field else None
+            if group_field:
+                target.setdefault(group, []).append(item)
+            else:
+                target.append(item)
+            key_ids.setdefault(group, []).append(doc.id)
+            item_times[doc.id] = doc.version
+        ids[key] = key_ids
+    return complex_data, ids, item_times
+
+def _commit(ops):
+    """ops: [(path, data or None for delete)], committed in Firestore-sized batches.
+
+    Returns the new document versions in op order.
+    """
+    versions = []
+    for i in range(0, len(ops), _BATCH_LIMIT):
+        chunk = ops[i:i + _BATCH_LIMIT]
+        versions.extend(db.write_batch([("delete", p, None) if d is None else ("set", p, d) for p, d in chunk]))
+    return versions
+
+def _item_key(item):
+    return json.dumps(item, sort_keys=True, default=str)
+
+def _align_items(old_list, old_ids, new_list):
+    """Pairs each new item with the id of the stored item it continues (None for new items).
+
+    Unchanged items are matched by value, so removing or editing one item
+    leaves the ids of all the others alone. Returns [(item, id, old item)]
+    and [(id, old item)] of the removed ones.
+    """
+    matcher = difflib.SequenceMatcher(None, [_item_key(x) for x in old_list], [_item_key(x) for x in new_list], autojunk=False)
+    pairs, removed = [], []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        kept = min(i2 - i1, j2 - j1) if tag in ("equal", "replace") else 0
+        pairs.extend((new_list[j1 + n], old_ids[i1 + n], old_list[i1 + n]) for n in range(kept))
+        pairs.extend((item, None, None) for item in new_list[j1 + kept:j2])
+        removed.extend(zip(old_ids[i1 + kept:i2], old_list[i1 + kept:i2]))
+    return pairs, removed
+
+def _save_items(snap, key, sub_data, merge):
+    """Writes only the items that differ from the snapshot, diffed by item identity. Returns the section as committed.
+
+    Edits are versioned per item document; new and removed items go out in
+    one batch per group (see _commit_items). Items load in id order and new
+    ids sort last, so an item inserted before existing ones moves those after
+    it to fresh ids.
+    """
+    cid = snap["case_id"]
+    sub, group_field = ITEM_COLLECTIONS[key]
+    col = f"{_case_path(cid)}/{sub}"
+    current = snap["data"].setdefault("complex_data", {})
+    key_ids = snap["ids"].setdefault(key, {})
+    groups = sub_data.items() if group_field else [(None, sub_data)]
+    embedded, changed = {}, False
+    for group, new_list in groups:
+        if not isinstance(new_list, list):
+            embedded[f"complex_data.{key}.{group}"] = new_list
+            continue
+        old_list = current.get(key, {}).get(group, []) if group_field else current.get(key, [])
+        old_ids = key_ids.get(group, [])
+        known = min(len(old_list), len(old_ids))
+        pairs, removed = _align_items(old_list[:known], old_ids[:known], new_list)
+        removed += [(item_id, {}) for item_id in old_ids[known:]]
+        new_ids, saved, created, inserted = [], [], [], False
+        for item, item_id, base in pairs:
+            if item_id is not None and inserted:
+                removed.append((item_id, base))
+                item_id = None
+            if item_id is None:
+                inserted = True
+                item_id = _new_item_id()
+                created.append((item_id, item))
+            elif item != base:
+                item = _versioned_item_update(snap, f"{col}/{item_id}", base, item, group_field, group, merge, key)
+                changed = True
+                if item is None: continue  # deleted by someone else
+            new_ids.append(item_id)
+            saved.append(item)
+        if created or removed:
+            _commit_items(snap, key, col, group_field, group, created, removed)
+            changed = True
+        key_ids[group] = new_ids
+        if group_field: current.setdefault(key, {})[group] = copy.deepcopy(saved)
+        else: current[key] = copy.deepcopy(saved)
+    if changed: _case_changed(cid)
+    if embedded: _update_case(cid, embedded)
+    return copy.deepcopy(current.get(key))
+
+def _commit_items(snap, key, col, group_field, group, created, removed):
+    """Creates and deletes one group's item documents, each batch carrying its aggregate delta.
+
+    Deletes are conditioned on the version the snapshot read, so the delta
+    subtracts exactly what is removed; on conflict the removed items are
+    re-read (and dropped if someone else already deleted them).
+    """
+    size = (_BATCH_LIMIT - 1) // 2  # leaves room for the aggregates op
+    for i in range(0, max(len(created), len(removed)), size):
+        creates, deletes = created[i:i + size], removed[i:i + size]
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            ops = [("delete", f"{col}/{item_id}", None, snap["item_times"].get(item_id)) for item_id, _ in deletes]
+            ops += [("set", f"{col}/{item_id}", _item_doc(item, group_field, group)) for item_id, item in creates]
+            agg_ops, aggregates = [], None
+            if key in AGGREGATED_SECTIONS:
+                agg_ops, aggregates = _aggregate_ops(snap, *_delta_counters(
+                    key, {group: [old for _, old in deletes if old]}, {group: [item for _, item in creates]}))
+            try:
+                versions = db.write_batch(ops + agg_ops)
+            except VersionConflict:
+                _count_contention("retries")
+                if agg_ops: _refresh_aggregates(snap)
+                fresh = []
+                for item_id, _ in deletes:
+                    doc = db.get(f"{col}/{item_id}")
+                    if doc.exists:
+                        old = dict(doc.data)
+                        if group_field: old.pop("_" + group_field, None)
+                        snap["item_times"][item_id] = doc.version
+                        fresh.append((item_id, old))
+                deletes = fresh
+                continue
+            if agg_ops: snap["aggregates"] = aggregates
+            for (item_id, _), version in zip(creates, versions[len(deletes):]):
+                snap["item_times"][item_id] = version
+            break
+        else:
+            _count_contention("failures")
+            raise WriteConflictError(f"Could not save '{key}' items after {MAX_WRITE_ATTEMPTS} attempts.")
+
+def _append_item(snap, key, group, item):
+    """Adds one item as its own document; no read of the existing list is needed."""
+    sub, group_field = ITEM_COLLECTIONS[key]
+    item_id = _new_item_id()
+    versions = _write_with_aggregates(snap, [("set", f"{_case_path(snap['case_id'])}/{sub}/{item_id}", _item_doc(item, group_field, group))],
+                                      key, {}, {group: [item]})
+    snap["item_times"][item_id] = versions[0]
+    _case_changed(snap["case_id"])
+    current = snap["data"].setdefault("complex_data", {})
+    key_ids = snap["ids"].setdefault(key, {})
+    target = current.setdefault(key, {}).setdefault(group, []) if group_field else current.setdefault(key, [])
+    target.append(copy.deepcopy(item))
+    key_ids.setdefault(group, []).append(item_id)
+    return item_id
+
+def migrate_case_to_subcollections(case_id):
+    """Moves a legacy single-document case onto SPLIT_LAYOUT. Returns the number of items moved.
+
+    Items are written before the layout flag flips, so readers keep using the
+    embedded arrays until every item is in place. Run it while the case is quiet:
+    array writes made to the legacy document mid-migration are not carried over.
+    """
+    if not db: return 0
+    doc = _read_case_doc(case_id)
+    if not doc.exists: return 0
+    data = doc.data
+    if data.get("storage_layout") == SPLIT_LAYOUT: return 0
+    embedded = data.get("complex_data", {})
+    ops, updates = [], {"storage_layout": SPLIT_LAYOUT}
+    for key, (sub, group_field) in ITEM_COLLECTIONS.items():
+        col = f"{_case_path(case_id)}/{sub}"
+        value = embedded.get(key)
+        if group_field and isinstance(value, dict):
+            for group, items in value.items():
+                if isinstance(items, list):
+                    ops.extend((f"{col}/{_new_item_id()}", _item_doc(i, group_field, group)) for i in items)
+                    updates[f"complex_data.{key}.{group}"] = DELETE
+        elif isinstance(value, list):
+            ops.extend((f"{col}/{_new_item_id()}", dict(i)) for i in value)
+            updates[f"complex_data.{key}"] = DELETE
+    _commit(ops)
+    db.update(_case_path(case_id), updates)
+    _case_changed(case_id)
+    if get_active_case_id() == case_id: invalidate_snapshot()
+    return len(ops)
+
+def migrate_all_cases():
+    if not db: return {}
+    return {doc.id: migrate_case_to_subcollections(doc.id) for doc in db.list("arbitrations", fields=["storage_layout"])}
+
+def delete_case(case_id):
+    """Deletes a case including its item subcollections (Firestore does not cascade)."""
+    if not db: return
+    ops = []
+    for sub, _ in ITEM_COLLECTIONS.values():
+        ops.extend((f"{_case_path(case_id)}/{sub}/{d.id}", None) for d in db.list(f"{_case_path(case_id)}/{sub}", fields=[]))
+    ops.append((_case_path(case_id), None))
+    ops.append((f"case_index/{case_id}", None))
+    ops.append((_aggregates_path(case_id), None))
+    ops.extend((_credential_path(case_id, role), None) for role in CREDENTIAL_ROLES)
+    for sub in ("memo_cache", "memo_drafts"):
+        ops.extend((f"{_case_path(case_id)}/{sub}/{d.id}", None) for d in db.list(f"{_case_path(case_id)}/{sub}", fields=[]))
+    # Queued or dead-lettered invitations still hold setup PINs in their bodies
+    ops.extend((f"email_outbox/{d.id}", None) for d in db.list("email_outbox", where=[("case_id", "==", case_id)], fields=[]))
+    _commit(ops)
+    _case_changed(case_id)
+    _MIGRATED_CASES.discard(case_id)
+
+# --- 7. OPTIMISTIC CONCURRENCY ---
+# Sections written by save_responses / save_complex_data carry a revision
+# counter under `revisions.<section>`. A write is sent with the snapshot's
+# document version as precondition; if the document moved on, the section is
+# re-read and, only when its revision changed, reconciled through the merge
+# callback before retrying. Item documents on split cases are versioned by
+# their own document version.
+MAX_WRITE_ATTEMPTS = 5
+CONTENTION_STATS = {"conflicts": 0, "retries": 0, "failures": 0}
+_MISSING = object()
+
+class WriteConflictError(RuntimeError):
+    pass
+
+def get_contention_stats():
+    with _stats_lock:
+        return dict(CONTENTION_STATS)
+
+def _count_contention(stat):
+    with _stats_lock:
+        CONTENTION_STATS[stat] += 1
+
+def three_way_merge(base, mine, theirs):
+    """Default merge callback: keeps both sides' changes, preferring mine where both edited the same value.
+
+    _MISSING stands for an absent dict key, so a key one side deleted stays
+    deleted unless the other side changed it. Lists are merged by item
+    identity (see _list_identities), keeping additions and removals from both
+    sides.
+    """
+    if mine == base: return theirs
+    if theirs == base: return mine
+    if isinstance(mine, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for k in list(theirs) + [k for k in mine if k not in theirs]:
+            v = three_way_merge(base.get(k, _MISSING), mine.get(k, _MISSING), theirs.get(k, _MISSING))
+            if v is not _MISSING: merged[k] = v
+        return merged
+    if isinstance(mine, list) and isinstance(theirs, list) and isinstance(base, list):
+        return _merge_lists(base, mine, theirs)
+    return mine
+
+def _list_identities(items):
+    """Stable identity per list item: a dict's "id" if it has one, else its value (repeats numbered)."""
+    seen, keys = {}, []
+    for item in items:
+        if isinstance(item, dict) and "id" in item:
+            ident = ("id", json.dumps(item["id"], sort_keys=True, default=str))
+        else:
+            ident = ("value", json.dumps(item, sort_keys=True, default=str))
+        seen[ident] = seen.get(ident, 0) + 1
+        keys.append((ident, seen[ident]))
+    return keys
+
+def _merge_lists(base, mine, theirs):
+    """Mine's order with their removals applied (unless I edited the item) and their additions appended."""
+    base_items = dict(zip(_list_identities(base), base))
+    their_items = dict(zip(_list_identities(theirs), theirs))
+    mine_keys = _list_identities(mine)
+    merged = []
+    for key, item in zip(mine_keys, mine):
+        if key not in base_items:
+            merged.append(item)  # added by me
+        elif key in their_items:
+            merged.append(three_way_merge(base_items[key], item, their_items[key]))
+        elif item != base_items[key]:
+            merged.append(item)  # they removed it, I edited it: keep my edit
+    mine_keys = set(mine_keys)
+    merged.extend(item for key, item in their_items.items() if key not in base_items and key not in mine_keys)
+    return merged
+
+def _get_path(data, path):
+    node = data
+    for p in path.split("."):
+        if not isinstance(node, dict) or p not in node: return None
+        node = node[p]
+    return node
+
+def _versioned_update(snap, section, field_path, value, merge):
+    """Writes one section under the document version it was merged against. Returns the value committed.
+
+    For costs / doc_prod the aggregate counters move, in the same batch, by
+    the difference between the stored section (which the precondition pins)
+    and the committed one.
+    """
+    cid = snap["case_id"]
+    base = stored = _get_path(snap["data"], field_path)
+    base_rev = snap["data"].get("revisions", {}).get(section, 0)
+    version = snap["version"]
+    retried = False
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        updates = {field_path: value, f"revisions.{section}": base_rev + 1}
+        agg_ops, aggregates = [], None
+        if section in AGGREGATED_SECTIONS:
+            agg_ops, aggregates = _aggregate_ops(snap, *_delta_counters(section, stored, value), stored={section: stored})
+        try:
+            if agg_ops:
+                new_version = db.write_batch([("update", _case_path(cid), updates, version)] + agg_ops)[0]
+            else:
+                new_version = db.update(_case_path(cid), updates, expected_version=version)
+        except VersionConflict:
+            retried = True
+            _count_contention("retries")
+            if agg_ops: _refresh_aggregates(snap)
+            doc = _read_case_doc(cid)
+            data = doc.data or {}
+            version = doc.version
+            stored = _get_path(data, field_path)
+            current_rev = data.get("revisions", {}).get(section, 0)
+            # Appends change a section without bumping its revision
+            if current_rev != base_rev or stored != base:
+                _count_contention("conflicts")
+                value = merge(base, value, stored)
+                base, base_rev = stored, current_rev
+            continue
+        if agg_ops: snap["aggregates"] = aggregates
+        _patch_snapshot(cid, updates)
+        _case_changed(cid)
+        # Only advance the snapshot version if nothing else changed in between;
+        # otherwise later writes in this run re-check their own sections.
+        if not retried:
+            snap["version"] = new_version
+        return value
+    _count_contention("failures")
+    raise WriteConflictError(f"Could not save '{section}' after {MAX_WRITE_ATTEMPTS} attempts.")
+
+def _versioned_item_update(snap, path, base, item, group_field, group, merge, key=None):
+    """Writes one edited item under its document version; costs / doc_prod items move the aggregates in the same batch.
+
+    Returns the saved item, or None if someone else deleted it meanwhile: the
+    edit is dropped rather than recreating the item.
+    """
+    item_id = path.rsplit("/", 1)[-1]
+    version = snap["item_times"].get(item_id)
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        doc = _item_doc(item, group_field, group)
+        old = _item_doc(base, group_field, group)
+        updates = {k: v for k, v in doc.items() if old.get(k, _MISSING) != v}
+        updates.update({k: DELETE for k in old if k not in doc})
+        if not updates: return item
+        write = ("set", path, doc) if version is None else ("update", path, updates, version)
+        agg_ops, aggregates = [], None
+        if key in AGGREGATED_SECTIONS:
+            agg_ops, aggregates = _aggregate_ops(snap, *_delta_counters(key, {group: [base] if base else []}, {group: [item]}))
+        try:
+            new_version = db.write_batch([write] + agg_ops)[0]
+        except VersionConflict:
+            _count_contention("retries")
+            if agg_ops: _refresh_aggregates(snap)
+            current = db.get(path)
+            if not current.exists:
+                _count_contention("conflicts")
+                snap["item_times"].pop(item_id, None)
+                return None
+            version = current.version
+            theirs = dict(current.data)
+            if group_field: theirs.pop("_" + group_field, None)
+            if theirs != base:
+                _count_contention("conflicts")
+                item = merge(base, item, theirs)
+                base = theirs
+            continue
+        if agg_ops: snap["aggregates"] = aggregates
+        snap["item_times"][item_id] = new_version
+        _case_changed(snap["case_id"])
+        return item
+    _count_contention("failures")
+    raise WriteConflictError(f"Could not save item {item_id} after {MAX_WRITE_ATTEMPTS} attempts.")
+
+# --- 8. COST AGGREGATES ---
+# Running totals live in arbitrations/{case_id}/aggregates/summary so that
+# dashboards and the cost memo read a small summary instead of re-summing
+# the ledgers:
+#   costs.<ledger>.total / count / by_phase.<k> / by_category.<k> / by_month.<k>
+#   doc_prod.<party>.total / <status>
+# Every write to these sections carries its Increments in the same batch as
+# the data: an append adds the entry's counters, a save the difference
+# between the stored and the committed value (pinned by the write's version
+# precondition), so the summary cannot drift from the ledgers.
+# Counter keys are slugged into plain Firestore field names; `labels` maps
+# them back to the original phase / category / month / status text.
+AGGREGATED_SECTIONS = ("costs", "doc_prod")
+
+def _aggregates_path(cid):
+    return f"{_case_path(cid)}/aggregates/summary"
+
+def _agg_key(value):
+    slug = re.sub(r"[^a-z0-9]+", "_", str(value).lower()).strip("_") or "none"
+    return slug if slug[0].isalpha() else f"k_{slug}"
+
+def _entry_amount(entry):
+    try:
+        return float(entry.get("amount", 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+def _section_counters(key, section):
+    """Flat {dotted counter path: number} and {key: label} for a costs or doc_prod section."""
+    counters, labels = {}, {}
+    def add(path, n):
+        counters[path] = counters.get(path, 0) + n
+    for group, entries in (section or {}).items():
+        if not isinstance(entries, list): continue
+        if key == "costs":
+            if not str(group).endswith("_log"): continue
+            base = f"costs.{_agg_key(group)}"
+            for e in entries:
+                amount = _entry_amount(e)
+                add(f"{base}.total", amount)
+                add(f"{base}.count", 1)
+                for dim, label in (("by_phase", e.get("phase")), ("by_category", e.get("category")), ("by_month", str(e.get("date") or "")[:7])):
+                    label = label or "Unspecified"
+                    labels[_agg_key(label)] = label
+                    add(f"{base}.{dim}.{_agg_key(label)}", amount)
+        elif key == "doc_prod":
+            base = f"doc_prod.{_agg_key(group)}"
+            for r in entries:
+                status = r.get("status") or "Pending"
+                labels[_agg_key(status)] = status
+                add(f"{base}.total", 1)
+                add(f"{base}.{_agg_key(status)}", 1)
+    return counters, labels
+
+def _compute_aggregates(complex_data):
+    aggregates = {"costs": {}, "doc_prod": {}, "labels": {}}
+    for key in AGGREGATED_SECTIONS:
+        counters, labels = _section_counters(key, complex_data.get(key))
+        storage.apply_updates(aggregates, {**counters, **{f"labels.{k}": v for k, v in labels.items()}})
+    return aggregates
+
+def _aggregate_ops(snap, counters, labels, stored=None):
+    """Batch ops adding `counters` to the case's aggregates, plus the aggregates after them.
+
+    The ops describe a data write in the same batch, which the snapshot does
+    not contain yet. A case without an aggregates document gets one seeded
+    from the snapshot (with `stored` sections overriding it) plus the
+    counters; it is only created if still absent, so a concurrent first
+    writer fails the batch with VersionConflict instead of being overwritten.
+    """
+    counters = {p: n for p, n in counters.items() if n}
+    current = snap.get("aggregates")
+    path = _aggregates_path(snap["case_id"])
+    if current is None:
+        # Case predates aggregates: seed the document from what we hold.
+        seeded = _compute_aggregates({**snap["data"].get("complex_data", {}), **(stored or {})})
+        storage.apply_updates(seeded, {**{p: Increment(n) for p, n in counters.items()},
+                                       **{f"labels.{k}": v for k, v in labels.items()}})
+        return [("create", path, seeded)], seeded
+    known = current.get("labels", {})
+    updates = {p: Increment(n) for p, n in counters.items()}
+    updates.update({f"labels.{k}": v for k, v in labels.items() if known.get(k) != v})
+    if not updates: return [], current
+    after = storage.apply_updates(copy.deepcopy(current), updates)
+    return [("update", path, updates)], after
+
+def _delta_counters(key, before, after):
+    """Counter changes taking a section from `before` to `after`, and the labels of `after`."""
+    new_counters, labels = _section_counters(key, after)
+    old_counters, _ = _section_counters(key, before)
+    return {p: new_counters.get(p, 0) - old_counters.get(p, 0) for p in set(new_counters) | set(old_counters)}, labels
+
+def _refresh_aggregates(snap):
+    snap["aggregates"] = db.get(_aggregates_path(snap["case_id"])).data
+
+def _write_with_aggregates(snap, ops, key, before, after):
+    """Commits precondition-free `ops` with the aggregate delta of `before` -> `after`. Returns the versions of `ops`."""
+    if key not in AGGREGATED_SECTIONS:
+        return db.write_batch(ops)
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        agg_ops, aggregates = _aggregate_ops(snap, *_delta_counters(key, before, after))
+        try:
+            versions = db.write_batch(ops + agg_ops)
+        except VersionConflict:  # someone else seeded the aggregates document first
+            _count_contention("retries")
+            _refresh_aggregates(snap)
+            continue
+        snap["aggregates"] = aggregates
+        return versions[:len(ops)]
+    _count_contention("failures")
+    raise WriteConflictError(f"Could not update the '{key}' aggregates after {MAX_WRITE_ATTEMPTS} attempts.")
+
+def load_cost_summary():
+    """Running cost and doc-production totals of the active case (see section 8)."""
+    cid = get_active_case_id()
+    if not cid or not db: return _compute_aggregates({})
+    snap = _get_snapshot(cid)
+    aggregates = snap.get("aggregates")
+    if aggregates is None:
+        aggregates = _compute_aggregates(snap["data"].get("complex_data", {}))
+    return copy.deepcopy(aggregates)
+
+def rebuild_cost_aggregates(case_id):
+    """Recomputes a case's aggregates document from its ledgers."""
+    if not db: return None
+    record = _load_case(case_id)
+    if not record["data"]: return None
+    aggregates = _compute_aggregates(record["data"].get("complex_data", {}))
+    db.set(_aggregates_path(case_id), aggregates)
+    _case_changed(case_id)
+    if get_active_case_id() == case_id: invalidate_snapshot()
+    return aggregates
+
+# --- 9. AI MEMO CACHE ---
+# Generated cost memoranda are stored under a fingerprint of everything that
+# goes into the prompt (computed metrics, award value, prompt version), so a
+# repeat request with unchanged data is one point read and costs no tokens:
+#   arbitrations/{cid}/memo_cache/{sha256}   text, model, created_at, last_used_at
+#   arbitrations/{cid}/memo_drafts/{id}      every generated draft, for comparison
+# Cache entries expire after MEMO_CACHE_TTL_SECONDS; beyond
+# MEMO_CACHE_MAX_ENTRIES the least recently used ones are evicted. A hit only
+# writes last_used_at back when the stored value is older than
+# MEMO_CACHE_TOUCH_SECONDS, so repeated hits stay pure reads and eviction
+# order is kept to that granularity. Drafts are kept up to MEMO_HISTORY_MAX,
+# oldest dropped first.
+def memo_fingerprint(inputs):
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def _memo_path(case_id, fingerprint):
+    return f"{_case_path(case_id)}/memo_cache/{fingerprint}"
+
+def _prune(collection, order_field, keep):
+    stale = db.list(collection, order_by=order_field, descending=True, fields=[order_field])[keep:]
+    if stale: _commit([(f"{collection}/{d.id}", None) for d in stale])
+
+def get_cached_memo(case_id, fingerprint):
+    """The cached draft for `fingerprint` as a dict, or None when missing or expired."""
+    if not db: return None
+    doc = db.get(_memo_path(case_id, fingerprint))
+    if not doc.exists: return None
+    now = time.time()
+    if now - doc.data.get("created_at", 0) > float(_setting("MEMO_CACHE_TTL_SECONDS", 7 * 86400)):
+        return None
+    if now - doc.data.get("last_used_at", 0) > float(_setting("MEMO_CACHE_TOUCH_SECONDS", 3600)):
+        db.update(_memo_path(case_id, fingerprint), {"last_used_at": now})
+    return {"fingerprint": fingerprint, **doc.data}
+
+def store_memo(case_id, fingerprint, text, model, award):
+    """Caches a generated draft and adds it to the case's draft history. Returns the draft id."""
+    if not db: return None
+    now = time.time()
+    draft_id = _new_item_id()
+    db.write_batch([
+        ("set", _memo_path(case_id, fingerprint), {"text": text, "model": model, "award": award,
+                                                    "created_at": now, "last_used_at": now}),
+        ("set", f"{_case_path(case_id)}/memo_drafts/{draft_id}", {"fingerprint": fingerprint, "text": text, "model": model,
+                                                                   "award": award, "created_at": now})
+    ])
+    _prune(f"{_case_path(case_id)}/memo_cache", "last_used_at", int(_setting("MEMO_CACHE_MAX_ENTRIES", 20)))
+    _prune(f"{_case_path(case_id)}/memo_drafts", "created_at", int(_setting("MEMO_HISTORY_MAX", 50)))
+    return draft_id
+
+def get_memo_history(case_id, limit=20):
+    """Generated drafts of a case, newest first, as dicts including `id`."""
+    if not db: return []
+    docs = db.list(f"{_case_path(case_id)}/memo_drafts", order_by="created_at", descending=True, limit=limit)
+    return [{"id": d.id, **d.data} for d in docs]
@@ -0,0 +1,54 @@
+"""Process-wide, size-bounded cache of generated document bytes.
+
+Rendering a .docx (python-docx / docxtpl plus zip serialisation) is far more
+expensive than handing out bytes, and the same document is often requested
+again: a rerun after an unrelated widget change, a second download, another
+arbitrator on the same case. Callers key entries by everything the document
+depends on, so an entry never has to be invalidated; least-recently-used
+entries are evicted beyond `max_entries` or `max_bytes`.
+"""
+import threading
+from collections import OrderedDict
+
+
+class BytesCache:
+    def __init__(self, max_entries=32, max_bytes=64 * 2 ** 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._stats = {"hits": 0, "builds": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def get_or_build(self, key, build):
+        """Cached bytes for `key`, calling build() -> bytes on a miss."""
+        data = self.get(key)
+        if data is None:
+            data = build()
+            with self._lock:
+                self._stats["builds"] += 1
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._size}
@@ -0,0 +1,402 @@
+"""Model access for ai_logic: cached handles, circuit breaker and metrics.
+
+vertexai.init and GenerativeModel construction happen once per process
+(ModelRouter is held in st.cache_resource by ai_logic), not once per draft.
+
+The router walks the fallback chain, but a circuit breaker remembers models
+that recently failed and skips them until their cool-down has passed:
+  - NotFound / Forbidden (model not enabled for the project): open for
+    `unavailable_cooldown` seconds straight away;
+  - any other error: open for `cooldown` seconds after `failure_threshold`
+    consecutive failures.
+After the cool-down a single trial call is let through (half-open) and every
+other caller keeps skipping the model until it reports back; success closes
+the circuit, failure opens it again. A trial that never reports back (its
+call was cancelled) expires after `cooldown` seconds.
+
+generate_hedged() races the chain instead of walking it (see its
+docstring), generate_stream() yields text as it arrives, and StubBackend
+stands in for Vertex AI offline.
+
+Per-model call counts, errors and latency (MODEL_METRICS) and circuit state
+(MODEL_BREAKER) are process-wide; model_health() merges them for the Debug
+Manager.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_MODELS = ["gemini-2.5-pro", "gemini-2.5-flash", "gemini-2.0-flash-001", "gemini-1.5-pro-001"]
+
+
+class AllModelsUnavailable(RuntimeError):
+    pass
+
+
+# ==============================================================================
+# METRICS
+# ==============================================================================
+class ModelMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _entry(self, model):
+        return self._models.setdefault(model, {
+            "calls": 0, "successes": 0, "errors": 0, "skipped_open": 0, "hedged": 0, "abandoned": 0,
+            "streams": 0, "ttft_seconds": 0.0, "max_ttft_seconds": 0.0,
+            "total_seconds": 0.0, "max_seconds": 0.0, "last_error": None, "errors_by_type": {}
+        })
+
+    def record(self, model, seconds, error=None, ttft=None):
+        """ttft: seconds to the first streamed chunk, for streamed calls that produced one."""
+        with self._lock:
+            m = self._entry(model)
+            m["calls"] += 1
+            if ttft is not None:
+                m["streams"] += 1
+                m["ttft_seconds"] += ttft
+                m["max_ttft_seconds"] = max(m["max_ttft_seconds"], ttft)
+            m["total_seconds"] += seconds
+            m["max_seconds"] = max(m["max_seconds"], seconds)
+            if error is None:
+                m["successes"] += 1
+            else:
+                m["errors"] += 1
+                m["last_error"] = f"{type(error).__name__}: {error}"[:200]
+                name = type(error).__name__
+                m["errors_by_type"][name] = m["errors_by_type"].get(name, 0) + 1
+
+    def count(self, model, key):
+        with self._lock:
+            self._entry(model)[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                model: {**m, "errors_by_type": dict(m["errors_by_type"]),
+                        "avg_ms": round(m["total_seconds"] * 1000 / m["calls"], 1) if m["calls"] else 0.0,
+                        "avg_ttft_ms": round(m["ttft_seconds"] * 1000 / m["streams"], 1) if m["streams"] else 0.0}
+                for model, m in self._models.items()
+            }
+
+
+MODEL_METRICS = ModelMetrics()
+
+
+# ==============================================================================
+# CIRCUIT BREAKER
+# ==============================================================================
+class CircuitBreaker:
+    def __init__(self, failure_threshold=2, cooldown=60.0, unavailable_cooldown=3600.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.unavailable_cooldown = unavailable_cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = {}  # model -> {"failures": int, "open_until": float, "trial_until": float}
+
+    def _available(self, state, now):
+        """Closed, or cooled down with no trial call in flight."""
+        if state is None or not state["open_until"]:
+            return True
+        return state["open_until"] <= now and state["trial_until"] <= now
+
+    def available(self, model):
+        """Whether allow() would let a call through; does not claim the half-open trial."""
+        with self._lock:
+            return self._available(self._state.get(model), self.clock())
+
+    def allow(self, model):
+        """Whether to call the model now. The caller must report success() or failure()
+        (or release() if the call is dropped before it runs)."""
+        now = self.clock()
+        with self._lock:
+            state = self._state.get(model)
+            if not self._available(state, now):
+                return False
+            if state is not None and state["open_until"]:
+                state["trial_until"] = now + self.cooldown
+            return True
+
+    def release(self, model):
+        """Gives back a trial claimed by allow() for a call that never ran."""
+        with self._lock:
+            state = self._state.get(model)
+            if state is not None:
+                state["trial_until"] = 0.0
+
+    def success(self, model):
+        with self._lock:
+            self._state.pop(model, None)
+
+    def failure(self, model, unavailable=False):
+        with self._lock:
+            state = self._state.setdefault(model, {"failures": 0, "open_until": 0.0, "trial_until": 0.0})
+            trial = state["trial_until"] > 0
+            state["failures"] += 1
+            state["trial_until"] = 0.0
+            if unavailable:
+                state["open_until"] = self.clock() + self.unavailable_cooldown
+            elif trial or state["failures"] >= self.failure_threshold:
+                state["open_until"] = self.clock() + self.cooldown
+
+    def status(self):
+        now = self.clock()
+        with self._lock:
+            return {
+                model: {"failures": s["failures"], "open": s["open_until"] > now,
+                        "trial": s["trial_until"] > now,
+                        "retry_in_s": round(max(0.0, s["open_until"] - now), 1)}
+                for model, s in self._state.items()
+            }
+
+
+MODEL_BREAKER = CircuitBreaker()
+
+# Shared by every router; hedged calls are short-lived and I/O bound.
+_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+
+
+def model_health():
+    """Per-model metrics plus circuit state for this process."""
+    health = MODEL_METRICS.snapshot()
+    for model, state in MODEL_BREAKER.status().items():
+        health.setdefault(model, {})["circuit"] = state
+    return health
+
+
+# ==============================================================================
+# BACKENDS
+# ==============================================================================
+class VertexBackend:
+    """Initialises Vertex AI once and hands out cached GenerativeModel handles."""
+    name = "vertex"
+
+    def __init__(self, project_id, credentials, location="us-central1"):
+        import vertexai
+        from vertexai.generative_models import GenerativeModel
+        vertexai.init(project=project_id, location=location, credentials=credentials)
+        self._model_cls = GenerativeModel
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def model(self, name):
+        with self._lock:
+            if name not in self._handles:
+                self._handles[name] = self._model_cls(name)
+            return self._handles[name]
+
+    def generate(self, name, prompt, max_output_tokens=None):
+        config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        return self.model(name).generate_content(prompt, generation_config=config).text
+
+    def stream(self, name, prompt, max_output_tokens=None):
+        config = {"max_output_tokens": max_output_tokens} if max_output_tokens else None
+        for chunk in self.model(name).generate_content(prompt, generation_config=config, stream=True):
+            if chunk.text: yield chunk.text
+
+    def is_unavailable(self, error):
+        try:
+            from google.api_core.exceptions import NotFound, Forbidden
+        except ImportError:
+            return False
+        return isinstance(error, (NotFound, Forbidden))
+
+
+class StubUnavailable(RuntimeError):
+    pass
+
+
+class StubBackend:
+    """Offline stand-in for Vertex AI with tunable latency and failure rates.
+
+    latency / error_rate apply to every model unless overridden in
+    per_model={model: {"latency": s, "error_rate": p}}; models listed in
+    `unavailable` fail like a model that is not enabled for the project.
+    """
+    name = "stub"
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, per_model=None, unavailable=(), seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.per_model = per_model or {}
+        self.unavailable = set(unavailable)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self, name):
+        if name in self.unavailable:
+            raise StubUnavailable(f"404 Publisher model {name} not found (stub)")
+        cfg = self.per_model.get(name, {})
+        with self._lock:
+            delay = cfg.get("latency", self.latency) * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+            fails = self._rng.random() < cfg.get("error_rate", self.error_rate)
+        return max(delay, 0.0), fails
+
+    def _words(self, name, prompt, max_output_tokens):
+        words = (f"**[Stub: {name}]** Draft memorandum generated offline from a prompt of "
+                 f"{len(prompt.split())} words. " + " ".join(prompt.split()[:300])).split()
+        return words[:max_output_tokens] if max_output_tokens else words
+
+    def generate(self, name, prompt, max_output_tokens=None):
+        delay, fails = self._draw(name)
+        time.sleep(delay)
+        if fails:
+            raise RuntimeError(f"503 Service Unavailable ({name} stub)")
+        return " ".join(self._words(name, prompt, max_output_tokens))
+
+    def stream(self, name, prompt, max_output_tokens=None, chunk_words=8):
+        """The latency is split between the first chunk (a fifth) and the rest."""
+        delay, fails = self._draw(name)
+        time.sleep(delay / 5)
+        if fails:
+            raise RuntimeError(f"503 Service Unavailable ({name} stub)")
+        words = self._words(name, prompt, max_output_tokens)
+        chunks = [" ".join(words[i:i + chunk_words]) + " " for i in range(0, len(words), chunk_words)]
+        for i, chunk in enumerate(chunks):
+            if i: time.sleep(delay * 4 / 5 / (len(chunks) - 1))
+            yield chunk
+
+    def is_unavailable(self, error):
+        return isinstance(error, StubUnavailable)
+
+
+# ==============================================================================
+# ROUTER
+# ==============================================================================
+class ModelRouter:
+    def __init__(self, backend, models=None, breaker=MODEL_BREAKER, metrics=MODEL_METRICS):
+        self.backend = backend
+        self.models = list(models or DEFAULT_MODELS)
+        self.breaker = breaker
+        self.metrics = metrics
+
+    def _call(self, model, prompt, max_output_tokens=None):
+        start = time.perf_counter()
+        try:
+            text = self.backend.generate(model, prompt, max_output_tokens)
+        except Exception as e:
+            self.metrics.record(model, time.perf_counter() - start, e)
+            self.breaker.failure(model, unavailable=self.backend.is_unavailable(e))
+            raise
+        self.metrics.record(model, time.perf_counter() - start)
+        self.breaker.success(model)
+        return text
+
+    def healthy_models(self):
+        """The fallback chain minus models whose circuit is open or whose trial call is in flight."""
+        return [model for model in self.models if self.breaker.available(model)]
+
+    def generate(self, prompt, max_output_tokens=None):
+        """Text from the first healthy model in the chain that answers; (text, model)."""
+        errors = []
+        for model in self.models:
+            if not self.breaker.allow(model):
+                self.metrics.count(model, "skipped_open")
+                continue
+            try:
+                return self._call(model, prompt, max_output_tokens), model
+            except Exception as e:
+                errors.append(f"{model}: {e}")
+        raise AllModelsUnavailable("; ".join(errors) or "every model is cooling down")
+
+    def generate_hedged(self, prompt, hedge_delay=2.0, max_output_tokens=2048, token_budget=4096, accept=None):
+        """First acceptable answer from a race down the chain; (text, model).
+
+        The first healthy model is called at once. Whenever `hedge_delay`
+        passes without an answer, or an in-flight call fails, the next healthy
+        model is started alongside it, as long as the token budget still
+        covers another `max_output_tokens`. A call that fails returns its
+        reservation, since it produced no output. Losing calls are abandoned: queued
+        ones are cancelled, running ones finish in the background and their
+        results are discarded.
+        """
+        accept = accept or (lambda text: bool(text and text.strip()))
+        queue = iter(self.healthy_models())
+        pending, errors = {}, []
+        budget = token_budget
+
+        def launch():
+            nonlocal budget
+            if budget < max_output_tokens: return False
+            model = next(queue, None)
+            while model is not None and not self.breaker.allow(model):
+                model = next(queue, None)
+            if model is None: return False
+            budget -= max_output_tokens
+            if pending: self.metrics.count(model, "hedged")
+            pending[_POOL.submit(self._call, model, prompt, max_output_tokens)] = model
+            return True
+
+        can_launch = launch()
+        while pending:
+            done, _ = wait(pending, timeout=hedge_delay if can_launch else None, return_when=FIRST_COMPLETED)
+            if not done:
+                can_launch = launch()
+                continue
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    text = future.result()
+                except Exception as e:
+                    errors.append(f"{model}: {e}")
+                    budget += max_output_tokens
+                    can_launch = launch()
+                    continue
+                if accept(text):
+                    for other, other_model in pending.items():
+                        if other.cancel(): self.breaker.release(other_model)
+                        self.metrics.count(other_model, "abandoned")
+                    return text, model
+                errors.append(f"{model}: unacceptable response")
+                can_launch = launch()
+        raise AllModelsUnavailable("; ".join(errors) or "every model is cooling down or the token budget is spent")
+
+    def generate_stream(self, prompt, max_output_tokens=None, on_model=None):
+        """Yields text chunks from the first healthy model in the chain that starts answering.
+
+        A model that fails before its first chunk is skipped like in
+        generate(); once text has been yielded, a failure is raised to the
+        caller since the partial answer cannot be taken back. on_model(model)
+        is called when a model's first chunk arrives. A stream the caller
+        closes early is recorded as abandoned.
+        """
+        errors = []
+        for model in self.models:
+            if not self.breaker.allow(model):
+                self.metrics.count(model, "skipped_open")
+                continue
+            start = time.perf_counter()
+            ttft, reported = None, False
+            try:
+                for chunk in self.backend.stream(model, prompt, max_output_tokens):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        if on_model: on_model(model)
+                    yield chunk
+                reported = True
+                self.metrics.record(model, time.perf_counter() - start, ttft=ttft)
+                self.breaker.success(model)
+                return
+            except Exception as e:
+                reported = True
+                self.metrics.record(model, time.perf_counter() - start, e, ttft=ttft)
+                self.breaker.failure(model, unavailable=self.backend.is_unavailable(e))
+                if ttft is not None: raise
+                errors.append(f"{model}: {e}")
+                continue
+            finally:
+                if not reported:
+                    # The caller closed the stream (a rerun or Stop): record the
+                    # call and hand back a half-open trial it may hold.
+                    self.metrics.record(model, time.perf_counter() - start, ttft=ttft)
+                    self.metrics.count(model, "abandoned")
+                    self.breaker.release(model)
+        raise AllModelsUnavailable("; ".join(errors) or "every model is cooling down")
+
+    def status(self):
+        breaker = self.breaker.status()
+        return {model: breaker.get(model, {"failures": 0, "open": False, "trial": False, "retry_in_s": 0.0}) for model in self.models}
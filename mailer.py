@@ -0,0 +1,155 @@
+"""Pooled SMTP delivery.
+
+Opening a connection, running STARTTLS and logging in costs several round
+trips, and used to be paid for every single message. PooledMailer keeps a
+few authenticated sessions open and sends whole batches over one of them,
+reconnecting transparently when the server has dropped an idle session.
+
+Point it at a local stand-in for testing, e.g.
+    python -m aiosmtpd -n -l localhost:8025
+with ST_MAIL_SERVER=localhost, ST_MAIL_PORT=8025, ST_MAIL_STARTTLS=false.
+"""
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+SMTPSettings = namedtuple("SMTPSettings", ["host", "port", "user", "password", "starttls"])
+
+# Connection-level failures: drop the session and retry on a fresh one.
+_RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError, ConnectionError, TimeoutError)
+# The server rejected the message itself; resending will not help.
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+
+def build_message(sender, to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = to_email
+    msg['Subject'] = f"[PROCEED] {subject}"
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
+
+
+class _Connection:
+    def __init__(self, server):
+        self.server = server
+        self.last_used = time.monotonic()
+
+
+class PooledMailer:
+    def __init__(self, settings, pool_size=2, idle_check_seconds=30, timeout=20, smtp_factory=smtplib.SMTP):
+        self.settings = settings
+        self.pool_size = pool_size
+        self.idle_check_seconds = idle_check_seconds
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+        self._idle = []
+        self._open = 0
+        self._cond = threading.Condition()
+        self.stats = {"connections": 0, "reconnects": 0, "sent": 0, "failed": 0}
+
+    # --- pool ---
+    def _connect(self):
+        s = self.settings
+        server = self.smtp_factory(s.host, s.port, timeout=self.timeout)
+        server.ehlo()
+        if s.starttls:
+            server.starttls()
+            server.ehlo()
+        if s.user and s.password and server.has_extn("auth"):
+            server.login(s.user, s.password)
+        self.stats["connections"] += 1
+        return _Connection(server)
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._open >= self.pool_size:
+                self._cond.wait()
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._open += 1
+                conn = None
+        if conn is None:
+            try:
+                return self._connect()
+            except Exception:
+                self._release(None)
+                raise
+        # Servers silently drop idle sessions; probe before trusting an old one.
+        if time.monotonic() - conn.last_used > self.idle_check_seconds:
+            try:
+                conn.server.noop()
+            except Exception:
+                self._close(conn)
+                self.stats["reconnects"] += 1
+                return self._connect()
+        return conn
+
+    def _release(self, conn):
+        with self._cond:
+            if conn is None:
+                self._open -= 1
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _close(self, conn):
+        try:
+            conn.server.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    # --- sending ---
+    def deliver(self, messages):
+        """Sends [(to_email, subject, body)] over one pooled session. Returns None or the exception, per message."""
+        try:
+            conn = self._checkout()
+        except Exception as e:
+            print(f"Email error: {e}")
+            self.stats["failed"] += len(messages)
+            return [e] * len(messages)
+        errors = []
+        try:
+            for to_email, subject, body in messages:
+                msg = build_message(self.settings.user, to_email, subject, body)
+                try:
+                    try:
+                        conn.server.send_message(msg)
+                    except _RECONNECT_ERRORS:
+                        self._close(conn)
+                        self.stats["reconnects"] += 1
+                        conn = None
+                        conn = self._connect()
+                        conn.server.send_message(msg)
+                    self.stats["sent"] += 1
+                    errors.append(None)
+                except Exception as e:
+                    print(f"Email error: {e}")
+                    self.stats["failed"] += 1
+                    errors.append(e)
+                    if conn is None:
+                        # Could not reconnect; the remaining messages fail the same way.
+                        remaining = len(messages) - len(errors)
+                        self.stats["failed"] += remaining
+                        return errors + [e] * remaining
+        finally:
+            self._release(conn)
+        return errors
+
+    def send_batch(self, messages):
+        return [e is None for e in self.deliver(messages)]
+
+    def send(self, to_email, subject, body):
+        return self.send_batch([(to_email, subject, body)])[0]
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from db import create_new_case, get_active_case_id, load_full_config, activate_user_account, login_user, get_all_cases_metadata, db
+from db import create_new_case, get_active_case_id, load_full_config, activate_user_account, login_user, get_all_cases_metadata, CASE_STATUSES, db
 
 st.set_page_config(page_title="PROCEED | Arbitration Cloud", layout="wide")
 
@@ -98,7 +98,25 @@ if st.session_state['is_lcia_admin'] and not st.session_state['active_case_id']:
     # --- TAB 1: LIST OF CASES (MANAGE) ---
     with tab_list:
         st.write("Select a case to manage questionnaires or view status.")
-        all_cases = get_all_cases_metadata()
+        PAGE_SIZE = 25
+        if 'case_page_cursors' not in st.session_state: st.session_state['case_page_cursors'] = [None]
+        
+        f_status = st.selectbox("Filter by Status", ["All"] + CASE_STATUSES, key="case_status_filter", on_change=lambda: st.session_state.update(case_page_cursors=[None]))
+        cursors = st.session_state['case_page_cursors']
+        all_cases = get_all_cases_metadata(
+            status=None if f_status == "All" else f_status,
+            page_size=PAGE_SIZE,
+            after=cursors[-1]
+        )
+        
+        p_prev, p_info, p_next = st.columns([1, 3, 1])
+        if p_prev.button("◀ Newer", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        p_info.caption(f"Page {len(cursors)}")
+        if p_next.button("Older ▶", disabled=len(all_cases) < PAGE_SIZE):
+            cursors.append(all_cases[-1])
+            st.rerun()
         
         if all_cases:
             data_for_table = []
@@ -145,9 +163,9 @@ if st.session_state['is_lcia_admin'] and not st.session_state['active_case_id']:
                             st.session_state['user_role'] = 'lcia'
                             
                             if email_count > 0:
-                                st.toast(f"✅ Sent {email_count} Invitation Emails!", icon="📧")
+                                st.toast(f"✅ Queued {email_count} Invitation Emails!", icon="📧")
                             else:
-                                st.toast("⚠️ Emails failed to send. Check Database.", icon="❌")
+                                st.toast("⚠️ Emails could not be queued. Check SMTP settings.", icon="❌")
                                 
                             st.success(f"Case {new_id} Created! Redirecting...")
                             st.rerun()
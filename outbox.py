@@ -0,0 +1,211 @@
+"""Durable email outbox drained by a background worker.
+
+Callers enqueue messages into the `email_outbox` collection and return
+straight away; a daemon thread picks up due messages in batches, hands each
+batch to one SMTP session and records the outcome on the message document:
+
+    queued -> sending -> sent
+                      -> queued (retry after exponential backoff)
+                      -> dead   (max_attempts reached or permanent rejection)
+
+Messages are claimed with a version precondition, so several app processes
+can drain the same outbox without sending anything twice. A message left in
+"sending" by a crashed process (or a crashed worker of this one) is requeued
+once its lease has expired; every worker checks for those every
+RECOVER_INTERVAL_SECONDS.
+
+Bodies can carry secrets (invitations include the setup PIN), so a body is
+only kept while it may still be delivered: it is removed in the same write
+that marks the message sent, and a dead-lettered message keeps it for
+`dead_retention_seconds` (long enough to press Retry) before the worker
+purges it.
+Querying queued messages by next_attempt_at needs a composite index
+(status ASC, next_attempt_at ASC) on Firestore.
+"""
+import random
+import secrets
+import threading
+import time
+
+from storage import DELETE, VersionConflict
+
+OUTBOX_STATUSES = ("queued", "sending", "sent", "dead")
+PURGE_INTERVAL_SECONDS = 600
+RECOVER_INTERVAL_SECONDS = 60
+
+
+class EmailOutbox:
+    def __init__(self, backend, deliver, collection="email_outbox", batch_size=20, max_attempts=6,
+                 base_delay=30, max_delay=3600, poll_seconds=10, lease_seconds=600, permanent_errors=(),
+                 dead_retention_seconds=86400):
+        """deliver([(to, subject, body)]) -> [None | exception] sends one batch over one connection."""
+        self.backend = backend
+        self.deliver = deliver
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.permanent_errors = permanent_errors
+        self.dead_retention_seconds = dead_retention_seconds
+        self._last_purge = 0.0
+        self._last_recover = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "sent": 0, "retried": 0, "dead": 0, "claim_conflicts": 0, "recovered": 0, "purged": 0, "worker_errors": 0}
+        self.last_worker_error = None
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self):
+        with self._stats_lock:
+            return {**self._stats, "last_worker_error": self.last_worker_error}
+
+    # --- producer side ---
+    def enqueue(self, messages, case_id=None):
+        """Persists [(to_email, subject, body)] and returns their outbox ids without waiting for SMTP."""
+        now = time.time()
+        ids, ops = [], []
+        for to_email, subject, body in messages:
+            msg_id = f"{time.time_ns():x}{secrets.token_hex(3)}"
+            ids.append(msg_id)
+            ops.append(("set", f"{self.collection}/{msg_id}", {
+                "case_id": case_id, "to": to_email, "subject": subject, "body": body,
+                "status": "queued", "attempts": 0, "created_at": now, "next_attempt_at": now
+            }))
+        if ops:
+            self.backend.write_batch(ops)
+            self._bump("enqueued", len(ops))
+            self._wake.set()
+        return ids
+
+    def messages(self, case_id):
+        """All outbox messages of a case, newest first, as dicts including `id`."""
+        docs = self.backend.list(self.collection, where=[("case_id", "==", case_id)])
+        return sorted(({"id": d.id, **d.data} for d in docs), key=lambda m: m["created_at"], reverse=True)
+
+    def retry(self, msg_id):
+        """Puts a dead-lettered message back in the queue with a fresh attempt budget.
+
+        Returns False when its body has already been purged and there is nothing to resend.
+        """
+        doc = self.backend.get(f"{self.collection}/{msg_id}")
+        if not doc.exists or "body" not in doc.data:
+            return False
+        self.backend.update(f"{self.collection}/{msg_id}", {
+            "status": "queued", "attempts": 0, "next_attempt_at": time.time(), "purge_after": DELETE
+        }, expected_version=doc.version)
+        self._wake.set()
+        return True
+
+    def purge_expired(self, now=None):
+        """Removes the bodies of dead-lettered messages past their retention. Returns how many."""
+        now = time.time() if now is None else now
+        ops = [("update", f"{self.collection}/{d.id}", {"body": DELETE, "purge_after": DELETE})
+               for d in self.backend.list(self.collection, where=[("status", "==", "dead")])
+               if "body" in d.data and d.data.get("purge_after", 0) <= now]
+        if ops:
+            self.backend.write_batch(ops)
+            self._bump("purged", len(ops))
+        return len(ops)
+
+    # --- worker side ---
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+        return self
+
+    def _worker_error(self, e):
+        self.last_worker_error = f"{type(e).__name__}: {e}"
+        self._bump("worker_errors")
+
+    def _run(self):
+        while True:
+            self.maintain()
+            try:
+                busy = self.drain_once() == self.batch_size
+            except Exception as e:
+                self._worker_error(e)
+                busy = False
+            if not busy:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def maintain(self, now=None):
+        """Runs the periodic jobs that are due: lease recovery and purging expired bodies."""
+        now = time.time() if now is None else now
+        if now - self._last_recover >= RECOVER_INTERVAL_SECONDS:
+            self._last_recover = now
+            try:
+                self.recover_expired_leases(now)
+            except Exception as e:
+                self._worker_error(e)
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            try:
+                self.purge_expired(now)
+            except Exception as e:
+                self._worker_error(e)
+
+    def recover_expired_leases(self, now=None):
+        """Requeues messages whose sender stopped before recording an outcome. Returns how many."""
+        cutoff = (time.time() if now is None else now) - self.lease_seconds
+        recovered = 0
+        for doc in self.backend.list(self.collection, where=[("status", "==", "sending")]):
+            if doc.data.get("claimed_at", 0) < cutoff:
+                try:
+                    self.backend.update(f"{self.collection}/{doc.id}", {"status": "queued"}, expected_version=doc.version)
+                except VersionConflict:
+                    continue
+                recovered += 1
+        self._bump("recovered", recovered)
+        return recovered
+
+    def _backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def drain_once(self):
+        """Claims and sends one batch of due messages. Returns how many were claimed."""
+        now = time.time()
+        due = [d for d in self.backend.list(self.collection, where=[("status", "==", "queued")],
+                                            order_by="next_attempt_at", limit=self.batch_size)
+               if d.data["next_attempt_at"] <= now]
+        claimed = []
+        for doc in due:
+            attempts = doc.data.get("attempts", 0) + 1
+            try:
+                self.backend.update(f"{self.collection}/{doc.id}",
+                                    {"status": "sending", "attempts": attempts, "claimed_at": now},
+                                    expected_version=doc.version)
+            except VersionConflict:  # another worker got there first
+                self._bump("claim_conflicts")
+                continue
+            claimed.append((doc, attempts))
+        if not claimed:
+            return 0
+
+        errors = self.deliver([(d.data["to"], d.data["subject"], d.data["body"]) for d, _ in claimed])
+        done = time.time()
+        ops = []
+        for (doc, attempts), error in zip(claimed, errors):
+            path = f"{self.collection}/{doc.id}"
+            if error is None:
+                ops.append(("update", path, {"status": "sent", "sent_at": done, "last_error": DELETE, "body": DELETE}))
+                self._bump("sent")
+            elif attempts >= self.max_attempts or isinstance(error, self.permanent_errors):
+                ops.append(("update", path, {"status": "dead", "last_error": str(error),
+                                             "purge_after": done + self.dead_retention_seconds}))
+                self._bump("dead")
+            else:
+                ops.append(("update", path, {"status": "queued", "last_error": str(error),
+                                             "next_attempt_at": done + self._backoff(attempts)}))
+                self._bump("retried")
+        self.backend.write_batch(ops)
+        return len(claimed)
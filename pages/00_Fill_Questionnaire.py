@@ -1,5 +1,6 @@
 import streamlit as st
 from db import load_structure, load_responses, save_responses, get_release_status
+from clauses import option_id
 
 st.set_page_config(page_title="Fill Questionnaires", layout="centered")
 
@@ -67,6 +68,8 @@ def render_form(phase, name):
                     val = st.selectbox("Select:", q['options'], index=idx, key=f"{phase}_{q['id']}")
                 
                 new_r[q['id']] = val
+                # Stable id the Drafting Engine maps straight to a clause
+                new_r[f"{q['id']}_option"] = option_id(val)
                 
             # Comment Field
             comment_key = f"{q['id']}_comment"
@@ -1,12 +1,10 @@
 import streamlit as st
-from docxtpl import DocxTemplate
-from docx.shared import Inches, Pt
-from io import BytesIO
 from datetime import date, timedelta
 import pandas as pd
-from db import load_responses, save_complex_data
+from db import load_responses, save_complex_data, get_active_case_id
+from po1 import PO1_JOBS
+from clauses import CLAUSE_LIBRARY, default_variation
 import os
-import traceback
 
 st.set_page_config(page_title="Drafting Engine", layout="wide")
 
@@ -17,11 +15,14 @@ if st.session_state.get('user_role') != 'arbitrator':
     st.stop()
 
 # --- 1. LOAD DATA ---
-p1 = load_responses("phase1")
-p2 = load_responses("phase2")
-claimant = p2.get('claimant', {})
-respondent = p2.get('respondent', {})
-c_p1 = p1.get('claimant', {})
+# Answers are read once per session and case (both phases share one responses map);
+# "Reload Answers" picks up submissions made after the page was opened.
+responses_key = f"po1_responses_{get_active_case_id()}"
+if responses_key not in st.session_state:
+    st.session_state[responses_key] = load_responses("phase2")
+claimant = st.session_state[responses_key].get('claimant', {})
+respondent = st.session_state[responses_key].get('respondent', {})
+c_p1 = claimant
 
 # --- 2. LOGIC HELPERS ---
 def clean_answer(raw_text):
@@ -33,22 +34,13 @@ def clean_answer(raw_text):
             return parts[1].strip()
     return text.strip()
 
-def safe_str(val):
-    """Prevents 'None' or 'nan' from appearing in the document."""
-    if val is None:
-        return ""
-    s_val = str(val).strip()
-    if s_val.lower() in ['none', 'nan', 'nat']:
-        return ""
-    return s_val
-
 def update_clause_text(var_name, lib_key):
     radio_key = f"rad_{var_name}"
     text_key = f"in_{var_name}"
     if radio_key in st.session_state:
         selected_label = st.session_state[radio_key]
-        if lib_key in LIB and selected_label in LIB[lib_key]:
-            new_text = LIB[lib_key][selected_label]
+        if lib_key in CLAUSE_LIBRARY and selected_label in CLAUSE_LIBRARY[lib_key]:
+            new_text = CLAUSE_LIBRARY[lib_key][selected_label]
             st.session_state[text_key] = new_text
 
 def decision_widget(label, var_name, key_in_db, lib_key=None, default_text="", help_note=""):
@@ -70,16 +62,11 @@ def decision_widget(label, var_name, key_in_db, lib_key=None, default_text="", h
             st.warning(f"👤 **Respondent:**\n\n{clean_answer(r_ans)}")
         
         with cols[2]:
-            if lib_key and lib_key in LIB:
-                options_dict = LIB[lib_key]
+            if lib_key and lib_key in CLAUSE_LIBRARY:
+                options_dict = CLAUSE_LIBRARY[lib_key]
                 options_list = list(options_dict.keys())
                 radio_key = f"rad_{var_name}"
-                default_idx = 0
-                if radio_key not in st.session_state:
-                    for i, k in enumerate(options_list):
-                        if k.split("(")[0].strip() in c_ans:
-                            default_idx = i
-                            break
+                default_idx = default_variation(key_in_db, claimant)
                 st.radio(
                     "Select Variation:",
                     options_list,
@@ -100,152 +87,11 @@ def decision_widget(label, var_name, key_in_db, lib_key=None, default_text="", h
         st.divider()
         return final_val
 
-# --- 3. CLAUSE LIBRARY ---
-LIB = {
-    "bifurcation": {
-        "Option A (Single)": "The Tribunal shall hear all issues (Jurisdiction, Liability, and Quantum) together in a single phase.",
-        "Option B (Bifurcated)": "Pursuant to LCIA Article 22.1(vii), the proceedings are bifurcated. Phase 1 shall address Liability only."
-    },
-    "consolidation": {
-        "Option A (None)": "This arbitration stands alone; no consolidation or concurrent conduct is anticipated.",
-        "Option B (Consolidated)": "The proceedings shall be consolidated with related proceedings."
-    },
-    "secretary": {
-        "Option A (Appointed)": "The Tribunal appoints a Tribunal Secretary with the consent of the Parties.",
-        "Option B (None)": "No Tribunal Secretary shall be appointed."
-    },
-    "sec_fees": {
-        "Option A (Hourly)": "The Tribunal Secretary's fees shall be charged at a rate between £75 and £175 per hour, in accordance with the standard LCIA Schedule of Costs.",
-        "Option B (No Fee)": "The Tribunal Secretary shall not bill separately for their time."
-    },
-    "mediation": {
-        "Option A (Window)": "The procedural timetable includes a specific window for mediation stay, should the Parties agree to utilise it.",
-        "Option B (No Window)": "No specific stay for mediation is included, though the Parties may agree to mediate at any time."
-    },
-    "style": {
-        "Option A (Memorial)": "The Parties shall submit written submissions in the Memorial Style, involving the simultaneous exchange of evidence with pleadings.",
-        "Option B (Pleading)": "The Parties shall submit written submissions in the Pleading Style, where evidence is exchanged only after the disclosure phase."
-    },
-    "platform": {
-        "Option A (PROCEED)": 'The Parties and the Arbitral Tribunal shall use the PROCEED platform ("Platform") for all filings and the procedural calendar.',
-        "Option B (Email)": "The Parties shall conduct case management via email and file documents in PDF format."
-    },
-    "page_limits": {
-        "Option A (None)": "There are no specific page limits for submissions. The Parties are to exercise reasonable discretion.",
-        "Option B (Strict)": "Strict page limits shall apply to all written submissions as directed by the Tribunal.",
-        "Option C (Legal Only)": "Page limits shall apply to the legal argument sections only."
-    },
-    "last_submission": {
-        "Option A (Merits)": "The 'Last Submission' triggering the reporting period is defined as the final Post-Hearing Brief on the merits.",
-        "Option B (Final Filing)": "The 'Last Submission' is defined as the very last filing in the arbitration, including Submissions on Costs."
-    },
-    "doc_prod": {
-        "Option A (IBA Bound)": "The Tribunal shall be bound by the IBA Rules on the Taking of Evidence (2020).",
-        "Option B (IBA Guided)": "The Tribunal shall be guided by the IBA Rules on the Taking of Evidence (2020).",
-        "Option C (LCIA General)": "The Tribunal shall apply the general evidentiary powers under the LCIA Rules without specific reference to the IBA Rules."
-    },
-    "limits": {
-        "Option A (Relevance)": "Document requests shall be subject to the standard of relevance and materiality set out in the IBA Rules.",
-        "Option B (Capped)": "Document requests shall be capped at a maximum number to strictly control costs.",
-        "Option C (None)": "No document production shall take place in these proceedings."
-    },
-    "privilege_std": {
-        "Option A (Seat Law)": "The Tribunal shall determine issues of legal privilege in accordance with the rules of privilege applicable at the Seat of Arbitration.",
-        "Option B (Most Favored)": "The Tribunal shall determine issues of legal privilege in accordance with the rules most favorable to maintaining the privilege."
-    },
-    "privilege_logs": {
-        "Option A (Required)": "Parties withholding documents on grounds of privilege must produce a detailed privilege log describing the document and the basis for privilege.",
-        "Option B (On Dispute)": "Privilege logs are not required unless specifically ordered by the Tribunal following a dispute."
-    },
-    "witness_exam": {
-        "Option A (Limited)": "Witness statements shall stand as evidence-in-chief, and direct examination at the hearing shall be limited.",
-        "Option B (Full)": "Witnesses may be subject to full direct examination at the hearing."
-    },
-    "expert_meeting": {
-        "Option A (Joint Report)": "Expert counterparts shall meet and produce a Joint Report identifying areas of agreement and disagreement prior to the hearing.",
-        "Option B (None)": "No formal pre-hearing meeting of experts is required."
-    },
-    "expert_hot_tub": {
-        "Option A (Sequential)": "Experts shall be examined sequentially, one after the other.",
-        "Option B (Concurrent)": "Experts shall be examined concurrently ('hot-tubbing') on an issue-by-issue basis."
-    },
-    "venue": {
-        "At Seat": "The Oral Hearing shall be held physically at the Seat of Arbitration.",
-        "Neutral Venue": "The Oral Hearing shall be held physically at a neutral venue (IDRC London).",
-        "Virtual": "The Oral Hearing shall be held virtually via video conference."
-    },
-    "chess_clock": {
-        "Option A (Strict)": "Time allocation at the hearing shall be managed using the 'Chess Clock' method, with a fixed split of total hearing time allocated to each Party.",
-        "Option B (Flexible)": "The Tribunal shall manage time allocation flexibly without a strict Chess Clock."
-    },
-    "transcription": {
-        "Option A (Real-time)": "Live, real-time transcription is required for the hearing.",
-        "Option B (Daily)": "Daily transcripts shall be provided at the end of each hearing day."
-    },
-    "demonstratives": {
-        "Option A (24h Notice)": "Demonstrative exhibits must be exchanged in hard copy or email at least 24 hours before use.",
-        "Option B (No Notice)": "Demonstrative exhibits may be used without prior exchange provided they contain no new evidence."
-    },
-    "interpretation": {
-        "Option A (English Only)": "The proceedings will be conducted entirely in English; no interpretation is anticipated.",
-        "Option B (Required)": "Interpretation services shall be arranged for witnesses testifying in other languages."
-    },
-    "cost_alloc": {
-        "Option A (Loser Pays)": "Costs shall be allocated on the principle that 'costs follow the event' (the loser pays).",
-        "Option B (Apportioned)": "Costs shall be apportioned reflecting the relative success of the Parties on individual issues."
-    },
-    "counsel_fees": {
-        "Option A (Reasonable)": "Recoverable counsel fees shall be subject to the principle of reasonableness and assessed by reference to applicable market rates.",
-        "Option B (Capped)": "Counsel fees shall be capped at a fixed amount determined by the Tribunal."
-    },
-    "internal_costs": {
-        "Option A (Recoverable)": "Reasonable internal management costs incurred by the Parties are recoverable.",
-        "Option B (Not Recoverable)": "Internal management costs are not recoverable."
-    },
-    "deposits": {
-        "Option A (50/50)": "Administrative deposits shall be split 50/50 between Claimant and Respondent from the outset.",
-        "Option B (Claimant First)": "The Claimant shall pay the initial deposit, subject to later adjustment."
-    },
-    "currency": {
-        "Option A (Contract)": "The Award shall be expressed in the currency of the contract.",
-        "Option B (Incurred)": "The Award shall be expressed in the currency in which costs were incurred."
-    },
-    "interest": {
-        "Option A (Substantive Law)": "The Tribunal shall apply interest rates and methods prescribed by the applicable substantive law.",
-        "Option B (Commercial)": "The Tribunal shall apply a commercial interest rate (e.g., LIBOR/SOFR + 2%)."
-    },
-    "sign_award": {
-        "Option A (Electronic)": "The Parties agree that the Tribunal may sign the Award electronically.",
-        "Option B (Wet Ink)": "The Parties require the Award to be signed in 'wet ink' (hard copy)."
-    },
-    "publication": {
-        "Option A (Confidential)": "The award shall remain confidential and shall not be published.",
-        "Option B (Redacted)": "The award may be published in redacted form."
-    },
-    "funding": {
-        "Option A (None)": "The Parties confirm that no third-party funding is currently in place.",
-        "Option B (Disclose)": "The existence and identity of any third-party funder must be disclosed immediately."
-    },
-    "ai_guidelines": {
-        "Option A (CIArb)": "The Tribunal shall adopt the CIArb Guidelines on the Use of Artificial Intelligence as a guiding text for the Parties' use of technology.",
-        "Option B (None)": "No specific guidelines on AI are adopted."
-    },
-    "green_protocols": {
-        "Option A (Adopted)": "The Tribunal and Parties shall conduct the arbitration in accordance with the Green Protocols of the Campaign for Greener Arbitrations.",
-        "Option B (None)": "No specific sustainability protocols are adopted."
-    },
-    "disability": {
-        "Option A (Included)": "At any point, either Party may advise the Tribunal of a person who requires reasonable accommodation to facilitate their full participation.",
-        "Option B (None)": "No specific clause on accommodations is required."
-    },
-    "gdpr": {
-        "Option A (Standard)": "The Parties agree that standard security measures, including the use of encrypted email and the designated Platform, are sufficient for data protection purposes.",
-        "Option B (Protocol)": "A specific Data Protection Protocol shall be established."
-    }
-}
-
-# --- 4. APP UI ---
+# --- 3. APP UI ---
 st.title("📝 Procedural Order No. 1 - Drafting Cockpit")
+if st.button("🔄 Reload Answers"):
+    del st.session_state[responses_key]
+    st.rerun()
 
 # --- INITIALIZE TABLE with requested Columns (Step column is data-only, not shown) ---
 if "timetable_df" not in st.session_state:
@@ -258,8 +104,16 @@ t1, t2, t3, t4, t5, t6 = st.tabs(["1. General", "2. Timetable", "3. Evidence", "
 
 ctx = {} 
 
-with t1:
-    st.header("General & Constitution")
+# --- RERUN UNITS ---
+# Each block below is a fragment: editing a widget reruns only its own block.
+# A full run (page load, Generate, Sync) executes every block, so ctx is complete then.
+@st.fragment
+def clause_group(widgets):
+    for ctx_key, *args in widgets:
+        ctx[ctx_key] = decision_widget(*args)
+
+@st.fragment
+def general_details():
     c1, c2 = st.columns(2)
     ctx['Case_Number'] = c1.text_input("Case Reference", "ARB/24/001")
     ctx['seat_of_arbitration'] = c2.text_input("Seat", "London")
@@ -284,6 +138,8 @@ with t1:
         ctx['Contact_details_of_Arbitrator_2'] = t2_col.text_input("Co-Arb 2", "Ms. B")
         ctx['Contact_details_of_Arbitrator_3_Presiding'] = t3_col.text_input("Presiding", "Prof. C")
 
+@st.fragment
+def constitution_clauses():
     ctx['bifurcation_decision'] = decision_widget("Bifurcation", "bif", "bifurcation", "bifurcation")
     ctx['consolidation_decision'] = decision_widget("Consolidation", "con", "consolidation", "consolidation")
     sec_clause = decision_widget("Secretary Appointment", "sec", "secretary", "secretary")
@@ -293,11 +149,8 @@ with t1:
     else:
         ctx['tribunal_secretary_fees'] = ""
 
-with t2:
-    st.header("📅 Procedural Timetable")
-    st.info("Configure the steps below. The 'Step No.' is added automatically in the final document.")
-    st.caption("ℹ️ To DELETE a row: Select the empty checkbox on the far left of the row and press 'Delete' on your keyboard.")
-    
+@st.fragment
+def timetable_editor():
     col_preset, col_act = st.columns([3, 1])
     preset = col_preset.radio("Load Preset Template:", ["Memorial Style (Front Loaded)", "Pleading Style (Sequential)"], horizontal=True)
     if col_act.button("🔄 Apply Preset"):
@@ -322,9 +175,9 @@ with t2:
                 {"Date": base + timedelta(weeks=24), "Responsible Party": "All", "Procedural Requirements": "Oral Hearing", "Notes": "10 Days"}
             ]
         st.session_state.timetable_df = pd.DataFrame(data)
-        st.rerun()
+        st.rerun(scope="fragment")
 
-    edited_df = st.data_editor(
+    return st.data_editor(
         st.session_state.timetable_df,
         key="timetable_editor", 
         num_rows="dynamic",
@@ -336,29 +189,9 @@ with t2:
             "Notes": st.column_config.TextColumn(width="medium")
         }
     )
-    
-    ctx['mediation_window_clause'] = decision_widget("Mediation Window", "med", "mediation", "mediation")
-
-with t3:
-    st.header("Evidence")
-    ctx['platform_usage_clause'] = decision_widget("Platform Usage Protocol", "plat", "platform", "platform")
-    ctx['submission_style_decision'] = decision_widget("Submission Style", "style", "style", "style")
-    ctx['page_limits_decision'] = decision_widget("Page Limits", "pg", "limits_submission", "page_limits")
-    ctx['last_submission_definition'] = decision_widget("Last Submission Def.", "last", "last_submission", "last_submission")
-    st.divider()
-    ctx['evidence_rules_decision'] = decision_widget("IBA Rules", "iba", "doc_prod", "doc_prod")
-    ctx['doc_prod_limits_decision'] = decision_widget("Doc Prod Limits", "lim", "limits", "limits")
-    ctx['privilege_standard_decision'] = decision_widget("Privilege Standard", "priv", "privilege_std", "privilege_std")
-    ctx['privilege_logs_decision'] = decision_widget("Privilege Logs", "logs", "privilege_logs", "privilege_logs")
-    st.subheader("Witnesses & Experts")
-    ctx['witness_exam_scope_decision'] = decision_widget("Witness Exam Scope", "wit", "witness_exam", "witness_exam")
-    ctx['expert_meeting_decision'] = decision_widget("Expert Meetings", "exp_meet", "expert_meeting", "expert_meeting")
-    ctx['expert_hottubing_decision'] = decision_widget("Expert Hot-Tubbing", "exp_tub", "expert_hot_tub", "expert_hot_tub")
 
-with t4:
-    st.header("Hearing Logistics")
-    c_p1_val = c_p1.get('p1_hearing', '')
-    ctx['hearing_venue_decision'] = decision_widget("Hearing Venue", "venue", "physical_venue_preference", "venue", help_note=f"Phase 1 Pref: {c_p1_val}")
+@st.fragment
+def hearing_details():
     col_a, col_b = st.columns(2)
     ctx['physical_venue_city'] = col_a.text_input("City of Hearing", "London")
     ctx['hearing_hours'] = col_b.text_input("Hearing Hours", "09:30 to 17:30")
@@ -369,31 +202,9 @@ with t4:
     ctx['time_hearing_bundle'] = col_e.text_input("Hearing Bundle Deadline", "14 days")
     ctx['time_submit_exhibits'] = col_f.text_input("Submit Exhibits Post-Hearing", "48 hours")
     ctx['date_decide_venue'] = st.text_input("Deadline to Decide Venue", "3 months prior")
-    ctx['chess_clock_decision'] = decision_widget("Chess Clock", "clock", "chess_clock", "chess_clock")
-    ctx['transcription_decision'] = decision_widget("Transcription", "trans", "transcription", "transcription")
-    ctx['demonstratives_decision'] = decision_widget("Demonstratives", "demo", "demonstratives", "demonstratives")
-    ctx['interpretation_decision'] = decision_widget("Interpretation", "interp", "interpretation", "interpretation")
-
-with t5:
-    st.header("Costs & Award")
-    ctx['cost_allocation_decision'] = decision_widget("Cost Principle", "cost", "cost_allocation", "cost_alloc")
-    ctx['counsel_fee_cap_decision'] = decision_widget("Fee Caps", "fees", "counsel_fees", "counsel_fees")
-    ctx['internal_costs_decision'] = decision_widget("Internal Costs", "int_cost", "internal_costs", "internal_costs")
-    ctx['deposit_structure_decision'] = decision_widget("Deposits", "dep", "deposits", "deposits")
-    st.divider()
-    ctx['award_currency_decision'] = decision_widget("Currency", "curr", "currency", "currency")
-    ctx['interest_decision'] = decision_widget("Interest", "interest_rate", "interest", "interest")
-    ctx['signature_format_decision'] = decision_widget("Signature", "sign", "sign_award", "sign_award")
-    ctx['publication_decision'] = decision_widget("Publication", "pub", "publication", "publication")
 
-with t6:
-    st.header("Misc & Logistics")
-    ctx['funding_disclosure_clause'] = decision_widget("TPF Disclosure", "fund", "funding", "funding")
-    ctx['ai_guidelines_clause'] = decision_widget("AI Guidelines", "ai", "ai_guidelines", "ai_guidelines")
-    ctx['green_protocols_clause'] = decision_widget("Green Protocols", "green", "sustainability", "green_protocols")
-    ctx['disability_clause'] = decision_widget("Accessibility", "dis", "disability", "disability")
-    ctx['gdpr_clause'] = decision_widget("GDPR", "gdpr", "gdpr", "gdpr")
-    st.subheader("Document Control & Deadlines")
+@st.fragment
+def document_control():
     col_1, col_2 = st.columns(2)
     ctx['deadline_timezone'] = col_1.text_input("Deadline Timezone", "17:00 (Seat of Arbitration)")
     ctx['time_abbreviations'] = col_2.text_input("Time for Abbrev. List", "7 days")
@@ -406,6 +217,80 @@ with t6:
     ctx['max_filename_len'] = st.text_input("Max Filename Length", "50 characters")
     ctx['prehearing_matters'] = "Logistics, Bundles, and Demonstratives"
 
+with t1:
+    st.header("General & Constitution")
+    general_details()
+    constitution_clauses()
+
+with t2:
+    st.header("📅 Procedural Timetable")
+    st.info("Configure the steps below. The 'Step No.' is added automatically in the final document.")
+    st.caption("ℹ️ To DELETE a row: Select the empty checkbox on the far left of the row and press 'Delete' on your keyboard.")
+    edited_df = timetable_editor()
+    clause_group([("mediation_window_clause", "Mediation Window", "med", "mediation", "mediation")])
+
+with t3:
+    st.header("Evidence")
+    clause_group([
+        ("platform_usage_clause", "Platform Usage Protocol", "plat", "platform", "platform"),
+        ("submission_style_decision", "Submission Style", "style", "style", "style"),
+        ("page_limits_decision", "Page Limits", "pg", "limits_submission", "page_limits"),
+        ("last_submission_definition", "Last Submission Def.", "last", "last_submission", "last_submission"),
+    ])
+    st.divider()
+    clause_group([
+        ("evidence_rules_decision", "IBA Rules", "iba", "doc_prod", "doc_prod"),
+        ("doc_prod_limits_decision", "Doc Prod Limits", "lim", "limits", "limits"),
+        ("privilege_standard_decision", "Privilege Standard", "priv", "privilege_std", "privilege_std"),
+        ("privilege_logs_decision", "Privilege Logs", "logs", "privilege_logs", "privilege_logs"),
+    ])
+    st.subheader("Witnesses & Experts")
+    clause_group([
+        ("witness_exam_scope_decision", "Witness Exam Scope", "wit", "witness_exam", "witness_exam"),
+        ("expert_meeting_decision", "Expert Meetings", "exp_meet", "expert_meeting", "expert_meeting"),
+        ("expert_hottubing_decision", "Expert Hot-Tubbing", "exp_tub", "expert_hot_tub", "expert_hot_tub"),
+    ])
+
+with t4:
+    st.header("Hearing Logistics")
+    c_p1_val = c_p1.get('p1_hearing', '')
+    clause_group([("hearing_venue_decision", "Hearing Venue", "venue", "physical_venue_preference", "venue", "", f"Phase 1 Pref: {c_p1_val}")])
+    hearing_details()
+    clause_group([
+        ("chess_clock_decision", "Chess Clock", "clock", "chess_clock", "chess_clock"),
+        ("transcription_decision", "Transcription", "trans", "transcription", "transcription"),
+        ("demonstratives_decision", "Demonstratives", "demo", "demonstratives", "demonstratives"),
+        ("interpretation_decision", "Interpretation", "interp", "interpretation", "interpretation"),
+    ])
+
+with t5:
+    st.header("Costs & Award")
+    clause_group([
+        ("cost_allocation_decision", "Cost Principle", "cost", "cost_allocation", "cost_alloc"),
+        ("counsel_fee_cap_decision", "Fee Caps", "fees", "counsel_fees", "counsel_fees"),
+        ("internal_costs_decision", "Internal Costs", "int_cost", "internal_costs", "internal_costs"),
+        ("deposit_structure_decision", "Deposits", "dep", "deposits", "deposits"),
+    ])
+    st.divider()
+    clause_group([
+        ("award_currency_decision", "Currency", "curr", "currency", "currency"),
+        ("interest_decision", "Interest", "interest_rate", "interest", "interest"),
+        ("signature_format_decision", "Signature", "sign", "sign_award", "sign_award"),
+        ("publication_decision", "Publication", "pub", "publication", "publication"),
+    ])
+
+with t6:
+    st.header("Misc & Logistics")
+    clause_group([
+        ("funding_disclosure_clause", "TPF Disclosure", "fund", "funding", "funding"),
+        ("ai_guidelines_clause", "AI Guidelines", "ai", "ai_guidelines", "ai_guidelines"),
+        ("green_protocols_clause", "Green Protocols", "green", "sustainability", "green_protocols"),
+        ("disability_clause", "Accessibility", "dis", "disability", "disability"),
+        ("gdpr_clause", "GDPR", "gdpr", "gdpr", "gdpr"),
+    ])
+    st.subheader("Document Control & Deadlines")
+    document_control()
+
 # --- GENERATE ---
 st.divider()
 c_gen, c_sync = st.columns([1, 4])
@@ -435,76 +320,38 @@ with c_gen:
             if key not in ctx or ctx[key] is None:
                 ctx[key] = "[Not Selected]"
 
-        try:
-            target_file = "template_po1_SUBDOC.docx"
-            if not os.path.exists(target_file):
-                st.error("❌ Critical Error: 'template_po1_SUBDOC.docx' not found! Make sure to upload it to GitHub.")
-            else:
-                doc = DocxTemplate(target_file)
-                
-                # --- SUBDOC TABLE GENERATION (Robust & Clean) ---
-                sd = doc.new_subdoc()
-                
-                table = sd.add_table(rows=1, cols=5)
-                table.style = 'Table Grid'
-                table.autofit = False
-                
-                # Column Widths
-                widths = [0.5, 1.2, 1.2, 2.0, 1.6]
-                
-                # HEADERS
-                hdr_cells = table.rows[0].cells
-                headers = ["Step", "Date", "Responsible Party", "Procedural Requirements", "Notes"]
-                for i, text in enumerate(headers):
-                    hdr_cells[i].text = text
-                    hdr_cells[i].width = Inches(widths[i])
-                    for p in hdr_cells[i].paragraphs:
-                        for r in p.runs:
-                            r.bold = True
-                            r.font.size = Pt(10)
-
-                # DATA ROWS - Auto Numbering & Safe String
-                for i, (index, row) in enumerate(edited_df.iterrows()):
-                    # AUTO-NUMBERING: i+1 is calculated automatically based on row position
-                    step_num = str(i + 1)
-                    
-                    if isinstance(row['Date'], date):
-                        d_str = row['Date'].strftime("%d %B %Y")
-                    else:
-                        d_str = safe_str(row['Date'])
-
-                    new_row = table.add_row().cells
-                    new_row[0].text = step_num
-                    new_row[1].text = d_str
-                    new_row[2].text = safe_str(row['Responsible Party'])
-                    new_row[3].text = safe_str(row['Procedural Requirements'])
-                    new_row[4].text = safe_str(row['Notes'])
-                    
-                    for j, width in enumerate(widths):
-                        new_row[j].width = Inches(width)
-                        for p in new_row[j].paragraphs:
-                            for r in p.runs:
-                                r.font.size = Pt(10)
+        target_file = "template_po1_SUBDOC.docx"
+        if not os.path.exists(target_file):
+            st.error("❌ Critical Error: 'template_po1_SUBDOC.docx' not found! Make sure to upload it to GitHub.")
+        else:
+            # Rendered in the background; identical ctx + timetable reuse the stored result
+            st.session_state["po1_job"] = PO1_JOBS.submit(ctx, edited_df.to_dict("records"), target_file)
 
-                ctx['dynamic_table'] = sd
+    @st.fragment(run_every=0.5)
+    def po1_job_progress(job_key):
+        job = PO1_JOBS.status(job_key)
+        if job and job["state"] in ("queued", "running"):
+            st.progress(job["progress"], text=job["stage"])
+        else:
+            st.rerun()
 
-                doc.render(ctx)
-                
-                buf = BytesIO()
-                doc.save(buf)
-                buf.seek(0)
-                
-                st.download_button(
-                    label="📥 Download PO1", 
-                    data=buf, 
-                    file_name="Procedural_Order_1.docx", 
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                )
-                st.success(f"Draft Generated Successfully!")
-                
-        except Exception as e:
-            st.error("An error occurred during generation:")
-            st.code(traceback.format_exc())
+    job_key = st.session_state.get("po1_job")
+    job = PO1_JOBS.status(job_key) if job_key else None
+    if job and job["state"] == "done":
+        st.download_button(
+            label="📥 Download PO1", 
+            data=PO1_JOBS.result(job_key), 
+            file_name="Procedural_Order_1.docx", 
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+        st.success(f"Draft Generated Successfully!")
+        st.caption("Served from cache (no changes since the last render)." if job["stage"] == "Served from cache"
+                   else f"Rendered in {job['seconds'] * 1000:,.0f} ms.")
+    elif job and job["state"] == "failed":
+        st.error("An error occurred during generation:")
+        st.code(job["error"])
+    elif job:
+        po1_job_progress(job_key)
 
 with c_sync:
     if st.button("🔄 Sync Timetable to Phase 4"):
@@ -1,5 +1,5 @@
 import streamlit as st
-from db import load_complex_data, save_complex_data, load_full_config
+from db import load_complex_data, load_cost_summary, save_complex_data, load_full_config
 
 st.set_page_config(page_title="Document Production", layout="wide")
 
@@ -29,15 +29,16 @@ data = load_complex_data()
 doc_prod = data.get("doc_prod", {"claimant": [], "respondent": []})
 meta = load_full_config().get("meta", {})
 threshold = meta.get("cost_settings", {}).get("doc_prod_threshold", 75.0)
+doc_prod_counts = load_cost_summary().get("doc_prod", {})
 
 # --- SCORECARD METRICS ---
 def display_scorecard(target_role):
-    reqs = doc_prod.get(target_role, [])
-    if not reqs: return
+    counts = doc_prod_counts.get(target_role, {})
+    total = counts.get('total', 0)
+    if not total: return
     
-    total = len(reqs)
-    denied = sum(1 for r in reqs if r.get('status') == 'Denied')
-    allowed = sum(1 for r in reqs if r.get('status') == 'Allowed')
+    denied = counts.get('denied', 0)
+    allowed = counts.get('allowed', 0)
     
     ratio = (denied / total) * 100 if total > 0 else 0
     
@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-from datetime import date
-from db import load_complex_data, save_complex_data, load_responses, send_email_notification, upload_file_to_cloud, load_full_config, db
-from ai_logic import generate_cost_award_draft, generate_word_document
+import time
+import numpy as np
+from datetime import date, datetime
+from db import load_complex_data, load_cost_summary, get_memo_history, append_cost_entry, load_responses, send_email_notification, upload_file_to_cloud, load_full_config, update_case_meta
+from ai_logic import CostAnalysis, stream_cost_award_draft, memo_docx_bytes
 
 st.set_page_config(page_title="Cost Management", layout="wide")
 
@@ -115,31 +117,43 @@ with tabs[0]:
                 }
                 # Save to specific list
                 target_list = "common_log" if is_common else f"{role}_log"
-                if target_list not in costs: costs[target_list] = []
-                costs[target_list].append(entry)
-                save_complex_data("costs", costs)
+                append_cost_entry(target_list, entry)
                 st.success("Expense Logged.")
                 st.rerun()
 
     st.divider()
 
     # --- 2. VIEW LOGS (Based on Blind Logic) ---
-    
+    # Totals come from the running aggregates; the full ledger tables are only
+    # built when asked for.
+    summary = load_cost_summary()
+    labels = summary.get("labels", {})
+
+    def render_ledger(ledger, entries, empty_msg, key):
+        agg = summary.get("costs", {}).get(ledger, {})
+        if not agg.get("count"):
+            st.caption(empty_msg)
+            return
+        m1, m2 = st.columns(2)
+        m1.metric("Total (€)", f"{agg.get('total', 0.0):,.2f}")
+        m2.metric("Entries", agg.get("count", 0))
+        by_phase = {labels.get(k, k): v for k, v in agg.get("by_phase", {}).items() if v}
+        if by_phase:
+            st.bar_chart(pd.Series(by_phase, name="€"), height=200)
+        if st.toggle("Show entries", key=f"show_{key}"):
+            st.dataframe(pd.DataFrame(entries), use_container_width=True)
+
     # A. Private Cost Summary (Own)
     st.markdown(f"### 🔐 Private Cost Summary ({role.title()})")
-    if 'private' in visible_logs and visible_logs['private']:
-        df_p = pd.DataFrame(visible_logs['private'])
-        st.dataframe(df_p, use_container_width=True)
+    private_ledger = f"{role}_log" if role in ['claimant', 'respondent', 'arbitrator'] else None
+    if private_ledger:
+        render_ledger(private_ledger, visible_logs.get('private', []), "No private costs logged yet.", "private")
     else:
         st.info("No private costs logged yet.")
 
     # B. Arbitration Cost Summary (Common)
     st.markdown("### 🌍 Arbitration Cost Summary (Common)")
-    if 'common' in visible_logs and visible_logs['common']:
-        df_c = pd.DataFrame(visible_logs['common'])
-        st.dataframe(df_c, use_container_width=True)
-    else:
-        st.caption("No common costs logged yet.")
+    render_ledger("common_log", visible_logs.get('common', []), "No common costs logged yet.", "common")
         
     # C. Unlocked Party Costs (Only if Merits Decided)
     if merits_decided and role == 'arbitrator':
@@ -148,10 +162,10 @@ with tabs[0]:
         c1, c2 = st.columns(2)
         with c1:
             st.caption("Claimant's Log")
-            st.dataframe(pd.DataFrame(visible_logs.get('claimant_unlocked', [])), use_container_width=True)
+            render_ledger("claimant_log", visible_logs.get('claimant_unlocked', []), "No costs logged.", "claimant_unlocked")
         with c2:
             st.caption("Respondent's Log")
-            st.dataframe(pd.DataFrame(visible_logs.get('respondent_unlocked', [])), use_container_width=True)
+            render_ledger("respondent_log", visible_logs.get('respondent_unlocked', []), "No costs logged.", "respondent_unlocked")
 
 # ==============================================================================
 # TAB 2: PAYMENT REQUESTS (Arbitrator Function)
@@ -178,9 +192,7 @@ with tabs[1]:
                     "due": str(p_due), "payer": payer, 
                     "status": "Pending"
                 }
-                if "payment_requests" not in costs: costs["payment_requests"] = []
-                costs["payment_requests"].append(req)
-                save_complex_data("costs", costs)
+                append_cost_entry("payment_requests", req)
                 st.success("Payment Order Logged.")
                 st.rerun()
                 
@@ -205,8 +217,7 @@ with tabs[2]:
         with st.form("final_sub"):
             total = st.number_input("Total Claimed (€)", min_value=0.0)
             if st.form_submit_button("Submit Final Statement"):
-                costs['final_submissions'].append({"party": role, "amount": total, "date": str(date.today())})
-                save_complex_data("costs", costs)
+                append_cost_entry("final_submissions", {"party": role, "amount": total, "date": str(date.today())})
                 st.success("Submitted.")
     else:
         st.info("Parties submit their final statements here.")
@@ -226,9 +237,7 @@ with tabs[3]:
                     "offerer": role, "amount": offer_amt,
                     "date": str(date.today()), "status": "Sealed"
                 }
-                if "sealed_offers" not in costs: costs["sealed_offers"] = []
-                costs["sealed_offers"].append(entry)
-                save_complex_data("costs", costs)
+                append_cost_entry("sealed_offers", entry)
                 st.success("Offer Sealed and Submitted.")
 
     if role == 'arbitrator':
@@ -255,16 +264,59 @@ if role == 'arbitrator':
         st.caption("Checking this box unlocks the private cost logs for the Tribunal.")
         is_decided = st.checkbox("✅ Declare Merits Decision Rendered", value=merits_decided)
         if is_decided != merits_decided:
-            db.collection("arbitrations").document(case_id).update({"meta.merits_decided": is_decided})
+            update_case_meta({"merits_decided": is_decided})
             st.rerun()
 
         if is_decided:
             # 2. INPUT AWARD VALUE
             award_val = st.number_input("Final Principal Award Amount (€)", value=meta.get("final_award_amount", 0.0))
             if st.button("Save Award Value"):
-                 db.collection("arbitrations").document(case_id).update({"meta.final_award_amount": award_val})
+                 update_case_meta({"final_award_amount": award_val})
                  st.toast("Value Saved")
 
+            # WHAT-IF SWEEP: net cost order across a range of award values
+            with st.expander("📈 Award What-If Analysis"):
+                analysis = CostAnalysis.from_case()
+                offer_vals = [float(o.get('amount', 0.0)) for o in analysis.sealed_offers]
+                default_max = max(offer_vals + [award_val, 1.0]) * 1.5
+                w1, w2, w3 = st.columns(3)
+                sweep_min = w1.number_input("From (€)", value=0.0, step=1000.0)
+                sweep_max = w2.number_input("To (€)", value=float(default_max), step=1000.0)
+                sweep_n = w3.number_input("Award values", min_value=10, max_value=100000, value=2000, step=100)
+
+                if sweep_max > sweep_min:
+                    start = time.perf_counter()
+                    sweep = analysis.award_sweep(np.linspace(sweep_min, sweep_max, int(sweep_n)))
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+
+                    chart = pd.DataFrame({
+                        "Net cost order (€, + = Respondent pays)": sweep["net_order"],
+                        "Sealed-offer reversal (€)": sweep["reversal_net"]
+                    }, index=pd.Index(sweep["award"], name="Award (€)"))
+                    st.line_chart(chart)
+                    if sweep["offers"]:
+                        triggers = pd.DataFrame(sweep["triggered"].astype(int), index=chart.index,
+                                                columns=[f"Offer #{i+1} ({o['offerer'].title()})" for i, o in enumerate(sweep["offers"])])
+                        st.caption("Reversal triggers (1 = award below offer)")
+                        st.line_chart(triggers, height=180)
+                    st.caption(f"Evaluated {len(sweep['award']):,} award values in {elapsed_ms:.1f} ms. "
+                               "Costs follow the event, less conduct deductions; triggered offers shift post-offer costs to the rejecting party.")
+                else:
+                    st.warning("'To' must be greater than 'From'.")
+
+            # COMPUTED NET COST ORDER: deterministic, the AI draft only narrates it
+            st.write("#### Computed Net Cost Order")
+            analysis = CostAnalysis.from_case()
+            start = time.perf_counter()
+            order = analysis.net_cost_order(award_val)
+            elapsed_us = (time.perf_counter() - start) * 1e6
+            st.dataframe(pd.DataFrame(order["steps"], columns=["Step", "Amount (€)"]), use_container_width=True, hide_index=True)
+            if order["amount"]:
+                st.success(f"**{order['payer'].title()} shall pay {order['payee'].title()} €{order['amount']:,.2f}**")
+            else:
+                st.info("Each party bears its own costs.")
+            st.caption(f"Computed in {elapsed_us:,.0f} µs at a delay rate of {analysis.delay_penalty_rate:g}% per day.")
+
             st.divider()
             
             # 3. GENERATE & DOWNLOAD
@@ -275,24 +327,38 @@ if role == 'arbitrator':
 
             with col1:
                 st.write("#### 1. Generate Analysis")
-                if st.button("✨ Draft Recommendation (Vertex AI)", type="primary"):
-                    with st.spinner("Reviewing conduct, delays, and sealed offers..."):
-                        # Calls the function from ai_logic.py
-                        st.session_state["ai_draft"] = generate_cost_award_draft(case_id, award_val)
+                refresh = st.checkbox("Regenerate even if the case data is unchanged", help="Unchanged inputs are served from the memo cache without calling the model.")
+                draft_clicked = st.button("✨ Draft Recommendation (Vertex AI)", type="primary")
             
-            if st.session_state["ai_draft"]:
+            if draft_clicked or st.session_state["ai_draft"]:
                 st.markdown("---")
                 st.markdown("### 📝 Draft Recommendation")
-                st.write(st.session_state["ai_draft"])
+                if draft_clicked:
+                    # Streams the memo from ai_logic.py as the model writes it
+                    st.session_state["ai_draft"] = st.write_stream(stream_cost_award_draft(case_id, award_val, refresh=refresh))
+                else:
+                    st.write(st.session_state["ai_draft"])
                 
                 with col2:
                     st.write("#### 2. Export")
-                    # Uses the doc generator from ai_logic.py
-                    docx = generate_word_document(case_id, st.session_state["ai_draft"], award_val)
-                    
+                    # Built by ai_logic.py only when the download is clicked, then cached
+                    draft = st.session_state["ai_draft"]
                     st.download_button(
                         label="📄 Download Formal Word Doc (.docx)",
-                        data=docx,
+                        data=lambda: memo_docx_bytes(case_id, draft, award_val),
                         file_name=f"Cost_Recommendation_{case_id}.docx",
                         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
                     )
+
+            history = get_memo_history(case_id)
+            if len(history) > 1:
+                with st.expander(f"🕘 Draft History ({len(history)} versions)"):
+                    labels = [f"{datetime.fromtimestamp(h['created_at']):%Y-%m-%d %H:%M} · €{h['award']:,.2f} · {h['model']}" for h in history]
+                    h1, h2 = st.columns(2)
+                    left = h1.selectbox("Version", range(len(history)), format_func=labels.__getitem__, key="memo_left")
+                    right = h2.selectbox("Compare with", range(len(history)), index=1, format_func=labels.__getitem__, key="memo_right")
+                    h1.write(history[left]["text"])
+                    h2.write(history[right]["text"])
+                    if h1.button("Use this version"):
+                        st.session_state["ai_draft"] = history[left]["text"]
+                        st.rerun()
@@ -1,5 +1,6 @@
 import streamlit as st
-from db import load_complex_data, send_email_notification
+from datetime import datetime
+from db import load_complex_data, send_email_notification, get_outbox_messages, retry_outbox_message
 
 st.set_page_config(page_title="Notifications", layout="wide")
 role = st.session_state.get('user_role')
@@ -19,6 +20,8 @@ st.title("🔔 Notification Center")
 
 data = load_complex_data()
 all_notifs = data.get("notifications", [])
+STATUS_ICONS = {"queued": "⏳", "sending": "📤", "sent": "✅", "dead": "❌"}
+outbox = {m["id"]: m for m in get_outbox_messages()} if role in ['arbitrator', 'lcia'] else {}
 
 # 1. INBOX
 st.subheader("Received Notifications")
@@ -33,10 +36,30 @@ if my_msgs:
             c2.caption(f"📅 {msg['date']}")
             recip_str = ", ".join([r.title() for r in msg.get('to_roles', [])])
             c2.info(f"To: {recip_str}")
+            deliveries = [outbox[i] for i in msg.get('outbox_ids', []) if i in outbox]
+            if deliveries:
+                c1.caption(" · ".join(f"{STATUS_ICONS.get(m['status'], '')} {m['to']}: {m['status']}" for m in deliveries))
 else:
     st.info("No notifications to display.")
 
-# 2. COMPOSE (Arbitrator Only)
+# 2. EMAIL DELIVERY (Arbitrator / LCIA)
+if outbox:
+    with st.expander(f"📬 Email Delivery Status ({len(outbox)} messages)"):
+        for m in outbox.values():
+            d1, d2, d3 = st.columns([3, 3, 1])
+            d1.write(f"{STATUS_ICONS.get(m['status'], '')} **{m['to']}**  \n{m['subject']}")
+            detail = f"{m['status'].title()} · attempt {m.get('attempts', 0)} · queued {datetime.fromtimestamp(m['created_at']):%Y-%m-%d %H:%M}"
+            if m['status'] == 'queued' and m.get('attempts'):
+                detail += f" · next try {datetime.fromtimestamp(m['next_attempt_at']):%H:%M:%S}"
+            d2.caption(detail)
+            if m.get('last_error'): d2.caption(f"Last error: {m['last_error']}")
+            if m['status'] == 'dead' and 'body' not in m:
+                d3.caption("Expired")
+            elif m['status'] == 'dead' and d3.button("Retry", key=f"retry_{m['id']}"):
+                retry_outbox_message(m['id'])
+                st.rerun()
+
+# 3. COMPOSE (Arbitrator Only)
 if role in ['arbitrator', 'lcia']:
     st.divider()
     st.subheader("📢 Send New Notification")
@@ -56,7 +79,7 @@ if role in ['arbitrator', 'lcia']:
                 if 'respondent' in recips: emails.append(p2.get('respondent', {}).get('contact_email'))
                 
                 send_email_notification(emails, subj, body)
-                st.success("Notification sent successfully.")
+                st.success("Notification posted; emails are queued for delivery.")
                 st.rerun()
             else:
                 st.error("Please fill all fields.")
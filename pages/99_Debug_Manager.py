@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
-from db import db
+from passwords import KDFParams, benchmark
+from llm import model_health
+from ai_logic import get_docx_cache
+from po1 import TEMPLATE_CACHE, PO1_JOBS, benchmark_render, benchmark_timetable
+from datetime import date
+from db import db, get_read_stats, get_storage_stats, get_case_cache_stats, get_contention_stats, get_mail_stats, delete_case, migrate_case_to_subcollections, migrate_all_cases, rebuild_case_index, rebuild_cost_aggregates, SPLIT_LAYOUT
 
 # --- SAFETY WARNING ---
 st.set_page_config(page_title="DEBUG TOOL", layout="wide", page_icon="🐞")
@@ -25,14 +30,18 @@ if not db:
     st.error("Database not connected.")
     st.stop()
 
-# Fetch all documents from Firestore
-docs = db.collection("arbitrations").stream()
+# Fetch all case documents from the storage backend
+docs = db.list("arbitrations")
+# Party emails live in the credentials collection (legacy cases: meta.parties)
+party_emails = {}
+for cred in db.list("credentials", fields=["case_id", "role", "email"]):
+    party_emails.setdefault(cred.data.get('case_id'), {})[cred.data.get('role')] = cred.data.get('email')
 
 table_data = []
 full_data_map = {}
 
 for doc in docs:
-    d = doc.to_dict()
+    d = doc.data
     meta = d.get('meta', {})
     
     # safe get
@@ -41,7 +50,7 @@ for doc in docs:
     name = meta.get('case_name', 'Untitled')
     status = meta.get('status', 'Unknown')
     
-    parties = meta.get('parties', {})
+    parties = party_emails.get(cid) or meta.get('parties', {})
     claimant = parties.get('claimant', '-')
     respondent = parties.get('respondent', '-')
     
@@ -51,7 +60,8 @@ for doc in docs:
         "Case Name": name,
         "Status": status,
         "Claimant Email": claimant,
-        "Respondent Email": respondent
+        "Respondent Email": respondent,
+        "Layout": "Split" if d.get('storage_layout') == SPLIT_LAYOUT else "Legacy"
     })
     full_data_map[cid] = d
 
@@ -83,11 +93,139 @@ with col2:
     st.write("##") # Spacer
     if st.button("❌ DELETE CASE", type="primary"):
         if to_delete:
-            db.collection("arbitrations").document(to_delete).delete()
+            delete_case(to_delete)
             st.toast(f"Deleted {to_delete}")
             st.rerun()
 
-# --- 4. RAW DATA INSPECTOR ---
+# --- 4. STORAGE MIGRATION ---
+st.subheader("🧱 Migrate to Item Subcollections")
+st.caption("Moves cost logs, Redfern requests, timeline, delays and notifications out of the case document. Run while the case is idle.")
+m1, m2 = st.columns(2)
+if m1.button("Migrate Selected Case"):
+    if to_delete:
+        moved = migrate_case_to_subcollections(to_delete)
+        st.toast(f"{to_delete}: moved {moved} items")
+if m2.button("Migrate ALL Legacy Cases"):
+    results = migrate_all_cases()
+    st.toast(f"Migrated {sum(1 for n in results.values() if n)} case(s), {sum(results.values())} items")
+if st.button("🗂️ Rebuild Registrar Case Index"):
+    st.toast(f"Indexed {rebuild_case_index()} case(s)")
+if st.button("🧮 Rebuild Cost Aggregates (Selected Case)"):
+    if to_delete:
+        rebuild_cost_aggregates(to_delete)
+        st.toast(f"{to_delete}: cost aggregates recomputed")
+
+st.divider()
+
+# --- 5. READ & CONTENTION COUNTERS ---
+st.subheader("📈 Case Read Counters (this process)")
+stats = get_read_stats()
+r1, r2, r3 = st.columns(3)
+r1.metric("Case Document Reads", stats["document_reads"])
+r2.metric("Item Subcollection Queries", stats["item_queries"])
+r3.metric("Served from Rerun Snapshot", stats["snapshot_hits"])
+
+st.subheader("🗄️ Shared Case Cache (all sessions)")
+cache_stats = get_case_cache_stats()
+if cache_stats:
+    s1, s2, s3, s4, s5 = st.columns(5)
+    s1.metric("Cached Cases", cache_stats["entries"])
+    s2.metric("Hits", cache_stats["hits"])
+    s3.metric("Loads", cache_stats["loads"])
+    s4.metric("Invalidations", cache_stats["invalidations"])
+    s5.metric("Evictions", cache_stats["evictions"])
+    if cache_stats["watch_errors"]:
+        st.caption(f"⚠️ {cache_stats['watch_errors']} case(s) could not be watched and are read without caching; see the server log.")
+
+st.subheader("⚔️ Write Contention (this process)")
+contention = get_contention_stats()
+k1, k2, k3 = st.columns(3)
+k1.metric("Precondition Retries", contention["retries"])
+k2.metric("Merged Conflicts", contention["conflicts"])
+k3.metric("Failed Saves", contention["failures"])
+
+st.subheader("🤖 Model Health (this process)")
+health = model_health()
+if health:
+    st.dataframe(pd.DataFrame([
+        {"Model": model, "Calls": h.get("calls", 0), "Errors": h.get("errors", 0), "Skipped (circuit open)": h.get("skipped_open", 0),
+         "Avg (ms)": h.get("avg_ms", 0.0), "Max (ms)": round(h.get("max_seconds", 0.0) * 1000, 1),
+         "Streams": h.get("streams", 0), "Avg first token (ms)": h.get("avg_ttft_ms", 0.0),
+         "Max first token (ms)": round(h.get("max_ttft_seconds", 0.0) * 1000, 1),
+         "Circuit": ("OPEN" if h.get("circuit", {}).get("open") else "HALF-OPEN" if h.get("circuit", {}).get("trial") else "closed"), "Retry in (s)": h.get("circuit", {}).get("retry_in_s", 0.0),
+         "Last Error": h.get("last_error")}
+        for model, h in health.items()
+    ]), use_container_width=True, hide_index=True)
+else:
+    st.caption("No model calls yet.")
+
+st.subheader("📄 Document Cache (this process)")
+docx_stats = get_docx_cache().stats()
+d1, d2, d3, d4 = st.columns(4)
+d1.metric("Cached Documents", docx_stats["entries"])
+d2.metric("Cache Size (KB)", round(docx_stats["bytes"] / 1024))
+d3.metric("Hits", docx_stats["hits"])
+d4.metric("Builds", docx_stats["builds"])
+
+st.subheader("⏱️ Storage Latency (this process)")
+storage_stats = get_storage_stats()
+st.caption(f"Backend: **{storage_stats['backend']}**. Time spent inside the backend; anything beyond this in a rerun is app-side work.")
+st.dataframe(pd.DataFrame([
+    {"Operation": op, "Calls": v["calls"], "Total (ms)": round(v["seconds"] * 1000, 1),
+     "Avg (ms)": round(v["seconds"] * 1000 / v["calls"], 2) if v["calls"] else 0.0}
+    for op, v in storage_stats["ops"].items()
+]), use_container_width=True, hide_index=True)
+
+st.subheader("✉️ SMTP Pool & Outbox (this process)")
+mail_stats = get_mail_stats()
+if mail_stats:
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Sessions Opened", mail_stats["connections"])
+    m2.metric("Reconnects", mail_stats["reconnects"])
+    m3.metric("Sent", mail_stats["sent"])
+    m4.metric("Failed Attempts", mail_stats["failed"])
+    o1, o2, o3, o4 = st.columns(4)
+    o1.metric("Enqueued", mail_stats["outbox_enqueued"])
+    o2.metric("Retries Scheduled", mail_stats["outbox_retried"])
+    o3.metric("Dead-lettered", mail_stats["outbox_dead"])
+    o4.metric("Claim Conflicts", mail_stats["outbox_claim_conflicts"])
+    st.caption(f"Expired leases requeued: {mail_stats['outbox_recovered']} · bodies purged after dead-letter retention: {mail_stats['outbox_purged']} · worker errors: {mail_stats['outbox_worker_errors']}"
+               + (f" (last: {mail_stats['outbox_last_worker_error']})" if mail_stats['outbox_last_worker_error'] else ""))
+else:
+    st.caption("SMTP is not configured.")
+
+with st.expander("🔐 Password Hash Cost (scrypt)"):
+    st.caption("Time per hash on this machine; every login and activation pays this once. Set KDF_LOG2_N / KDF_R / KDF_P to change it.")
+    if st.button("Run KDF Benchmark"):
+        timings = benchmark([KDFParams(log2_n, 8, 1) for log2_n in (12, 13, 14, 15, 16)])
+        st.dataframe(pd.DataFrame([
+            {"n": f"2^{p.log2_n}", "r": p.r, "p": p.p, "Memory (MiB)": 128 * p.r * 2 ** p.log2_n / 2 ** 20, "ms / hash": round(ms, 1)}
+            for p, ms in timings.items()
+        ]), use_container_width=True, hide_index=True)
+
+with st.expander("📜 PO1 Render Time"):
+    tpl_stats = TEMPLATE_CACHE.stats()
+    st.caption(f"Parsed templates: {tpl_stats['templates']} · loads {tpl_stats['loads']} · reloads after file change {tpl_stats['reloads']} · cache hits {tpl_stats['hits']}")
+    job_stats = PO1_JOBS.stats()
+    st.caption(f"Background jobs: {job_stats['submitted']} submitted · {job_stats['rendered']} rendered · {job_stats['cache_hits']} served from cache · "
+               f"{job_stats['joined']} joined an identical job · {job_stats['failed']} failed · {job_stats['in_flight']} in flight · "
+               f"{job_stats['results_entries']} results stored ({round(job_stats['results_bytes'] / 1024)} KB)")
+    if st.button("Run PO1 Render Benchmark"):
+        sample = [{"Date": date.today(), "Responsible Party": "Claimant", "Procedural Requirements": f"Step {i + 1}", "Notes": ""} for i in range(10)]
+        timings = benchmark_render({"Case_Number": "BENCHMARK"}, sample)
+        b1, b2, b3 = st.columns(3)
+        b1.metric("Cold (ms / render)", round(timings["cold"], 1))
+        b2.metric("Warm (ms / render)", round(timings["warm"], 1))
+        b3.metric("Speed-up", f"{timings['cold'] / timings['warm']:.1f}x")
+    if st.button("Run Timetable Builder Benchmark"):
+        st.caption("Building the timetable table alone, cell by cell with python-docx vs as one XML string styled by a table style.")
+        st.dataframe(pd.DataFrame([
+            {"Rows": n, "python-docx (ms)": round(t["python-docx"], 1), "Bulk XML (ms)": round(t["xml"], 2),
+             "Speed-up": f"{t['python-docx'] / t['xml']:.0f}x"}
+            for n, t in benchmark_timetable().items()
+        ]), use_container_width=True, hide_index=True)
+
+# --- 6. RAW DATA INSPECTOR ---
 with st.expander("🕵️ View Raw JSON Data"):
     if to_delete and to_delete in full_data_map:
         st.json(full_data_map[to_delete])
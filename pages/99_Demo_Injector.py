@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import datetime, timedelta, date
 import random
-from db import get_active_case_id, save_complex_data, db
+from db import get_active_case_id, save_complex_data, set_case_status
 
 st.set_page_config(page_title="Realistic Demo Injector", page_icon="💉", layout="wide")
 
@@ -168,7 +168,7 @@ if st.button("🚀 INJECT 'CONSTRUCTION DISPUTE' SCENARIO", type="primary"):
         apps = generate_applications(start_date)
         save_complex_data("applications", apps)
         
-        db.collection("arbitrations").document(case_id).update({"meta.status": "Phase 6: Post-Hearing"})
+        set_case_status(case_id, "Phase 6: Post-Hearing")
 
     st.success("✅ SCENARIO INJECTED: 'The Construction Dispute'")
     st.markdown("""
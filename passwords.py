@@ -0,0 +1,75 @@
+"""Password and setup-PIN hashing.
+
+Secrets are stored as self-describing scrypt hashes,
+
+    scrypt$<log2 n>$<r>$<p>$<salt b64>$<key b64>
+
+so the cost parameters can be raised at any time: existing hashes keep
+verifying with the parameters they were made with, and needs_rehash() tells
+the caller to upgrade one after a successful login. benchmark() reports how
+long a single hash takes for candidate parameters on the current machine.
+"""
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from collections import namedtuple
+
+KDFParams = namedtuple("KDFParams", ["log2_n", "r", "p"])
+
+DEFAULT_PARAMS = KDFParams(log2_n=14, r=8, p=1)
+_KEY_LENGTH = 32
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _derive(secret, salt, params):
+    return hashlib.scrypt(
+        secret.encode("utf-8"), salt=salt, n=2 ** params.log2_n, r=params.r, p=params.p,
+        maxmem=256 * 2 ** params.log2_n * params.r, dklen=_KEY_LENGTH
+    )
+
+
+def _parse(stored):
+    scheme, log2_n, r, p, salt, key = stored.split("$")
+    if scheme != "scrypt":
+        raise ValueError(f"Unknown hash scheme: {scheme}")
+    return KDFParams(int(log2_n), int(r), int(p)), base64.b64decode(salt), base64.b64decode(key)
+
+
+def hash_secret(secret, params=DEFAULT_PARAMS):
+    salt = secrets.token_bytes(16)
+    return "$".join(["scrypt", str(params.log2_n), str(params.r), str(params.p), _b64(salt), _b64(_derive(secret, salt, params))])
+
+
+def verify_secret(secret, stored):
+    """Constant-time check of `secret` against a stored hash. Malformed hashes never verify."""
+    if not stored:
+        return False
+    try:
+        params, salt, key = _parse(stored)
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(_derive(secret, salt, params), key)
+
+
+def needs_rehash(stored, params=DEFAULT_PARAMS):
+    try:
+        return _parse(stored)[0] != params
+    except (ValueError, TypeError):
+        return True
+
+
+def benchmark(candidates, rounds=3):
+    """Average milliseconds per hash for each KDFParams in `candidates`."""
+    results = {}
+    for params in candidates:
+        salt = secrets.token_bytes(16)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            _derive("benchmark-password", salt, params)
+        results[params] = (time.perf_counter() - start) * 1000 / rounds
+    return results
@@ -0,0 +1,393 @@
+"""Procedural Order No. 1 rendering for the Drafting Engine.
+
+Most of a docxtpl render is spent on work that depends only on the template
+file: serialising the document body, patching it into something Jinja
+understands (a pass of regular expressions over the whole body), compiling
+the result, and finally detaching the parsed template body from the
+document when the rendered one replaces it. TEMPLATE_CACHE does the first
+three once per process and keeps a copy of the package with an empty body.
+Every render parses its own fresh DocxTemplate from that copy, so renders
+never share mutable state, and only the body XML and compiled templates are
+shared. The cache checks the file's mtime and size on each use and reloads
+it when it changes on disk.
+
+PO1_JOBS renders in the background: a job is keyed by a hash of the context
+and timetable, so a request identical to a finished one is answered from
+the result cache and one already in flight is joined instead of repeated.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.shared import Inches, Pt
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+from markupsafe import Markup
+
+from doc_cache import BytesCache
+
+PO1_TEMPLATE = "template_po1_SUBDOC.docx"
+
+TIMETABLE_HEADERS = ["Step", "Date", "Responsible Party", "Procedural Requirements", "Notes"]
+TIMETABLE_WIDTHS = [0.5, 1.2, 1.2, 2.0, 1.6]
+TIMETABLE_STYLE_ID = "PO1Timetable"
+
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_BORDER = '<w:{0} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+# Grid borders, 10pt text and a bold header row, so rows carry no formatting of their own.
+_TIMETABLE_STYLE_XML = (
+    f'<w:style xmlns:w="{_W_NS}" w:type="table" w:customStyle="1" w:styleId="{TIMETABLE_STYLE_ID}">'
+    '<w:name w:val="PO1 Timetable"/><w:uiPriority w:val="59"/>'
+    '<w:pPr><w:spacing w:before="0" w:after="0"/></w:pPr><w:rPr><w:sz w:val="20"/><w:szCs w:val="20"/></w:rPr>'
+    '<w:tblPr><w:tblBorders>' + "".join(_BORDER.format(side) for side in ("top", "left", "bottom", "right", "insideH", "insideV")) +
+    '</w:tblBorders><w:tblCellMar><w:left w:w="108" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr>'
+    '<w:tblStylePr w:type="firstRow"><w:rPr><w:b/><w:bCs/></w:rPr><w:trPr><w:tblHeader/></w:trPr></w:tblStylePr>'
+    '</w:style>'
+)
+
+
+def safe_str(val):
+    """Prevents 'None' or 'nan' from appearing in the document."""
+    if val is None:
+        return ""
+    s_val = str(val).strip()
+    if s_val.lower() in ['none', 'nan', 'nat']:
+        return ""
+    return s_val
+
+
+# ==============================================================================
+# TEMPLATE CACHE
+# ==============================================================================
+class _CompiledEnvironment(Environment):
+    """Jinja environment that compiles each distinct template source once."""
+    def __init__(self, max_templates=64):
+        super().__init__()
+        self.max_templates = max_templates
+        self._compiled = {}
+        self._lock = threading.Lock()
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals or template_class:
+            return super().from_string(source, globals, template_class)
+        key = hashlib.sha1(source.encode("utf-8")).digest()
+        with self._lock:
+            template = self._compiled.get(key)
+        if template is None:
+            template = super().from_string(source)
+            with self._lock:
+                if len(self._compiled) >= self.max_templates: self._compiled.clear()
+                self._compiled[key] = template
+        return template
+
+
+class _TemplateEntry:
+    def __init__(self, path, signature, raw):
+        self.path = path
+        self.signature = signature
+        self.env = _CompiledEnvironment()
+        self.patched = {}
+        self.lock = threading.Lock()
+        # Body XML as docxtpl would read it, plus the package without it:
+        # render() replaces the body wholesale, so copies never parse it.
+        tpl = DocxTemplate(BytesIO(raw))
+        tpl.init_docx()
+        self.body_xml = tpl.get_xml()
+        body = tpl.docx.element.body
+        for child in list(body):
+            body.remove(child)
+        ensure_timetable_style(tpl.docx)
+        buf = BytesIO()
+        tpl.docx.save(buf)
+        self.shell = buf.getvalue()
+
+
+class CachedDocxTemplate(DocxTemplate):
+    """A DocxTemplate whose body XML, XML patching and Jinja compilation come from a shared cache entry."""
+    def __init__(self, entry):
+        super().__init__(BytesIO(entry.shell))
+        self._entry = entry
+
+    def get_xml(self):
+        return self._entry.body_xml
+
+    def patch_xml(self, src_xml):
+        key = hashlib.sha1(src_xml.encode("utf-8")).digest()
+        with self._entry.lock:
+            patched = self._entry.patched.get(key)
+        if patched is None:
+            patched = super().patch_xml(src_xml)
+            with self._entry.lock:
+                self._entry.patched[key] = patched
+        return patched
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        super().render(context, jinja_env or self._entry.env, autoescape)
+
+
+class TemplateCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {"loads": 0, "reloads": 0, "hits": 0}
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path=PO1_TEMPLATE):
+        """A fresh, independently renderable template for `path`."""
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature == signature:
+                self._stats["hits"] += 1
+                return CachedDocxTemplate(entry)
+            with open(path, "rb") as f:
+                raw = f.read()
+            self._stats["reloads" if entry is not None else "loads"] += 1
+            entry = self._entries[path] = _TemplateEntry(path, signature, raw)
+        return CachedDocxTemplate(entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "templates": len(self._entries)}
+
+
+TEMPLATE_CACHE = TemplateCache()
+
+
+# ==============================================================================
+# RENDERING
+# ==============================================================================
+def ensure_timetable_style(docx):
+    """Adds the timetable table style to a python-docx Document unless it already has it."""
+    styles = docx.styles.element
+    if styles.find(f"{{{_W_NS}}}style[@{{{_W_NS}}}styleId='{TIMETABLE_STYLE_ID}']") is None:
+        styles.append(parse_xml(_TIMETABLE_STYLE_XML))
+
+
+def _twips(inches):
+    return int(round(inches * 1440))
+
+
+def _cell_props():
+    return [f'<w:tcPr><w:tcW w:w="{_twips(w)}" w:type="dxa"/></w:tcPr>' for w in TIMETABLE_WIDTHS]
+
+
+def _row_xml(values, cell_props, header=False):
+    cells = "".join(
+        f'<w:tc>{props}<w:p><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p></w:tc>'
+        for props, text in zip(cell_props, values)
+    )
+    return f'<w:tr>{"<w:trPr><w:tblHeader/></w:trPr>" if header else ""}{cells}</w:tr>'
+
+
+def timetable_xml(rows):
+    """The timetable as one WordprocessingML table, built in a single pass over `rows`.
+
+    Fonts, borders and the bold header come from the PO1 Timetable table
+    style (see ensure_timetable_style); cells only carry their width. The
+    template has an inline {{ dynamic_table }} tag, so the run and paragraph
+    around it are closed before the table and reopened after it.
+    """
+    cell_props = _cell_props()
+    grid = "".join(f'<w:gridCol w:w="{_twips(w)}"/>' for w in TIMETABLE_WIDTHS)
+    parts = [
+        '</w:t></w:r></w:p><w:tbl>',
+        f'<w:tblPr><w:tblStyle w:val="{TIMETABLE_STYLE_ID}"/><w:tblW w:w="0" w:type="auto"/><w:tblLayout w:type="fixed"/>'
+        '<w:tblLook w:val="04A0" w:firstRow="1" w:lastRow="0" w:firstColumn="0" w:lastColumn="0" w:noHBand="1" w:noVBand="1"/></w:tblPr>',
+        f'<w:tblGrid>{grid}</w:tblGrid>',
+        _row_xml(TIMETABLE_HEADERS, cell_props, header=True),
+    ]
+    for i, row in enumerate(rows):
+        if isinstance(row.get('Date'), date):
+            d_str = row['Date'].strftime("%d %B %Y")
+        else:
+            d_str = safe_str(row.get('Date'))
+        parts.append(_row_xml([str(i + 1), d_str, safe_str(row.get('Responsible Party')),
+                               safe_str(row.get('Procedural Requirements')), safe_str(row.get('Notes'))], cell_props))
+    parts.append('</w:tbl><w:p><w:r><w:t xml:space="preserve">')
+    return Markup("".join(parts))
+
+
+def timetable_subdoc(doc, rows):
+    """The previous cell-by-cell python-docx builder, kept as the baseline for benchmark_timetable."""
+    sd = doc.new_subdoc()
+
+    table = sd.add_table(rows=1, cols=5)
+    table.style = 'Table Grid'
+    table.autofit = False
+
+    # HEADERS
+    hdr_cells = table.rows[0].cells
+    for i, text in enumerate(TIMETABLE_HEADERS):
+        hdr_cells[i].text = text
+        hdr_cells[i].width = Inches(TIMETABLE_WIDTHS[i])
+        for p in hdr_cells[i].paragraphs:
+            for r in p.runs:
+                r.bold = True
+                r.font.size = Pt(10)
+
+    # DATA ROWS - Auto Numbering & Safe String
+    for i, row in enumerate(rows):
+        if isinstance(row.get('Date'), date):
+            d_str = row['Date'].strftime("%d %B %Y")
+        else:
+            d_str = safe_str(row.get('Date'))
+
+        new_row = table.add_row().cells
+        new_row[0].text = str(i + 1)
+        new_row[1].text = d_str
+        new_row[2].text = safe_str(row.get('Responsible Party'))
+        new_row[3].text = safe_str(row.get('Procedural Requirements'))
+        new_row[4].text = safe_str(row.get('Notes'))
+
+        for j, width in enumerate(TIMETABLE_WIDTHS):
+            new_row[j].width = Inches(width)
+            for p in new_row[j].paragraphs:
+                for r in p.runs:
+                    r.font.size = Pt(10)
+    return sd
+
+
+def render_po1(ctx, rows, template_path=PO1_TEMPLATE, cache=TEMPLATE_CACHE, progress=None):
+    """The rendered PO1 as .docx bytes. cache=None parses and compiles the template from scratch.
+
+    progress(fraction, stage) is called as the render moves through its stages.
+    """
+    progress = progress or (lambda fraction, stage: None)
+    progress(0.1, "Loading template")
+    doc = cache.get(template_path) if cache else DocxTemplate(template_path)
+    if not cache:
+        doc.init_docx()
+        ensure_timetable_style(doc.docx)
+    progress(0.3, "Building timetable")
+    table = timetable_xml(rows)
+    progress(0.4, "Rendering clauses")
+    doc.render(dict(ctx, dynamic_table=table))
+    progress(0.9, "Saving document")
+    buf = BytesIO()
+    doc.save(buf)
+    progress(1.0, "Done")
+    return buf.getvalue()
+
+
+# ==============================================================================
+# BACKGROUND JOBS
+# ==============================================================================
+def po1_fingerprint(ctx, rows, template_path=PO1_TEMPLATE):
+    payload = json.dumps({"ctx": ctx, "rows": rows, "template": template_path}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PO1Jobs:
+    """Renders PO1 documents on a worker pool; jobs and results are keyed by po1_fingerprint."""
+    def __init__(self, workers=2, results=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="po1")
+        self.results = results or BytesCache(max_entries=16)
+        self._lock = threading.Lock()
+        self._jobs = {}  # key -> {"state", "progress", "stage", "error", "seconds"}
+        self._stats = {"submitted": 0, "cache_hits": 0, "joined": 0, "rendered": 0, "failed": 0}
+
+    def submit(self, ctx, rows, template_path=PO1_TEMPLATE):
+        """Starts (or joins, or answers from cache) the render for ctx + rows; returns the job key."""
+        key = po1_fingerprint(ctx, rows, template_path)
+        with self._lock:
+            self._stats["submitted"] += 1
+            job = self._jobs.get(key)
+            if job and job["state"] in ("queued", "running"):
+                self._stats["joined"] += 1
+                return key
+            if self.results.get(key) is not None:
+                self._stats["cache_hits"] += 1
+                self._jobs[key] = {"state": "done", "progress": 1.0, "stage": "Served from cache", "error": None, "seconds": 0.0}
+                return key
+            self._jobs[key] = {"state": "queued", "progress": 0.0, "stage": "Queued", "error": None, "seconds": None}
+        self._pool.submit(self._run, key, dict(ctx), [dict(r) for r in rows], template_path)
+        return key
+
+    def _update(self, key, **fields):
+        with self._lock:
+            self._jobs[key].update(fields)
+
+    def _run(self, key, ctx, rows, template_path):
+        start = time.perf_counter()
+        self._update(key, state="running")
+        try:
+            data = render_po1(ctx, rows, template_path, progress=lambda f, stage: self._update(key, progress=f, stage=stage))
+        except Exception:
+            self._update(key, state="failed", error=traceback.format_exc(), seconds=time.perf_counter() - start)
+            with self._lock:
+                self._stats["failed"] += 1
+            return
+        self.results.put(key, data)
+        self._update(key, state="done", progress=1.0, seconds=time.perf_counter() - start)
+        with self._lock:
+            self._stats["rendered"] += 1
+
+    def status(self, key):
+        """The job's state dict, or None for an unknown key."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job["state"] == "done" and self.results.get(key) is None:
+                del self._jobs[key]  # result evicted; submit again
+                return None
+            return dict(job) if job else None
+
+    def result(self, key):
+        """The rendered bytes, or None if not (or no longer) available."""
+        return self.results.get(key)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j["state"] in ("queued", "running"))
+            return {**self._stats, "in_flight": running, **{f"results_{k}": v for k, v in self.results.stats().items()}}
+
+
+PO1_JOBS = PO1Jobs()
+
+
+def benchmark_render(ctx, rows, template_path=PO1_TEMPLATE, rounds=3):
+    """Milliseconds per render without the template cache ("cold") and with a primed one ("warm")."""
+    cache = TemplateCache()
+    results = {}
+    for label, kwargs in (("cold", {"cache": None}), ("warm", {"cache": cache})):
+        if label == "warm": render_po1(ctx, rows, template_path, cache)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            render_po1(ctx, rows, template_path, **kwargs)
+        results[label] = (time.perf_counter() - start) * 1000 / rounds
+    return results
+
+
+def benchmark_timetable(sizes=(10, 50, 100, 250, 500), rounds=3):
+    """Milliseconds to build the timetable, cell by cell (python-docx) vs as one XML string, per row count."""
+    sample = [{"Date": date(2025, 1, 6) + timedelta(weeks=i), "Responsible Party": "Claimant",
+               "Procedural Requirements": f"Submission {i + 1}", "Notes": "Incl. Witness Statements"} for i in range(max(sizes))]
+    doc = DocxTemplate(PO1_TEMPLATE)
+    doc.init_docx()
+    results = {}
+    for n in sizes:
+        rows = sample[:n]
+        timings = {}
+        for label, build in (("python-docx", lambda: str(timetable_subdoc(doc, rows))), ("xml", lambda: timetable_xml(rows))):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                build()
+            timings[label] = (time.perf_counter() - start) * 1000 / rounds
+        results[n] = timings
+    return results
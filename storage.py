@@ -0,0 +1,409 @@
+"""Document storage backends behind db.py.
+
+db.py talks to a small document-store interface instead of the Firestore
+client directly, so the whole app can run against Firestore in production
+and against SQLite (on disk or in memory) on a laptop or CI box.
+
+Documents are addressed by slash paths ("arbitrations/LCIA-1/cost_entries/x").
+Every stored document carries an opaque `version` (Firestore's update_time,
+a counter for SQLite) that writes can use as a precondition.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+
+class VersionConflict(Exception):
+    """The document changed since the version a write was conditioned on."""
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+DELETE = object()
+
+Doc = namedtuple("Doc", ["id", "data", "version"])
+Doc.exists = property(lambda self: self.data is not None)
+
+STORAGE_OPS = ("get", "set", "update", "delete", "list", "write_batch")
+
+
+class StorageBackend:
+    """Interface every backend implements.
+
+    Public methods time themselves so callers can tell storage latency apart
+    from app-side work (see stats()); subclasses implement the _underscored
+    versions.
+
+    write_batch ops are (kind, path, data) with kind in
+    "set" | "merge" | "update" | "delete" | "create"; the batch is atomic.
+    An "update" or "delete" op may carry a fourth element, the expected
+    version; "create" fails if the document exists. Either failure raises
+    VersionConflict and nothing in the batch is written.
+
+    watch(path, callback) calls `callback()` whenever the document at `path`,
+    or any document directly under it when it names a collection, changes
+    after the call. It returns an unsubscribe function.
+    """
+    name = "abstract"
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = {op: {"calls": 0, "seconds": 0.0} for op in STORAGE_OPS}
+
+    def _timed(self, op, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self._stats[op]["calls"] += 1
+                self._stats[op]["seconds"] += elapsed
+
+    def stats(self):
+        with self._stats_lock:
+            return {op: dict(v) for op, v in self._stats.items()}
+
+    def get(self, path):
+        return self._timed("get", self._get, path)
+
+    def set(self, path, data):
+        return self._timed("set", self._set, path, data)
+
+    def update(self, path, updates, expected_version=None):
+        return self._timed("update", self._update, path, updates, expected_version)
+
+    def delete(self, path):
+        return self._timed("delete", self._delete, path)
+
+    def list(self, collection, where=(), order_by=None, descending=False, limit=None, start_after=None, fields=None):
+        """Documents directly under `collection`, ordered by id unless order_by is given.
+
+        where: [(field_path, "==" | "in", value)]; order_by: a field path or a list
+        of them, all in the same direction ("__name__" is the document id);
+        start_after: {order field: value} for every order field;
+        fields: projection of dotted field paths.
+        """
+        return self._timed("list", self._list, collection, list(where), order_by, descending, limit, start_after, fields)
+
+    def write_batch(self, ops):
+        return self._timed("write_batch", self._write_batch, list(ops))
+
+    def watch(self, path, callback):
+        raise NotImplementedError
+
+
+# ==============================================================================
+# FIRESTORE
+# ==============================================================================
+class FirestoreBackend(StorageBackend):
+    name = "firestore"
+
+    def __init__(self, client):
+        super().__init__()
+        from google.cloud import firestore
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        from google.api_core.exceptions import AlreadyExists, Conflict, FailedPrecondition
+        self.client = client
+        self._fs = firestore
+        self._field_filter = FieldFilter
+        self._failed_precondition = FailedPrecondition
+        self._batch_conflicts = (FailedPrecondition, AlreadyExists, Conflict)
+
+    def _value(self, v):
+        if v is DELETE: return self._fs.DELETE_FIELD
+        if isinstance(v, ArrayUnion): return self._fs.ArrayUnion(v.values)
+        if isinstance(v, Increment): return self._fs.Increment(v.value)
+        if isinstance(v, dict): return {k: self._value(x) for k, x in v.items()}
+        return v
+
+    def _get(self, path):
+        snap = self.client.document(path).get()
+        return Doc(snap.id, snap.to_dict() if snap.exists else None, snap.update_time if snap.exists else None)
+
+    def _set(self, path, data):
+        return self.client.document(path).set(data).update_time
+
+    def _update(self, path, updates, expected_version):
+        option = self.client.write_option(last_update_time=expected_version) if expected_version else None
+        try:
+            result = self.client.document(path).update({k: self._value(v) for k, v in updates.items()}, option=option)
+        except self._failed_precondition as e:
+            raise VersionConflict(str(e))
+        return result.update_time
+
+    def _delete(self, path):
+        self.client.document(path).delete()
+
+    def _list(self, collection, where, order_by, descending, limit, start_after, fields):
+        query = self.client.collection(collection)
+        for field, op, value in where:
+            query = query.where(filter=self._field_filter(field, op, value))
+        for field in _order_fields(order_by):
+            query = query.order_by(field, direction=self._fs.Query.DESCENDING if descending else self._fs.Query.ASCENDING)
+        if start_after:
+            query = query.start_after(start_after)
+        if limit:
+            query = query.limit(limit)
+        if fields is not None:
+            # An empty projection returns whole documents; project the id for "ids only".
+            query = query.select(fields or ["__name__"])
+        return [Doc(d.id, d.to_dict() if fields != [] else {}, d.update_time) for d in query.stream()]
+
+    def _write_batch(self, ops):
+        batch = self.client.batch()
+        for kind, path, data, *expected in ops:
+            ref = self.client.document(path)
+            option = self.client.write_option(last_update_time=expected[0]) if expected and expected[0] else None
+            if kind == "delete": batch.delete(ref, option=option)
+            elif kind == "update": batch.update(ref, {k: self._value(v) for k, v in data.items()}, option=option)
+            elif kind == "create": batch.create(ref, self._value(data))
+            else: batch.set(ref, self._value(data), merge=kind == "merge")
+        try:
+            results = batch.commit()
+        except self._batch_conflicts as e:
+            raise VersionConflict(str(e))
+        # One write result per op, deletes included
+        return [None if op[0] == "delete" else r.update_time for op, r in zip(ops, results)]
+
+    def watch(self, path, callback):
+        # Odd segment counts name collections, even ones documents.
+        is_collection = path.count("/") % 2 == 0
+        ref = self.client.collection(path) if is_collection else self.client.document(path)
+        seen_initial = threading.Event()
+
+        def on_snapshot(*_):
+            # The first event is the state at subscription time, not a change.
+            if seen_initial.is_set(): callback()
+            else: seen_initial.set()
+
+        watcher = ref.on_snapshot(on_snapshot)
+        return watcher.unsubscribe
+
+
+# ==============================================================================
+# SQLITE (file or in-memory)
+# ==============================================================================
+def _encode(obj):
+    if isinstance(obj, datetime): return {"$datetime": obj.isoformat()}
+    if isinstance(obj, date): return {"$date": obj.isoformat()}
+    raise TypeError(f"Cannot store {type(obj).__name__}")
+
+
+def _decode(obj):
+    if "$datetime" in obj: return datetime.fromisoformat(obj["$datetime"])
+    if "$date" in obj: return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def _dumps(data):
+    return json.dumps(data, default=_encode)
+
+
+def _loads(text):
+    return json.loads(text, object_hook=_decode)
+
+
+def _lookup(data, field_path):
+    node = data
+    for p in field_path.split("."):
+        if not isinstance(node, dict) or p not in node: return None
+        node = node[p]
+    return node
+
+
+def apply_updates(data, updates):
+    """Applies Firestore-style {dotted.path: value} updates (incl. DELETE / ArrayUnion / Increment) in place."""
+    for path, value in updates.items():
+        node = data
+        *parents, leaf = path.split(".")
+        for p in parents:
+            if not isinstance(node.get(p), dict): node[p] = {}
+            node = node[p]
+        if value is DELETE:
+            node.pop(leaf, None)
+        elif isinstance(value, ArrayUnion):
+            current = node.get(leaf) if isinstance(node.get(leaf), list) else []
+            node[leaf] = current + [v for v in value.values if v not in current]
+        elif isinstance(value, Increment):
+            current = node.get(leaf)
+            node[leaf] = (current if isinstance(current, (int, float)) else 0) + value.value
+        else:
+            node[leaf] = json.loads(_dumps(value), object_hook=_decode)
+    return data
+
+
+class SQLiteBackend(StorageBackend):
+    """Single-table document store. path=":memory:" keeps everything in process."""
+    name = "sqlite"
+
+    def __init__(self, path=":memory:"):
+        super().__init__()
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL" if path != ":memory:" else "PRAGMA journal_mode=MEMORY")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (path TEXT PRIMARY KEY, parent TEXT NOT NULL, data TEXT NOT NULL, version INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS docs_parent ON docs (parent, path)")
+        self._last_version = 0
+        # In-process change notifications; writes from other processes sharing
+        # the same file are not observed.
+        self._watchers = {}
+
+    def _next_version(self):
+        self._last_version = max(time.time_ns(), self._last_version + 1)
+        return self._last_version
+
+    def _row(self, path):
+        return self._conn.execute("SELECT data, version FROM docs WHERE path = ?", (path,)).fetchone()
+
+    def _put(self, path, data):
+        version = self._next_version()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO docs (path, parent, data, version) VALUES (?, ?, ?, ?)",
+            (path, path.rsplit("/", 1)[0], _dumps(data), version),
+        )
+        return version
+
+    def _apply(self, kind, path, data, expected_version=None):
+        row = self._row(path)
+        if expected_version is not None and (row is None or row[1] != expected_version):
+            raise VersionConflict(path)
+        if kind == "delete":
+            self._conn.execute("DELETE FROM docs WHERE path = ?", (path,))
+            return None
+        if kind == "create":
+            if row is not None:
+                raise VersionConflict(path)
+            return self._put(path, data)
+        if kind == "set" or (kind == "merge" and row is None):
+            return self._put(path, data)
+        if row is None:
+            raise KeyError(f"No document to update: {path}")
+        current = _loads(row[0])
+        if kind == "merge":
+            data = dict(_flatten(data))
+        return self._put(path, apply_updates(current, data))
+
+    def _transaction(self, fn, paths=()):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            callbacks = dict.fromkeys(cb for p in paths for key in (p, p.rsplit("/", 1)[0]) for cb in self._watchers.get(key, ()))
+        for cb in callbacks:
+            cb()
+        return result
+
+    def _get(self, path):
+        with self._lock:
+            row = self._row(path)
+        doc_id = path.rsplit("/", 1)[-1]
+        return Doc(doc_id, _loads(row[0]), row[1]) if row else Doc(doc_id, None, None)
+
+    def _set(self, path, data):
+        return self._transaction(lambda: self._apply("set", path, data), [path])
+
+    def _update(self, path, updates, expected_version):
+        return self._transaction(lambda: self._apply("update", path, updates, expected_version), [path])
+
+    def _delete(self, path):
+        self._transaction(lambda: self._apply("delete", path, None), [path])
+
+    def _list(self, collection, where, order_by, descending, limit, start_after, fields):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, data, version FROM docs WHERE parent = ? ORDER BY path", (collection,)
+            ).fetchall()
+        docs = [Doc(p.rsplit("/", 1)[-1], _loads(d), v) for p, d, v in rows]
+        for field, op, value in where:
+            if op == "==": docs = [d for d in docs if _lookup(d.data, field) == value]
+            elif op == "in": docs = [d for d in docs if _lookup(d.data, field) in value]
+            else: raise ValueError(f"Unsupported operator: {op}")
+        if order_by:
+            order = _order_fields(order_by)
+            key = lambda d: tuple(d.id if f == "__name__" else _lookup(d.data, f) for f in order)
+            docs = [d for d in docs if None not in key(d)]
+            docs.sort(key=key, reverse=descending)
+            if start_after:
+                cursor = tuple(start_after[f] for f in order)
+                docs = [d for d in docs if (key(d) < cursor if descending else key(d) > cursor)]
+        if limit:
+            docs = docs[:limit]
+        if fields is not None:
+            docs = [Doc(d.id, _project(d.data, fields), d.version) for d in docs]
+        return docs
+
+    def _write_batch(self, ops):
+        return self._transaction(lambda: [self._apply(*op) for op in ops], [op[1] for op in ops])
+
+    def watch(self, path, callback):
+        with self._lock:
+            self._watchers.setdefault(path, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._watchers.get(path, [])
+                if callback in callbacks: callbacks.remove(callback)
+                if not callbacks: self._watchers.pop(path, None)
+        return unsubscribe
+
+
+def _order_fields(order_by):
+    if not order_by: return []
+    return [order_by] if isinstance(order_by, str) else list(order_by)
+
+
+def _flatten(data, prefix=""):
+    for k, v in data.items():
+        if isinstance(v, dict) and v:
+            yield from _flatten(v, f"{prefix}{k}.")
+        else:
+            yield f"{prefix}{k}", v
+
+
+def _project(data, fields):
+    out = {}
+    for f in fields:
+        value = _lookup(data, f)
+        if value is not None:
+            apply_updates(out, {f: value})
+    return out
+
+
+# ==============================================================================
+# SELECTION
+# ==============================================================================
+def backend_from_settings(kind, service_account=None, database=None, sqlite_path=None):
+    """kind: "firestore" | "sqlite" | "memory"."""
+    if kind == "firestore":
+        from google.cloud import firestore
+        if database:
+            try:
+                return FirestoreBackend(firestore.Client.from_service_account_info(service_account, database=database))
+            except Exception:
+                pass
+        return FirestoreBackend(firestore.Client.from_service_account_info(service_account))
+    if kind == "sqlite":
+        return SQLiteBackend(sqlite_path or os.environ.get("PROCEED_SQLITE_PATH", "proceed_local.sqlite3"))
+    if kind == "memory":
+        return SQLiteBackend(":memory:")
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,8 @@
+"""Test setup: modules live at the repository root, which is not a package."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# db.py connects on import; keep every test on a throwaway in-process store.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
@@ -0,0 +1,89 @@
+import pytest
+
+import db
+
+
+def nonzero(tree):
+    """Aggregates without the zero counters decrements leave behind."""
+    if isinstance(tree, dict):
+        pruned = {k: nonzero(v) for k, v in tree.items()}
+        return {k: v for k, v in pruned.items() if v not in (0, {})}
+    return tree
+
+
+def assert_consistent(cid):
+    stored = db.db.get(db._aggregates_path(cid)).data
+    record = db._load_case(cid)
+    assert nonzero(stored) == nonzero(db._compute_aggregates(record["data"]["complex_data"]))
+
+
+def entry(amount, phase="Phase 1: Initiation"):
+    return {"date": "2025-01-03", "amount": amount, "phase": phase, "category": "Legal Fees"}
+
+
+@pytest.fixture
+def split_case():
+    cid, _ = db.create_new_case("A v B", "c@x", "r@x", "a@x")
+    db.st.session_state["active_case_id"] = cid
+    yield cid
+    db.delete_case(cid)
+
+
+@pytest.fixture
+def legacy_case():
+    cid = "LEGACY-1"
+    db.db.set(f"arbitrations/{cid}", {"meta": {"case_id": cid}, "complex_data": {"costs": {"claimant_log": [entry(7)]}}})
+    db.st.session_state["active_case_id"] = cid
+    yield cid
+    db.delete_case(cid)
+
+
+def test_appends_and_saves_keep_the_summary_in_step(split_case):
+    db.append_cost_entry("claimant_log", entry(100))
+    db.append_cost_entry("claimant_log", entry(50, "Phase 3: Document Production"))
+    costs = db.load_complex_data()["costs"]
+    costs["claimant_log"][0]["amount"] = 120
+    costs["respondent_log"].append(entry(30))
+    db.save_complex_data("costs", costs)
+    db.save_complex_data("doc_prod", {"claimant": [{"status": "Denied"}, {"status": "Pending"}], "respondent": []})
+    assert_consistent(split_case)
+    assert db.db.get(db._aggregates_path(split_case)).data["costs"]["claimant_log"]["total"] == 170
+
+
+def test_delta_uses_the_stored_item_not_the_stale_snapshot(split_case):
+    db.save_complex_data("costs", {"claimant_log": [entry(10), entry(20)]})
+    costs = db.load_complex_data()["costs"]
+    snap = db._get_snapshot(split_case)
+    # Another session edits the second entry after we loaded it.
+    item_id = snap["ids"]["costs"]["claimant_log"][1]
+    db.db.update(f"arbitrations/{split_case}/cost_entries/{item_id}", {"amount": 999})
+    db.db.update(db._aggregates_path(split_case), {"costs.claimant_log.total": db.Increment(979),
+                                                   "costs.claimant_log.by_phase.phase_1_initiation": db.Increment(979),
+                                                   "costs.claimant_log.by_category.legal_fees": db.Increment(979),
+                                                   "costs.claimant_log.by_month.k_2025_01": db.Increment(979)})
+    costs["claimant_log"] = costs["claimant_log"][:1]
+    db._save_items(snap, "costs", costs, db.three_way_merge)
+    assert_consistent(split_case)
+
+
+def test_merged_value_is_what_the_summary_counts(legacy_case):
+    db.append_cost_entry("claimant_log", entry(5))  # seeds the summary
+    snap = db._get_snapshot(legacy_case)
+    mine = {"claimant_log": snap["data"]["complex_data"]["costs"]["claimant_log"] + [entry(1)]}
+    db.append_cost_entry("claimant_log", entry(40))  # lands between our load and our save
+    db._versioned_update(snap, "costs", "complex_data.costs", mine, db.three_way_merge)
+    saved = db.db.get(f"arbitrations/{legacy_case}").data["complex_data"]["costs"]["claimant_log"]
+    assert sorted(e["amount"] for e in saved) == [1, 5, 7, 40]
+    assert_consistent(legacy_case)
+
+
+def test_concurrent_first_writers_do_not_overwrite_each_other(legacy_case):
+    first = db._load_case(legacy_case)
+    second = db._load_case(legacy_case)
+    assert first["aggregates"] is None and second["aggregates"] is None
+    db._write_with_aggregates(first, [("update", f"arbitrations/{legacy_case}", {"complex_data.costs.claimant_log": db.ArrayUnion([entry(10)])})],
+                              "costs", {}, {"claimant_log": [entry(10)]})
+    db._write_with_aggregates(second, [("update", f"arbitrations/{legacy_case}", {"complex_data.costs.claimant_log": db.ArrayUnion([entry(20)])})],
+                              "costs", {}, {"claimant_log": [entry(20)]})
+    assert db.db.get(db._aggregates_path(legacy_case)).data["costs"]["claimant_log"]["total"] == 37
+    assert_consistent(legacy_case)
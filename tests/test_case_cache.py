@@ -0,0 +1,39 @@
+from case_cache import SharedCaseCache
+
+
+class Backend:
+    def __init__(self, fail_watch=False):
+        self.fail_watch = fail_watch
+        self.callbacks = []
+
+    def watch(self, path, callback):
+        if self.fail_watch:
+            raise RuntimeError("listener quota exceeded")
+        self.callbacks.append(callback)
+        return lambda: None
+
+
+def cache(backend, loads):
+    def loader(case_id):
+        loads.append(case_id)
+        return {"case_id": case_id}
+    return SharedCaseCache(backend, loader, lambda cid: [f"arbitrations/{cid}"])
+
+
+def test_watched_case_is_loaded_once_per_change():
+    backend, loads = Backend(), []
+    c = cache(backend, loads)
+    c.get("A"); c.get("A")
+    backend.callbacks[0]()
+    c.get("A")
+    assert loads == ["A", "A"]
+    assert c.stats()["hits"] == 1 and c.stats()["watch_errors"] == 0
+
+
+def test_case_that_cannot_be_watched_is_served_uncached_and_counted():
+    loads = []
+    c = cache(Backend(fail_watch=True), loads)
+    assert c.get("A") == {"case_id": "A"}
+    assert c.get("A") == {"case_id": "A"}
+    assert loads == ["A", "A"]
+    assert c.stats()["watch_errors"] == 1
@@ -0,0 +1,53 @@
+import ast
+import os
+
+import pytest
+
+from clauses import (CLAUSE_INDEX, CLAUSE_LIBRARY, QUESTION_CLAUSES, UNMATCHED_OPTIONS,
+                     answer_option, default_variation, option_id)
+
+QUESTIONNAIRE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "00_Edit_Questionnaire.py")
+
+
+def phase2_options():
+    """Option ids per question of the default phase 2 questionnaire, read without running the page."""
+    tree = ast.parse(open(QUESTIONNAIRE, encoding="utf-8").read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and node.targets[0].id == "DEFAULTS_PHASE_2":
+            return {q["id"]: [option_id(o) for o in q.get("options", [])] for q in ast.literal_eval(node.value)}
+    raise AssertionError("DEFAULTS_PHASE_2 not found")
+
+
+def label(question_id, answer_text):
+    variations = list(CLAUSE_LIBRARY[QUESTION_CLAUSES[question_id]])
+    return variations[default_variation(question_id, {question_id: answer_text})]
+
+
+def test_every_option_is_bound_or_listed_as_unmatched():
+    options = phase2_options()
+    for question_id in QUESTION_CLAUSES:
+        for oid in options[question_id]:
+            assert ((question_id, oid) in CLAUSE_INDEX) != ((question_id, oid) in UNMATCHED_OPTIONS), (question_id, oid)
+    for question_id, oid in UNMATCHED_OPTIONS:
+        assert oid in options[question_id]
+
+
+@pytest.mark.parametrize("question_id, answer, expected", [
+    ("disability", "**Option B (Specific Needs Now):** A participant already requires ...", "Option A (Included)"),
+    ("disability", "**Option C:** No specific clause is required in PO1", "Option B (None)"),
+    ("sustainability", "**Option B (Tribunal Discretion):** The Tribunal shall consider ...", "Option C (Tribunal Discretion)"),
+    ("sec_fees", "**Option B: Draft PO1 Template (£100 - £250 / hr).** Hourly rate ...", "Option C (Template Rate)"),
+    ("mediation", "**Option A (Standard):** The arbitration proceeds on a linear timetable.", "Option B (No Window)"),
+    ("physical_venue_preference", "**Option B: Neutral Venue.** ...", "Neutral Venue"),
+    ("limits_submission", "**Option C: Legal Only.** ...", "Option C (Legal Only)"),
+    ("currency", "**Option C: Tribunal Discretion.** ...", "Option A (Contract)"),
+])
+def test_answers_select_the_matching_variation(question_id, answer, expected):
+    assert label(question_id, answer) == expected
+
+
+def test_saved_option_id_wins_over_text():
+    answers = {"style": "edited wording", "style_option": "B"}
+    assert answer_option(answers, "style") == "B"
+    assert default_variation("style", answers) == 1
+    assert default_variation("style", {}) == 0
@@ -0,0 +1,82 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("docx")
+
+import db
+from ai_logic import DOC_PROD_PHASE, CostAnalysis, CumulativeCostIndex, cost_memo_inputs
+
+START = date(2024, 1, 1)
+
+
+def ledger(rng, n):
+    phases = ["Phase 1: Initiation", "Phase 2: Written Submissions", DOC_PROD_PHASE, "Phase 4: Hearing"]
+    return [{"date": (START + timedelta(days=rng.randrange(400))).isoformat(), "amount": round(rng.uniform(100, 5000), 2),
+             "phase": rng.choice(phases), "category": rng.choice(["Legal Fees", "Expert Fees", "Security for Costs"])}
+            for _ in range(n)]
+
+
+@pytest.fixture
+def config():
+    rng = random.Random(7)
+    return {
+        "meta": {"cost_settings": {"doc_prod_threshold": 60.0, "delay_penalty_rate": 0.5}},
+        "complex_data": {
+            "costs": {
+                "claimant_log": ledger(rng, 40), "respondent_log": ledger(rng, 35),
+                "sealed_offers": [
+                    {"offerer": "respondent", "amount": 250000, "date": "2024-03-01"},
+                    {"offerer": "respondent", "amount": 100000, "date": "2024-09-15"},
+                    {"offerer": "claimant", "amount": -50000, "date": "2024-06-30"},
+                    {"offerer": "claimant", "amount": "n/a", "date": "2024-06-30"},
+                ],
+            },
+            "doc_prod": {"claimant": [{"status": "Denied"}] * 3 + [{"status": "Granted"}], "respondent": [{"status": "Granted"}]},
+            "delays": [{"requestor": "claimant", "days": 4, "is_consensual": False, "event": "Reply"},
+                       {"requestor": "respondent", "days": 2, "is_consensual": False, "event": "Rejoinder"}],
+            "applications": [{"type": "Security for Costs", "filing_party": "respondent", "outcome": "Denied", "date": "2024-05-01"},
+                             {"type": "Interim Measures", "filing_party": "claimant", "outcome": "Denied", "costs": 1200}],
+        },
+    }
+
+
+def test_total_after_matches_a_ledger_scan():
+    rng = random.Random(3)
+    log = ledger(rng, 200) + [{"date": "not a date", "amount": 5}, {"amount": 9}]
+    idx = CumulativeCostIndex(log)
+    assert idx.total() == pytest.approx(sum(e["amount"] for e in log[:200]))
+    for cutoff in [START - timedelta(days=1), START, START + timedelta(days=57), START + timedelta(days=500)]:
+        expected = sum(e["amount"] for e in log[:200] if date.fromisoformat(e["date"]) > cutoff)
+        assert idx.total_after(cutoff) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("with_aggregates", [False, True])
+def test_award_sweep_agrees_with_net_cost_order(config, with_aggregates):
+    aggregates = db._compute_aggregates(config["complex_data"]) if with_aggregates else None
+    analysis = CostAnalysis(config, aggregates)
+    awards = [-300000, -50000, -1, 0, 1, 50000, 99999.99, 100000, 180000, 250000, 400000]
+    sweep = analysis.award_sweep(awards)
+    for award, net in zip(awards, sweep["net_order"]):
+        assert net == pytest.approx(analysis.net_cost_order(award)["net_order"], abs=0.01), award
+    assert CostAnalysis(config).net_cost_order(180000)["net_order"] == analysis.net_cost_order(180000)["net_order"]
+
+
+def test_failed_applications_move_only_recorded_costs(config):
+    analysis = CostAnalysis(config)
+    # The respondent's lost application has no recorded costs, although the
+    # claimant's ledger has "Security for Costs" entries.
+    assert analysis.failed_application_costs("respondent") == 0.0
+    assert analysis.failed_application_costs("claimant") == 1200.0
+    steps = dict(analysis.net_cost_order(-300000)["steps"])
+    assert steps["Claimant's costs of Respondent's failed Security for Costs (unquantified, no adjustment)"] == 0.0
+
+
+def test_memo_inputs_take_reversals_from_the_order(config):
+    analysis = CostAnalysis(config)
+    for award in (0, 180000):
+        inputs = cost_memo_inputs("CASE", award, analysis)
+        assert inputs["reversals"] == inputs["order"]["reversals"]
+    assert cost_memo_inputs("CASE", 0, analysis)["reversals"]
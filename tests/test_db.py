@@ -0,0 +1,132 @@
+import pytest
+
+import db
+
+
+@pytest.fixture
+def case_id():
+    cid, _ = db.create_new_case("A v B", "c@x", "r@x", "a@x")
+    db.st.session_state["active_case_id"] = cid
+    yield cid
+    db.invalidate_snapshot()
+
+
+def test_delete_case_removes_outbox_messages(case_id):
+    db.db.set("email_outbox/m1", {"case_id": case_id, "to": "c@x", "subject": "S", "body": "PIN: 123456", "status": "dead"})
+    db.db.set("email_outbox/m2", {"case_id": "OTHER", "to": "x@x", "subject": "S", "body": "hi", "status": "sent"})
+    db.delete_case(case_id)
+    assert not db.db.get("email_outbox/m1").exists
+    assert db.db.get("email_outbox/m2").exists
+
+
+@pytest.fixture
+def legacy_case():
+    cid = "LEGACY-CREDS"
+    db.db.set(f"arbitrations/{cid}", {"meta": {
+        "case_id": cid,
+        "parties": {"claimant": "C@x ", "respondent": "r@x", "arbitrator": ""},
+        "setup_pins": {"claimant": "111111", "respondent": "222222"},
+    }})
+    known = set(db._MIGRATED_CASES)
+    yield cid
+    db.delete_case(cid)
+    db._MIGRATED_CASES.clear(); db._MIGRATED_CASES.update(known)
+
+
+def test_migration_moves_credentials_once(legacy_case):
+    assert db.activate_user_account(legacy_case, "c@x", "111111", "pw", "claimant")[0]
+    meta = db.db.get(f"arbitrations/{legacy_case}").data["meta"]
+    assert meta["credentials_migrated"] and "parties" not in meta and "setup_pins" not in meta
+    reads = db.get_read_stats()["document_reads"]
+    # No arbitrator on this case: the miss must not read the case again.
+    assert db.login_user(legacy_case, "a@x", "pw", "arbitrator")[1] == "Email mismatch."
+    assert db.get_read_stats()["document_reads"] == reads
+    assert db.migrate_case_credentials(legacy_case) == 0
+
+
+def test_concurrent_migration_does_not_overwrite_an_activation(legacy_case, monkeypatch):
+    stale = db._read_case_doc(legacy_case)
+    assert db.migrate_case_credentials(legacy_case) == 2
+    assert db.activate_user_account(legacy_case, "c@x", "111111", "pw", "claimant")[0]
+    reads = iter([stale])
+    real = db._read_case_doc
+    monkeypatch.setattr(db, "_read_case_doc", lambda cid: next(reads, None) or real(cid))
+    assert db.migrate_case_credentials(legacy_case) == 0
+    assert db.login_user(legacy_case, "c@x", "pw", "claimant")[0]
+
+
+def test_memo_cache_hits_touch_last_used_at_coarsely(case_id, monkeypatch):
+    db.store_memo(case_id, "f1", "memo", "m1", 100.0)
+    updates = []
+    real_update = db.db.update
+    monkeypatch.setattr(db.db, "update", lambda *a, **k: updates.append(a[0]) or real_update(*a, **k))
+    assert db.get_cached_memo(case_id, "f1")["text"] == "memo"
+    assert db.get_cached_memo(case_id, "f1")
+    assert updates == []
+    real_update(db._memo_path(case_id, "f1"), {"last_used_at": 0})
+    assert db.get_cached_memo(case_id, "f1")
+    assert updates == [db._memo_path(case_id, "f1")]
+
+
+def test_case_pages_do_not_skip_cases_created_in_the_same_second():
+    created = db.datetime(2020, 1, 1, 12, 0, 0)
+    ids = [f"LCIA-SAME-{i}" for i in range(5)]
+    for cid in ids:
+        db.db.set(f"case_index/{cid}", {"case_id": cid, "case_name": cid, "status": "Phase 1: Initiation", "created_at": created})
+    seen, after = [], None
+    while True:
+        page = db.get_all_cases_metadata(page_size=2, after=after)
+        if not page: break
+        seen += [c["case_id"] for c in page]
+        after = page[-1]
+    for cid in ids:
+        db.db.delete(f"case_index/{cid}")
+    assert len(seen) == len(set(seen))
+    assert [c for c in seen if c in ids] == sorted(ids, reverse=True)
+
+
+def test_unindexed_cases_are_backfilled_once_when_the_index_is_not_empty(case_id, monkeypatch):
+    legacy = "LCIA-UNINDEXED"
+    db.db.set(f"arbitrations/{legacy}", {"meta": {"case_id": legacy, "case_name": "Old", "status": "Phase 4: Hearing",
+                                                  "created_at": db.datetime(2019, 5, 1)}})
+    db.db.delete(db._INDEX_MIGRATION_PATH)
+    monkeypatch.setattr(db, "_index_backfilled", False)
+    ids = [c["case_id"] for c in db.get_all_cases_metadata()]
+    assert case_id in ids and legacy in ids
+    assert db.db.get(db._INDEX_MIGRATION_PATH).exists
+    monkeypatch.setattr(db, "_index_backfilled", False)
+    monkeypatch.setattr(db, "rebuild_case_index", lambda: pytest.fail("backfill ran twice"))
+    assert legacy in [c["case_id"] for c in db.get_all_cases_metadata()]
+    db.delete_case(legacy)
+
+
+def test_blank_email_for_a_role_without_credentials_is_a_mismatch(legacy_case):
+    assert db.activate_user_account(legacy_case, "  ", "111111", "pw", "arbitrator") == (False, "Email mismatch for arbitrator.")
+    assert db.login_user(legacy_case, " ", "pw", "arbitrator")[:2] == (False, "Email mismatch.")
+    assert db.login_user(legacy_case, "", "pw", "claimant")[:2] == (False, "Email mismatch.")
+
+
+@pytest.fixture
+def one_run(monkeypatch):
+    """Every call happens in the same Streamlit run."""
+    run = {}
+    monkeypatch.setattr(db, "_run_marker", lambda: run)
+    yield
+    db.invalidate_snapshot()
+
+
+def test_own_write_does_not_make_the_next_save_in_the_run_conflict(case_id, one_run):
+    db.load_full_config()
+    before = (db.get_contention_stats()["retries"], db.get_read_stats()["document_reads"])
+    db.save_structure([{"id": "q1"}])
+    db.save_responses({"claimant": {"style": "A"}})
+    assert (db.get_contention_stats()["retries"], db.get_read_stats()["document_reads"]) == before
+
+
+def test_foreign_write_keeps_the_snapshot_version_so_it_is_merged(case_id, one_run):
+    db.load_full_config()
+    db.db.update(f"arbitrations/{case_id}", {"responses.respondent": {"style": "B"}, "revisions.responses": 1})
+    db.save_structure([{"id": "q1"}])
+    db.save_responses({"claimant": {"style": "A"}, "respondent": {}})
+    responses = db.db.get(f"arbitrations/{case_id}").data["responses"]
+    assert responses == {"claimant": {"style": "A"}, "respondent": {"style": "B"}}
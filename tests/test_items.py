@@ -0,0 +1,73 @@
+import copy
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def case_id():
+    cid, _ = db.create_new_case("A v B", "c@x", "r@x", "a@x")
+    db.st.session_state["active_case_id"] = cid
+    return cid
+
+
+def events(*names):
+    return [{"event": n, "owner": "Claimant", "status": "Upcoming"} for n in names]
+
+
+def stored(cid):
+    docs = db.db.list(f"arbitrations/{cid}/timeline_events")
+    return [d.id for d in docs], [d.data for d in docs]
+
+
+def writes(before):
+    """Storage write calls since `before` (a batch counts once)."""
+    after = db.db.stats()
+    return sum(after[op]["calls"] - before[op]["calls"] for op in ("set", "update", "delete", "write_batch"))
+
+
+def test_removing_an_item_is_one_delete(case_id):
+    db.save_complex_data("timeline", events("a", "b", "c", "d", "e"))
+    ids, _ = stored(case_id)
+    before = db.db.stats()
+    db.save_complex_data("timeline", events("a", "c", "d", "e"))
+    assert writes(before) == 1
+    assert stored(case_id) == ([ids[0]] + ids[2:], events("a", "c", "d", "e"))
+
+
+def test_editing_an_item_is_one_update_under_the_same_id(case_id):
+    db.save_complex_data("timeline", events("a", "b", "c"))
+    ids, _ = stored(case_id)
+    edited = events("a", "b", "c")
+    edited[1]["status"] = "Done"
+    before = db.db.stats()
+    db.save_complex_data("timeline", edited)
+    assert writes(before) == 1
+    assert stored(case_id) == (ids, edited)
+
+
+def test_inserted_item_keeps_list_order(case_id):
+    db.save_complex_data("timeline", events("a", "b", "c"))
+    ids, _ = stored(case_id)
+    db.save_complex_data("timeline", events("a", "x", "b", "c"))
+    new_ids, items = stored(case_id)
+    assert items == events("a", "x", "b", "c")
+    assert new_ids[0] == ids[0]
+    db.invalidate_snapshot()
+    assert db.load_complex_data()["timeline"] == events("a", "x", "b", "c")
+
+
+def test_edit_of_an_item_deleted_meanwhile_does_not_recreate_it(case_id):
+    entry = lambda amount: {"date": "2025-01-03", "amount": amount, "phase": "Phase 1: Initiation", "category": "Legal Fees"}
+    db.save_complex_data("costs", {"claimant_log": [entry(10), entry(20)]})
+    mine = db.load_complex_data()["costs"]
+    snap = copy.deepcopy(db._get_snapshot(case_id))  # this session's rerun
+    db.invalidate_snapshot()
+    db.save_complex_data("costs", {"claimant_log": [entry(10)]})  # another session deletes the 20
+    mine["claimant_log"][1]["amount"] = 25
+    saved = db._save_items(snap, "costs", mine, db.three_way_merge)
+    assert saved["claimant_log"] == [entry(10)]
+    docs = db.db.list(f"arbitrations/{case_id}/cost_entries")
+    assert [d.data["amount"] for d in docs] == [10]
+    assert db.db.get(db._aggregates_path(case_id)).data["costs"]["claimant_log"]["total"] == 10
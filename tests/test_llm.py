@@ -0,0 +1,111 @@
+import pytest
+
+from llm import AllModelsUnavailable, CircuitBreaker, ModelMetrics, ModelRouter, StubBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=2, cooldown=60, unavailable_cooldown=3600, clock=clock)
+
+
+def router(backend, breaker, models=("m1", "m2")):
+    return ModelRouter(backend, models=list(models), breaker=breaker, metrics=ModelMetrics())
+
+
+def test_opens_after_threshold_and_lets_one_trial_through(breaker, clock):
+    breaker.failure("m1")
+    assert breaker.allow("m1")
+    breaker.failure("m1")
+    assert not breaker.allow("m1")
+    clock.now += 61
+    assert breaker.available("m1")
+    assert breaker.allow("m1")
+    assert not breaker.allow("m1")  # trial in flight
+    assert not breaker.available("m1")
+    assert breaker.status()["m1"]["trial"]
+
+
+def test_trial_failure_reopens_and_success_closes(breaker, clock):
+    breaker.failure("m1", unavailable=True)
+    clock.now += 3601
+    assert breaker.allow("m1")
+    breaker.failure("m1")  # below the threshold, but it was the trial
+    assert not breaker.allow("m1")
+    clock.now += 61
+    assert breaker.allow("m1")
+    breaker.success("m1")
+    assert breaker.allow("m1") and breaker.allow("m1")
+
+
+def test_unreported_trial_is_released_or_expires(breaker, clock):
+    breaker.failure("m1"); breaker.failure("m1")
+    clock.now += 61
+    assert breaker.allow("m1")
+    breaker.release("m1")
+    assert breaker.allow("m1")
+    clock.now += 61
+    assert breaker.allow("m1")
+
+
+def test_router_skips_open_models_and_uses_the_trial(breaker, clock):
+    backend = StubBackend(latency=0, unavailable={"m1"})
+    r = router(backend, breaker)
+    assert r.generate("prompt")[1] == "m2"
+    assert r.status()["m1"]["open"]
+    assert r.healthy_models() == ["m2"]
+    backend.unavailable.clear()
+    clock.now += 3601
+    assert r.generate("prompt")[1] == "m1"
+    assert not r.status()["m1"]["open"] and not r.status()["m1"]["trial"]
+
+
+def test_router_raises_when_every_model_fails(breaker):
+    with pytest.raises(AllModelsUnavailable):
+        router(StubBackend(latency=0, error_rate=1.0), breaker).generate("prompt")
+
+
+def test_hedge_starts_the_next_model_when_the_first_is_slow(breaker):
+    backend = StubBackend(jitter=0, per_model={"m1": {"latency": 1.0}, "m2": {"latency": 0.0}})
+    r = router(backend, breaker)
+    assert r.generate_hedged("prompt", hedge_delay=0.05, max_output_tokens=10, token_budget=20)[1] == "m2"
+    assert r.metrics.snapshot()["m2"]["hedged"] == 1
+
+
+def test_failed_calls_return_their_token_reservation(breaker):
+    backend = StubBackend(latency=0, per_model={"m1": {"error_rate": 1.0}, "m2": {"error_rate": 1.0}})
+    r = router(backend, breaker, models=("m1", "m2", "m3"))
+    # The budget covers one call at a time; each failure frees it for the next model.
+    assert r.generate_hedged("prompt", hedge_delay=5, max_output_tokens=10, token_budget=10)[1] == "m3"
+
+
+def test_unacceptable_answers_stay_charged(breaker):
+    r = router(StubBackend(latency=0), breaker, models=("m1", "m2"))
+    with pytest.raises(AllModelsUnavailable, match="unacceptable"):
+        r.generate_hedged("prompt", hedge_delay=5, max_output_tokens=10, token_budget=10, accept=lambda text: False)
+
+
+def test_closed_stream_is_recorded_and_releases_the_trial(breaker, clock):
+    breaker.failure("m1"); breaker.failure("m1")
+    clock.now += 61
+    r = router(StubBackend(latency=0), breaker)
+    stream = r.generate_stream("a long enough prompt " * 20, max_output_tokens=100)
+    next(stream)
+    assert r.status()["m1"]["trial"]
+    stream.close()  # Streamlit stopped the script mid-answer
+    assert not r.status()["m1"]["trial"]
+    assert breaker.allow("m1")
+    metrics = r.metrics.snapshot()["m1"]
+    assert metrics["calls"] == 1 and metrics["abandoned"] == 1 and metrics["streams"] == 1
@@ -0,0 +1,81 @@
+import smtplib
+import socket
+
+import pytest
+
+from mailer import PERMANENT_ERRORS, PooledMailer, SMTPSettings
+
+controller_mod = pytest.importorskip("aiosmtpd.controller")
+
+
+class Handler:
+    """Accepts mail, except 550 for rejected@x at RCPT and 451 for busy@x at DATA."""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == "rejected@x":
+            return "550 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if "busy@x" in envelope.rcpt_tos:
+            return "451 Try again later"
+        self.received.append(envelope.rcpt_tos[0])
+        return "250 Message accepted"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtpd():
+    handler = Handler()
+    controller = controller_mod.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+@pytest.fixture
+def mailer(smtpd):
+    controller, _ = smtpd
+    m = PooledMailer(SMTPSettings(controller.hostname, controller.port, "proceed@x", None, False), pool_size=1)
+    yield m
+    m.close()
+
+
+def test_batch_goes_over_one_session(mailer, smtpd):
+    assert mailer.send_batch([(f"p{i}@x", "Subject", "Body") for i in range(3)]) == [True, True, True]
+    assert mailer.send("p3@x", "Subject", "Body")
+    assert smtpd[1].received == ["p0@x", "p1@x", "p2@x", "p3@x"]
+    assert mailer.stats["connections"] == 1
+
+
+def test_dropped_idle_session_is_replaced_after_noop(mailer, smtpd):
+    assert mailer.send("a@x", "S", "B")
+    mailer.idle_check_seconds = 0
+    mailer._idle[0].server.close()  # the server hung up while the session sat idle
+    assert mailer.send("b@x", "S", "B")
+    assert mailer.stats == {"connections": 2, "reconnects": 1, "sent": 2, "failed": 0}
+
+
+def test_session_dropped_mid_batch_reconnects_and_resends(mailer, smtpd):
+    assert mailer.send("a@x", "S", "B")
+    mailer._idle[0].server.close()
+    assert mailer.send_batch([("b@x", "S", "B"), ("c@x", "S", "B")]) == [True, True]
+    assert smtpd[1].received == ["a@x", "b@x", "c@x"]
+    assert mailer.stats["reconnects"] == 1
+
+
+def test_rejections_are_split_into_permanent_and_retryable(mailer, smtpd):
+    errors = mailer.deliver([("rejected@x", "S", "B"), ("busy@x", "S", "B"), ("ok@x", "S", "B")])
+    assert isinstance(errors[0], PERMANENT_ERRORS)
+    assert isinstance(errors[1], smtplib.SMTPDataError) and not isinstance(errors[1], PERMANENT_ERRORS)
+    assert errors[2] is None
+    assert smtpd[1].received == ["ok@x"]
@@ -0,0 +1,57 @@
+import db
+from db import three_way_merge
+
+
+def test_dict_changes_from_both_sides_are_kept():
+    assert three_way_merge({"a": 1, "b": 2}, {"a": 5, "b": 2}, {"a": 1, "b": 7}) == {"a": 5, "b": 7}
+
+
+def test_my_deleted_key_stays_deleted():
+    assert three_way_merge({"a": 1, "b": 2}, {"a": 1}, {"a": 1, "b": 2, "c": 3}) == {"a": 1, "c": 3}
+
+
+def test_their_deleted_key_stays_deleted():
+    assert three_way_merge({"a": 1, "b": 2}, {"a": 1, "b": 2, "c": 3}, {"a": 1}) == {"a": 1, "c": 3}
+
+
+def test_same_value_edited_on_both_sides_prefers_mine():
+    assert three_way_merge({"a": 1}, {"a": 2}, {"a": 3}) == {"a": 2}
+
+
+def test_my_removal_keeps_their_append():
+    assert three_way_merge([1, 2, 3], [1, 3], [1, 2, 3, 4]) == [1, 3, 4]
+
+
+def test_their_removal_survives_my_append():
+    assert three_way_merge([1, 2, 3], [1, 2, 3, 5], [1, 3]) == [1, 3, 5]
+
+
+def test_items_with_ids_merge_field_by_field():
+    base = [{"id": "e1", "status": "Upcoming", "owner": "Claimant"}, {"id": "e2", "status": "Upcoming"}]
+    mine = [{"id": "e1", "status": "Done", "owner": "Claimant"}, {"id": "e2", "status": "Upcoming"}]
+    theirs = [{"id": "e1", "status": "Upcoming", "owner": "Both"}]
+    assert three_way_merge(base, mine, theirs) == [{"id": "e1", "status": "Done", "owner": "Both"}]
+
+
+def test_item_i_edited_is_kept_when_they_removed_it():
+    assert three_way_merge([{"id": 1, "v": "a"}], [{"id": 1, "v": "b"}], []) == [{"id": 1, "v": "b"}]
+
+
+def test_repeated_values_are_counted():
+    assert three_way_merge(["x", "x"], ["x"], ["x", "x", "y"]) == ["x", "y"]
+
+
+def test_concurrent_response_saves_are_merged():
+    cid, _ = db.create_new_case("A v B", "c@x", "r@x", "a@x")
+    db.st.session_state["active_case_id"] = cid
+    db.save_responses({"claimant": {"style": "A"}})
+    snap = db._get_snapshot(cid)  # what this session's rerun loaded
+    # Another session saves in between.
+    rev = snap["data"]["revisions"]["responses"]
+    db.db.update(f"arbitrations/{cid}", {"responses.claimant.bifurcation": "B", "revisions.responses": rev + 1})
+    conflicts = db.get_contention_stats()["conflicts"]
+    mine = {"claimant": {"style": "A"}, "respondent": {"style": "B"}}
+    db._versioned_update(snap, "responses", "responses", mine, three_way_merge)
+    saved = db.db.get(f"arbitrations/{cid}").data["responses"]
+    assert saved == {"claimant": {"style": "A", "bifurcation": "B"}, "respondent": {"style": "B"}}
+    assert db.get_contention_stats()["conflicts"] == conflicts + 1
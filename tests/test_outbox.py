@@ -0,0 +1,134 @@
+import time
+
+import pytest
+
+from outbox import RECOVER_INTERVAL_SECONDS, EmailOutbox
+from storage import SQLiteBackend, VersionConflict
+
+
+class Rejected(Exception):
+    pass
+
+
+class Recorder:
+    """deliver() stand-in: returns the queued outcomes, None (sent) once they run out."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.batches = []
+
+    def __call__(self, messages):
+        self.batches.append(messages)
+        return [self.outcomes.pop(0) if self.outcomes else None for _ in messages]
+
+
+@pytest.fixture
+def backend():
+    return SQLiteBackend(":memory:")
+
+
+def make_outbox(backend, deliver, **kwargs):
+    return EmailOutbox(backend, deliver, base_delay=30, max_attempts=3, permanent_errors=(Rejected,), **kwargs)
+
+
+def doc(backend, msg_id):
+    return backend.get(f"email_outbox/{msg_id}").data
+
+
+def test_batch_is_delivered_in_one_call_and_bodies_removed(backend):
+    deliver = Recorder()
+    outbox = make_outbox(backend, deliver)
+    ids = outbox.enqueue([("a@x", "S", "PIN: 123456"), ("b@x", "S", "PIN: 654321")], case_id="C1")
+    assert outbox.drain_once() == 2
+    assert deliver.batches == [[("a@x", "S", "PIN: 123456"), ("b@x", "S", "PIN: 654321")]]
+    for msg_id in ids:
+        data = doc(backend, msg_id)
+        assert data["status"] == "sent"
+        assert "body" not in data
+    assert outbox.drain_once() == 0
+
+
+def test_retryable_error_requeues_with_backoff(backend):
+    outbox = make_outbox(backend, Recorder(OSError("421 try later")))
+    [msg_id] = outbox.enqueue([("a@x", "S", "hello")])
+    before = time.time()
+    outbox.drain_once()
+    data = doc(backend, msg_id)
+    assert data["status"] == "queued"
+    assert data["attempts"] == 1
+    assert data["body"] == "hello"
+    assert before + 30 * 0.8 <= data["next_attempt_at"] <= time.time() + 30 * 1.2
+    assert outbox.drain_once() == 0  # not due yet
+
+
+def test_backoff_doubles_and_is_capped(backend):
+    outbox = make_outbox(backend, Recorder(), max_delay=100)
+    assert 24 <= outbox._backoff(1) <= 36
+    assert 48 <= outbox._backoff(2) <= 72
+    assert 80 <= outbox._backoff(10) <= 120
+
+
+def test_permanent_error_dead_letters_and_body_expires(backend):
+    outbox = make_outbox(backend, Recorder(Rejected("550 no such user")), dead_retention_seconds=60)
+    [msg_id] = outbox.enqueue([("a@x", "S", "PIN: 123456")])
+    outbox.drain_once()
+    data = doc(backend, msg_id)
+    assert data["status"] == "dead"
+    assert data["attempts"] == 1
+    assert data["body"] == "PIN: 123456"
+
+    assert outbox.purge_expired(now=time.time()) == 0
+    assert outbox.purge_expired(now=time.time() + 61) == 1
+    assert "body" not in doc(backend, msg_id)
+    assert outbox.retry(msg_id) is False
+
+
+def test_max_attempts_dead_letters_and_retry_requeues(backend):
+    outbox = make_outbox(backend, Recorder(OSError("busy"), OSError("busy"), OSError("busy")))
+    [msg_id] = outbox.enqueue([("a@x", "S", "hello")])
+    for _ in range(3):
+        backend.update(f"email_outbox/{msg_id}", {"next_attempt_at": 0})
+        outbox.drain_once()
+    assert doc(backend, msg_id)["status"] == "dead"
+
+    assert outbox.retry(msg_id) is True
+    data = doc(backend, msg_id)
+    assert (data["status"], data["attempts"]) == ("queued", 0)
+    assert "purge_after" not in data
+    outbox.drain_once()
+    assert doc(backend, msg_id)["status"] == "sent"
+
+
+def test_claim_is_conditioned_on_version(backend):
+    outbox = make_outbox(backend, Recorder())
+    [msg_id] = outbox.enqueue([("a@x", "S", "hello")])
+    stale = backend.get(f"email_outbox/{msg_id}")
+    outbox.drain_once()
+    with pytest.raises(VersionConflict):
+        backend.update(f"email_outbox/{msg_id}", {"status": "sending"}, expected_version=stale.version)
+
+
+def test_expired_lease_is_requeued(backend):
+    outbox = make_outbox(backend, Recorder(), lease_seconds=60)
+    [stuck, fresh] = outbox.enqueue([("a@x", "S", "1"), ("b@x", "S", "2")])
+    backend.update(f"email_outbox/{stuck}", {"status": "sending", "claimed_at": time.time() - 120})
+    backend.update(f"email_outbox/{fresh}", {"status": "sending", "claimed_at": time.time()})
+    outbox.recover_expired_leases()
+    assert doc(backend, stuck)["status"] == "queued"
+    assert doc(backend, fresh)["status"] == "sending"
+
+
+def test_worker_recovers_leases_on_an_interval(backend):
+    outbox = make_outbox(backend, Recorder(), lease_seconds=60)
+    start = time.time()
+    outbox.maintain(start)  # the first pass runs every job
+    # A worker elsewhere claims a message and dies while this one keeps running.
+    [msg] = outbox.enqueue([("a@x", "S", "1")])
+    backend.update(f"email_outbox/{msg}", {"status": "sending", "claimed_at": start})
+    outbox.maintain(start + 30)
+    assert doc(backend, msg)["status"] == "sending"  # lease still running
+    outbox.maintain(start + RECOVER_INTERVAL_SECONDS + 61)
+    assert doc(backend, msg)["status"] == "queued"
+    assert outbox.stats()["recovered"] == 1
+    outbox.drain_once()
+    assert doc(backend, msg)["status"] == "sent"